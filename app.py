@@ -1,22 +1,41 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, render_template, request, jsonify, send_from_directory, Response, stream_with_context, g
 from flask_cors import CORS
 import os
 import json
 import base64
+import uuid
+import itertools
 from werkzeug.utils import secure_filename
-import PyPDF2
 import io
 import logging
 from datetime import datetime
 import ssl
 import ipaddress
-import markdown
+import threading
 
 # Import existing modules
-from chat import chat
-from medical_docs import medical_docs
-from meeting_minutes import meeting_minutes
+from chat import chat, chat_stream
+from medical_docs import medical_docs, medical_docs_stream, DocumentNotFound
+from meeting_minutes import meeting_minutes, meeting_minutes_stream, update_meeting_minutes
 from generate import generate_response
+from batch import run_batch, BATCH_MAX_ITEMS
+from pdf import extract_pages_cached, join_pages
+from retrieval import index_document, get_index_stats
+from document_store import put_document, get_document_info, delete_document, get_store_stats
+from chat_sessions import get_session_info, delete_session, get_session_stats
+from scheduler import SchedulerRejected, get_scheduler_stats
+from compression import negotiate_encoding, compress, StreamCompressor, COMPRESSIBLE_TYPES, RESPONSE_COMPRESSION_MIN_BYTES
+from markdown_render import render_markdown, StreamRenderer, get_render_stats, load_markdown, MARKDOWN_STREAM_HTML
+from transcription import transcribe_audio as transcribe_recording
+from model_backends import get_backend_health, MODEL_TRANSCRIPTION_TIMEOUT
+from live_transcription import (start_session, get_session as get_live_session, add_chunk, finish_session, get_live_stats,
+                                LiveTranscriptionError)
+from jobs import submit_job, get_job, cancel_job, get_job_stats, JobQueueFull, QUEUED, RUNNING, FINISHED_STATES
+from metrics import (stage, begin_request, end_request, server_timing_header, register_gauge, render_metrics,
+                     add_load_time, get_load_times)
 
 app = Flask(__name__)
 
@@ -29,10 +48,12 @@ except ImportError:
     pass  # Ignore if not available
 
 # Configure CORS properly
+CORS_ORIGINS = ["http://localhost:5000", "http://127.0.0.1:5000", "http://192.168.10.119:5000", 
+                "https://localhost:5000", "https://127.0.0.1:5000", "https://192.168.10.119:5000"]
+
 CORS(app, resources={
     r"/api/*": {
-        "origins": ["http://localhost:5000", "http://127.0.0.1:5000", "http://192.168.10.119:5000", 
-                   "https://localhost:5000", "https://127.0.0.1:5000", "https://192.168.10.119:5000"],
+        "origins": CORS_ORIGINS,
         "methods": ["GET", "POST", "OPTIONS"],
         "allow_headers": ["Content-Type", "Authorization"]
     }
@@ -47,14 +68,47 @@ UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'pdf', 'txt', 'doc', 'docx'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 16)) * 1024 * 1024  # 16MB max file size by default
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# TLS certificate and key used for HTTPS; a self-signed pair is generated only if these are missing or unusable
+TLS_CERT_PATH = os.environ.get("TLS_CERT_PATH", "cert.pem")
+TLS_KEY_PATH = os.environ.get("TLS_KEY_PATH", "key.pem")
+
+# Load the model SDK, tokenizers and renderers in a background thread after startup
+APP_PRELOAD = os.environ.get("APP_PRELOAD", "0").lower() in ("1", "true", "yes")
+
+def certificate_is_usable(cert_path, key_path):
+    """Whether cert_path and key_path hold a matching certificate and key that are not about to expire"""
+    if not (os.path.exists(cert_path) and os.path.exists(key_path)):
+        return False
+    try:
+        # Fails if either file is unreadable or the key does not belong to the certificate
+        ssl.create_default_context(ssl.Purpose.CLIENT_AUTH).load_cert_chain(cert_path, key_path)
+    except (ssl.SSLError, OSError) as e:
+        logger.warning(f"Ignoring unusable certificate {cert_path}: {e}")
+        return False
+    try:
+        from cryptography import x509
+        from datetime import timedelta
+        with open(cert_path, "rb") as f:
+            cert = x509.load_pem_x509_certificate(f.read())
+        if cert.not_valid_after <= datetime.utcnow() + timedelta(days=1):
+            logger.info(f"Certificate {cert_path} has expired; generating a new one")
+            return False
+    except ImportError:
+        pass  # Without cryptography the expiry cannot be checked; the certificate still loaded
+    return True
+
 # SSL Context for HTTPS
 def create_ssl_context():
-    """Create SSL context for HTTPS support"""
+    """Create SSL context for HTTPS support, reusing an existing certificate and key when possible"""
+    if certificate_is_usable(TLS_CERT_PATH, TLS_KEY_PATH):
+        logger.info(f"Reusing TLS certificate {TLS_CERT_PATH}")
+        return TLS_CERT_PATH, TLS_KEY_PATH
+    
     try:
         # Create self-signed certificate for development
         from cryptography import x509
@@ -99,13 +153,14 @@ def create_ssl_context():
         ).sign(private_key, hashes.SHA256())
         
         # Save certificate and key
-        cert_path = "cert.pem"
-        key_path = "key.pem"
+        cert_path = TLS_CERT_PATH
+        key_path = TLS_KEY_PATH
         
         with open(cert_path, "wb") as f:
             f.write(cert.public_bytes(serialization.Encoding.PEM))
         
-        with open(key_path, "wb") as f:
+        # The key is kept for reuse, so keep it private to this user
+        with open(os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
             f.write(private_key.private_bytes(
                 encoding=serialization.Encoding.PEM,
                 format=serialization.PrivateFormat.PKCS8,
@@ -124,17 +179,119 @@ def create_ssl_context():
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_pdf(pdf_file):
-    """Extract text from uploaded PDF file"""
+def extract_pages_from_pdf(pdf_file):
+    """Extract the text of each page of an uploaded PDF file (a file-like object or bytes), or None if it cannot be read"""
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        data = pdf_file if isinstance(pdf_file, bytes) else pdf_file.read()
+        with stage("pdf_extract"):
+            return extract_pages_cached(data)
     except Exception as e:
         logger.error(f"Error extracting PDF text: {str(e)}")
-        return f"Error extracting text: {str(e)}"
+        return None
+
+def parse_fields(value):
+    """Set of top-level fields requested with ?fields=a,b, or None for all fields"""
+    if not value:
+        return None
+    return {field.strip() for field in value.split(',') if field.strip()}
+
+def requested_fields():
+    return parse_fields(request.args.get('fields'))
+
+def select_fields(payload, fields):
+    """Keep only the requested fields of a JSON payload; errors are always kept"""
+    if fields is None or not isinstance(payload, dict):
+        return payload
+    return {key: value for key, value in payload.items() if key in fields or key == 'error'}
+
+def build_response_payload(response_data, content_key='response', html_key='response_html', fields=None):
+    """
+    JSON payload returned for a generated chat response or meeting minutes
+
+    fields optionally limits the payload to those top-level keys; the HTML
+    is not rendered at all when it is not among them.
+    """
+    response_markdown = response_data['content']
+    
+    # Convert markdown to HTML with table support
+    response_html = None
+    if fields is None or html_key in fields:
+        with stage("markdown"):
+            response_html = render_markdown(response_markdown)
+    
+    payload = {
+        content_key: response_markdown,  # Raw markdown for copying/downloading
+        html_key: response_html,  # HTML for display
+        'token_usage': response_data['token_usage'],  # Token usage information
+        'cost_data': response_data.get('cost_data', {}),  # Cost breakdown
+        'commercial_costs': response_data.get('commercial_costs', {}),  # Commercial API comparisons
+        'cumulative_cost': response_data.get('cumulative_cost', 0.0),  # Total cost so far
+        'cached': response_data.get('cached', False),  # Served from the response cache
+        'queue_wait_ms': response_data.get('queue_wait_ms', 0.0)  # Time spent waiting for a model slot
+    }
+    if 'session_id' in response_data:
+        payload['session_id'] = response_data['session_id']  # Conversation to continue on the next turn
+        payload['session_restarted'] = response_data['session_restarted']  # Requested session had expired
+    return select_fields(payload, fields)
+
+def build_minutes_payload(response_data, fields=None):
+    """JSON payload returned for generated meeting minutes"""
+    return build_response_payload(response_data, 'minutes', 'minutes_html', fields)
+
+def sse_event(event, data):
+    """Format a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def delta_payload(event, renderer):
+    """
+    Data of a streamed `delta` event
+
+    With MARKDOWN_STREAM_HTML, `html` is the rendering of blocks finished by
+    this delta, to append to the HTML shown so far, and `html_tail` the
+    rendering of the unfinished last block, replacing the previous tail
+    (omitted if it was rendered less than MARKDOWN_STREAM_INTERVAL_MS ago).
+    """
+    data = {'content': event['content']}
+    if renderer is not None:
+        with stage("markdown"):
+            html, html_tail = renderer.feed(event['content'])
+        data['html'] = html
+        if html_tail is not None:
+            data['html_tail'] = html_tail
+    return data
+
+def sse_response(events, content_key, html_key):
+    """
+    Relay events from generate_response_stream as Server-Sent Events
+
+    Markdown deltas are sent as `delta` events as soon as they arrive, with
+    their incremental HTML rendering. The final `done` event carries the full
+    markdown, its HTML rendering and the token usage/cost fields returned by
+    the non-streaming endpoints.
+    """
+    fields = requested_fields()
+    # Start the stream before sending headers, so admission control rejections
+    # are returned as 429/503 responses rather than as an SSE error event
+    events = iter(events)
+    first_event = next(events)
+    
+    def generate():
+        renderer = StreamRenderer() if MARKDOWN_STREAM_HTML else None
+        try:
+            for event in itertools.chain([first_event], events):
+                if event['type'] == 'delta':
+                    yield sse_event('delta', delta_payload(event, renderer))
+                    continue
+                
+                yield sse_event('done', build_response_payload(event, content_key, html_key, fields))
+        except Exception as e:
+            logger.error(f"Error while streaming response: {str(e)}")
+            yield sse_event('error', {'error': f'Internal server error: {str(e)}'})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @app.route('/')
 def index():
@@ -156,14 +313,104 @@ def meeting_minutes_page():
 def translate_page():
     return render_template('translate.html')
 
+# Request metrics: latency and status per endpoint, plus per-stage timings
+@app.before_request
+def start_request_metrics():
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_start = begin_request(g.metrics_endpoint)
+
+@app.after_request
+def finish_request_metrics(response):
+    start = g.get('metrics_start')
+    if start is not None:
+        # Streamed responses are measured up to their headers; their stages are still recorded as they run
+        end_request(g.metrics_endpoint, response.status_code, start)
+        timing = server_timing_header()
+        if timing:
+            response.headers['Server-Timing'] = timing
+    return response
+
+@app.after_request
+def negotiate_response(response):
+    """Apply ?fields= to JSON responses and compress them as negotiated with Accept-Encoding"""
+    if response.mimetype not in COMPRESSIBLE_TYPES or response.is_streamed or response.direct_passthrough:
+        return response
+    
+    fields = requested_fields()
+    if fields is not None and response.mimetype == 'application/json':
+        payload = response.get_json(silent=True)
+        if isinstance(payload, dict):
+            response.set_data(json.dumps(select_fields(payload, fields)))
+    
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if encoding and len(body) >= RESPONSE_COMPRESSION_MIN_BYTES and 'Content-Encoding' not in response.headers:
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def ndjson_response(records):
+    """Stream records as newline-delimited JSON, compressed as negotiated with Accept-Encoding"""
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    
+    def generate():
+        compressor = StreamCompressor(encoding) if encoding else None
+        for record in records:
+            line = (json.dumps(record) + "\n").encode('utf-8')
+            yield compressor.compress(line) if compressor else line
+        if compressor:
+            yield compressor.finish()
+    
+    headers = {'Vary': 'Accept-Encoding', 'X-Accel-Buffering': 'no'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=headers)
+
+def wants_ndjson():
+    return (request.args.get('format') == 'ndjson' or
+            request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson')
+
+register_gauge('scheduler_in_flight', 'Model calls holding a slot',
+               lambda: [({}, get_scheduler_stats()['in_flight'])])
+register_gauge('scheduler_queued', 'Model calls waiting for a slot, by priority class',
+               lambda: [({'priority': name}, stats['queued'])
+                        for name, stats in get_scheduler_stats()['classes'].items()])
+register_gauge('backend_outstanding', 'Model calls outstanding on each model server replica',
+               lambda: [({'backend': backend['base_url']}, backend['outstanding'])
+                        for backend in get_backend_health()['backends']])
+register_gauge('backend_up', 'Whether each model server replica is in rotation (1) or ejected (0)',
+               lambda: [({'backend': backend['base_url']}, int(backend['state'] != 'open'))
+                        for backend in get_backend_health()['backends']])
+register_gauge('chat_sessions', 'Active chat sessions', lambda: [({}, get_session_stats()['sessions'])])
+register_gauge('chat_session_memory_bytes', 'Conversation text held by chat sessions',
+               lambda: [({}, get_session_stats()['memory_bytes'])])
+register_gauge('live_transcription_sessions', 'Live transcription sessions still recording',
+               lambda: [({}, get_live_stats()['recording'])])
+register_gauge('live_transcription_pending_segments', 'Segments of live recordings waiting for transcription',
+               lambda: [({}, get_live_stats()['pending_segments'])])
+register_gauge('jobs', 'Background jobs by status',
+               lambda: [({'status': status}, count) for status, count in get_job_stats().items()
+                        if status in (QUEUED, RUNNING) + FINISHED_STATES])
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latency histograms, counters and gauges in Prometheus text format"""
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # Health check endpoint
 @app.route('/api/health', methods=['GET'])
 def health_check():
+    model_backends = get_backend_health()
     return jsonify({
-        'status': 'healthy',
+        # Degraded while every model server replica is ejected by its circuit breaker
+        'status': 'healthy' if model_backends['available'] else 'degraded',
         'timestamp': datetime.now().isoformat(),
         'server': 'Flask Healthcare Platform',
-        'protocol': request.scheme
+        'protocol': request.scheme,
+        'model_backends': model_backends,
+        # Seconds spent importing the app and loading deferred modules and resources so far
+        'startup': get_load_times()
     })
 
 # API Endpoints
@@ -183,37 +430,57 @@ def api_chat():
             return jsonify({'error': 'No JSON data provided'}), 400
             
         user_message = data.get('message', '')
+        session_id = data.get('session_id')
         
         if not user_message:
             return jsonify({'error': 'No message provided'}), 400
         
         logger.info(f"Processing chat message: {user_message[:50]}...")
         
-        response_data = chat(user_message)
-        response_markdown = response_data['content']
-        token_usage = response_data['token_usage']
-        cost_data = response_data.get('cost_data', {})
-        cumulative_cost = response_data.get('cumulative_cost', 0.0)
-        commercial_costs = response_data.get('commercial_costs', {})
-        
-        # Convert markdown to HTML with table support
-        md = markdown.Markdown(extensions=['tables', 'fenced_code', 'nl2br'])
-        response_html = md.convert(response_markdown)
+        response_data = chat(user_message, session_id)
         
         logger.info("Chat response generated successfully")
-        return jsonify({
-            'response': response_markdown,  # Raw markdown for copying
-            'response_html': response_html,  # HTML for display
-            'token_usage': token_usage,  # Token usage information
-            'cost_data': cost_data,  # Cost breakdown
-            'commercial_costs': commercial_costs,  # Commercial API comparisons
-            'cumulative_cost': cumulative_cost  # Total cost so far
-        })
+        return jsonify(build_response_payload(response_data, fields=requested_fields()))
     
+    except SchedulerRejected as e:
+        logger.warning(f"Chat API request rejected: {str(e)}")
+        return jsonify({'error': str(e)}), e.status_code
     except Exception as e:
         logger.error(f"Error in chat API: {str(e)}")
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+@app.route('/api/chat/stream', methods=['POST', 'OPTIONS'])
+def api_chat_stream():
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+        
+    try:
+        logger.info(f"Chat stream API called at {datetime.now()}")
+        
+        if not request.is_json:
+            return jsonify({'error': 'Content-Type must be application/json'}), 400
+            
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+            
+        user_message = data.get('message', '')
+        session_id = data.get('session_id')
+        
+        if not user_message:
+            return jsonify({'error': 'No message provided'}), 400
+        
+        logger.info(f"Streaming chat message: {user_message[:50]}...")
+        
+        return sse_response(chat_stream(user_message, session_id), 'response', 'response_html')
+    
+    except SchedulerRejected as e:
+        logger.warning(f"Chat stream API request rejected: {str(e)}")
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"Error in chat stream API: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
 @app.route('/api/medical-chat', methods=['POST', 'OPTIONS'])
 def api_medical_chat():
     if request.method == 'OPTIONS':
@@ -231,37 +498,92 @@ def api_medical_chat():
             
         user_message = data.get('message', '')
         medical_history = data.get('medical_history', '')
+        document_id = data.get('document_id')
+        session_id = data.get('session_id')
         
         if not user_message:
             return jsonify({'error': 'No message provided'}), 400
         
         logger.info(f"Processing medical chat message: {user_message[:50]}...")
         
-        response_data = medical_docs(user_message, medical_history)
-        response_markdown = response_data['content']
-        token_usage = response_data['token_usage']
-        cost_data = response_data.get('cost_data', {})
-        cumulative_cost = response_data.get('cumulative_cost', 0.0)
-        commercial_costs = response_data.get('commercial_costs', {})
-        
-        # Convert markdown to HTML with table support
-        md = markdown.Markdown(extensions=['tables', 'fenced_code', 'nl2br'])
-        response_html = md.convert(response_markdown)
+        try:
+            response_data = medical_docs(user_message, medical_history, document_id, session_id)
+        except DocumentNotFound as e:
+            return jsonify({'error': str(e)}), e.status_code
         
         logger.info("Medical chat response generated successfully")
-        return jsonify({
-            'response': response_markdown,  # Raw markdown for copying
-            'response_html': response_html,  # HTML for display
-            'token_usage': token_usage,  # Token usage information
-            'cost_data': cost_data,  # Cost breakdown
-            'commercial_costs': commercial_costs,  # Commercial API comparisons
-            'cumulative_cost': cumulative_cost  # Total cost so far
-        })
+        return jsonify(build_response_payload(response_data, fields=requested_fields()))
     
+    except SchedulerRejected as e:
+        logger.warning(f"Medical chat API request rejected: {str(e)}")
+        return jsonify({'error': str(e)}), e.status_code
     except Exception as e:
         logger.error(f"Error in medical chat API: {str(e)}")
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+@app.route('/api/medical-chat/stream', methods=['POST', 'OPTIONS'])
+def api_medical_chat_stream():
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+        
+    try:
+        logger.info(f"Medical chat stream API called at {datetime.now()}")
+        
+        if not request.is_json:
+            return jsonify({'error': 'Content-Type must be application/json'}), 400
+            
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+            
+        user_message = data.get('message', '')
+        medical_history = data.get('medical_history', '')
+        document_id = data.get('document_id')
+        session_id = data.get('session_id')
+        
+        if not user_message:
+            return jsonify({'error': 'No message provided'}), 400
+        
+        logger.info(f"Streaming medical chat message: {user_message[:50]}...")
+        
+        try:
+            events = medical_docs_stream(user_message, medical_history, document_id, session_id)
+        except DocumentNotFound as e:
+            return jsonify({'error': str(e)}), e.status_code
+        
+        return sse_response(events, 'response', 'response_html')
+    
+    except SchedulerRejected as e:
+        logger.warning(f"Medical chat stream API request rejected: {str(e)}")
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"Error in medical chat stream API: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@app.route('/api/chat/sessions', methods=['GET'])
+def chat_session_stats():
+    """Get chat session counts and memory usage"""
+    return jsonify(get_session_stats())
+
+@app.route('/api/chat/sessions/<session_id>', methods=['GET'])
+def chat_session_info(session_id):
+    """Get the state of a chat session, including its running summary"""
+    info = get_session_info(session_id)
+    if info is None:
+        return jsonify({'error': 'Chat session not found or expired'}), 404
+    return jsonify(info)
+
+@app.route('/api/chat/sessions/<session_id>/delete', methods=['POST', 'OPTIONS'])
+def chat_session_delete(session_id):
+    """End a chat session and forget its history"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    if not delete_session(session_id):
+        return jsonify({'error': 'Chat session not found or expired'}), 404
+    logger.info(f"Chat session deleted: {session_id}")
+    return jsonify({'message': 'Chat session deleted successfully'})
+
 @app.route('/api/upload-medical-record', methods=['POST', 'OPTIONS'])
 def upload_medical_record():
     if request.method == 'OPTIONS':
@@ -279,21 +601,35 @@ def upload_medical_record():
         
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
             
-            logger.info(f"File saved: {file_path}")
+            # Extract text from PDF straight from the uploaded stream
+            pages = extract_pages_from_pdf(file.stream)
+            if pages is None:
+                # Nothing is stored or indexed for a file that could not be read
+                return jsonify({'error': 'Could not extract text from the PDF file'}), 400
+            extracted_text = join_pages(pages)
             
-            # Extract text from PDF
-            with open(file_path, 'rb') as pdf_file:
-                extracted_text = extract_text_from_pdf(pdf_file)
+            # Keep the record server-side so clients send its handle instead of the text,
+            # and index it so medical chat can send only relevant passages
+            document_id = put_document(extracted_text, filename)
+            with stage("index"):
+                index_document(extracted_text, document_id)
             
             logger.info("Medical record processed successfully")
-            return jsonify({
+            summary = {
                 'message': 'File uploaded successfully',
                 'filename': filename,
-                'extracted_text': extracted_text
-            })
+                'document_id': document_id,
+                'pages': len(pages),
+                'preview': extracted_text[:200]
+            }
+            if wants_ndjson():
+                # A summary line, then one line per page, each readable as soon as it arrives
+                records = itertools.chain([{'type': 'document', **summary}],
+                                          ({'type': 'page', 'page': number, 'text': text}
+                                           for number, text in enumerate(pages, start=1)))
+                return ndjson_response(records)
+            return jsonify(summary)
         
         return jsonify({'error': 'Invalid file type'}), 400
     
@@ -324,30 +660,163 @@ def api_generate_meeting_minutes():
         logger.info(f"Processing meeting minutes for transcript: {len(transcript)} characters")
         
         response_data = meeting_minutes(transcript)
-        minutes_markdown = response_data['content']
-        token_usage = response_data['token_usage']
-        cost_data = response_data.get('cost_data', {})
-        cumulative_cost = response_data.get('cumulative_cost', 0.0)
-        commercial_costs = response_data.get('commercial_costs', {})
-        
-        # Convert markdown to HTML with table support
-        md = markdown.Markdown(extensions=['tables', 'fenced_code', 'nl2br'])
-        minutes_html = md.convert(minutes_markdown)
         
         logger.info("Meeting minutes generated successfully")
-        return jsonify({
-            'minutes': minutes_markdown,  # Raw markdown for copying/downloading
-            'minutes_html': minutes_html,  # HTML for display
-            'token_usage': token_usage,  # Token usage information
-            'cost_data': cost_data,  # Cost breakdown
-            'commercial_costs': commercial_costs,  # Commercial API comparisons
-            'cumulative_cost': cumulative_cost  # Total cost so far
-        })
+        return jsonify(build_minutes_payload(response_data, requested_fields()))
     
+    except SchedulerRejected as e:
+        logger.warning(f"Meeting minutes API request rejected: {str(e)}")
+        return jsonify({'error': str(e)}), e.status_code
     except Exception as e:
         logger.error(f"Error in meeting minutes API: {str(e)}")
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+@app.route('/api/documents', methods=['GET'])
+def document_stats():
+    """Get document store and retrieval index usage"""
+    stats = get_store_stats()
+    stats['index'] = get_index_stats()
+    return jsonify(stats)
+
+@app.route('/api/documents/<document_id>', methods=['GET'])
+def document_info(document_id):
+    """Get metadata for a stored medical record"""
+    info = get_document_info(document_id)
+    if info is None:
+        return jsonify({'error': 'Medical record not found'}), 404
+    return jsonify(info)
+
+@app.route('/api/documents/<document_id>/delete', methods=['POST', 'OPTIONS'])
+def document_delete(document_id):
+    """Delete a stored medical record"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    # Deleting the record also drops its retrieval index
+    if not delete_document(document_id):
+        return jsonify({'error': 'Medical record not found'}), 404
+    logger.info(f"Medical record deleted: {document_id}")
+    return jsonify({'message': 'Medical record deleted successfully'})
+
+@app.route('/api/generate-meeting-minutes/stream', methods=['POST', 'OPTIONS'])
+def api_generate_meeting_minutes_stream():
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+        
+    try:
+        logger.info(f"Meeting minutes stream API called at {datetime.now()}")
+        
+        if not request.is_json:
+            return jsonify({'error': 'Content-Type must be application/json'}), 400
+            
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+            
+        transcript = data.get('transcript', '')
+        
+        if not transcript:
+            return jsonify({'error': 'No transcript provided'}), 400
+        
+        logger.info(f"Streaming meeting minutes for transcript: {len(transcript)} characters")
+        
+        return sse_response(meeting_minutes_stream(transcript), 'minutes', 'minutes_html')
+    
+    except SchedulerRejected as e:
+        logger.warning(f"Meeting minutes stream API request rejected: {str(e)}")
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"Error in meeting minutes stream API: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@app.route('/api/generate-meeting-minutes/incremental', methods=['POST', 'OPTIONS'])
+def api_update_meeting_minutes():
+    """
+    Update the minutes of a meeting in progress from the transcript added since the last update
+
+    Accepts either a live transcription 'session_id', whose transcript is
+    used, or a 'transcript' so far together with the 'meeting_id' returned by
+    the previous update.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+        
+    try:
+        logger.info(f"Incremental meeting minutes API called at {datetime.now()}")
+        
+        if not request.is_json:
+            return jsonify({'error': 'Content-Type must be application/json'}), 400
+            
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+        
+        session_id = data.get('session_id')
+        if session_id:
+            session = get_live_session(session_id)
+            if session is None:
+                return jsonify({'error': 'Live transcription session not found or expired'}), 404
+            meeting_id = session_id
+            transcript = session.to_dict()['transcript']
+        else:
+            meeting_id = data.get('meeting_id') or uuid.uuid4().hex
+            transcript = data.get('transcript', '')
+            if not transcript:
+                return jsonify({'error': 'No transcript provided'}), 400
+        
+        response_data = update_meeting_minutes(meeting_id, transcript)
+        logger.info(f"Meeting minutes {meeting_id} updated with {response_data['new_words']} new words "
+                    f"in {response_data['model_calls']} model calls")
+        
+        payload = build_minutes_payload(response_data)
+        payload.update({
+            'meeting_id': meeting_id,
+            'processed_words': response_data['processed_words'],
+            'new_words': response_data['new_words']
+        })
+        if response_data.get('warning'):
+            logger.warning(f"Meeting minutes {meeting_id}: {response_data['warning']}")
+            payload['warning'] = response_data['warning']
+        return jsonify(select_fields(payload, requested_fields()))
+    
+    except SchedulerRejected as e:
+        logger.warning(f"Incremental meeting minutes API request rejected: {str(e)}")
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"Error in incremental meeting minutes API: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+def remove_file_quietly(file_path):
+    if os.path.exists(file_path):
+        try:
+            os.remove(file_path)
+        except:
+            pass  # Ignore cleanup errors
+
+def transcribe_audio_file(file_path, on_progress=None):
+    """
+    Transcribe an audio file with Whisper
+
+    Returns:
+        dict: 'transcript', 'segments' and 'audio' as returned by transcription.transcribe_audio
+    """
+    with open(file_path, "rb") as audio_file_handle:
+        audio_bytes = audio_file_handle.read()
+    
+    try:
+        # Speech recognition by Whisper, segment by segment in parallel
+        result = transcribe_recording(audio_bytes, os.path.basename(file_path), on_progress)
+        logger.info("Transcription successful with Whisper API")
+    except Exception as transcription_error:
+        logger.error(f"Transcription failed: {transcription_error}")
+        raise Exception(f"Speech recognition failed: {str(transcription_error)}")
+    
+    audio_info = result['audio']
+    if audio_info['preprocessed']:
+        logger.info(f"Audio preprocessed: {audio_info['original_seconds']}s -> {audio_info['processed_seconds']}s "
+                    f"in {audio_info['segments']} segments, {audio_info['original_bytes']} -> {audio_info['processed_bytes']} bytes")
+    return result
+
 @app.route('/api/transcribe-audio', methods=['POST', 'OPTIONS'])
 def transcribe_audio():
     if request.method == 'OPTIONS':
@@ -363,65 +832,356 @@ def transcribe_audio():
         if audio_file.filename == '':
             return jsonify({'error': 'No audio file selected'}), 400
         
-        # Save audio file temporarily with a safe name
+        # Save audio file temporarily with a safe name, unique across concurrent uploads
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"recording_{timestamp}.wav"
+        filename = f"recording_{timestamp}_{uuid.uuid4().hex[:8]}.wav"
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         
         audio_file.save(file_path)
         logger.info(f"Audio file saved: {file_path}")
         
-        # Initialize OpenAI client for Whisper API
-        from openai import OpenAI 
-        client = OpenAI(api_key="dpais", base_url="http://localhost:8553/v1/openai")
-
         try:
-            # Speech recognition by Whisper
-            with open(file_path, "rb") as audio_file_handle:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper",
-                    file=audio_file_handle
-                )
-            logger.info("Transcription successful with Whisper API")
-        except Exception as transcription_error:
-            logger.error(f"Transcription failed: {transcription_error}")
-            raise Exception(f"Speech recognition failed: {str(transcription_error)}")
-        
-        # Clean up temporary file
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass  # Ignore cleanup errors
+            result = transcribe_audio_file(file_path)
+        finally:
+            # Clean up temporary file
+            remove_file_quietly(file_path)
         
-        if hasattr(transcript, 'text'):
-            transcript_text = transcript.text
-        else:
-            transcript_text = str(transcript)
-            
-        if transcript_text:
+        if result['transcript']:
             logger.info("Audio transcription completed successfully")
-            return jsonify({'transcript': transcript_text})
+            return jsonify(result)
         else:
             raise Exception("Failed to transcribe audio - no transcript generated")
     
     except Exception as e:
         logger.error(f"Error in audio transcription: {str(e)}")
-        # Clean up any remaining files
-        try:
-            import glob
-            for file in glob.glob(os.path.join(app.config['UPLOAD_FOLDER'], 'recording_*.wav')):
-                os.remove(file)
-        except:
-            pass
+        # The temporary file is removed by the finally block above
         return jsonify({'error': f'Audio transcription failed: {str(e)}'}), 500
 
+@app.route('/api/batch', methods=['POST', 'OPTIONS'])
+def api_batch():
+    """
+    Run a batch of chat, medical and meeting minutes items
+    
+    Results are streamed as newline-delimited JSON in the order the items
+    complete, followed by a summary line; ?format=json returns them all at
+    once, in item order.
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    try:
+        logger.info(f"Batch API called at {datetime.now()}")
+        
+        if not request.is_json:
+            return jsonify({'error': 'Content-Type must be application/json'}), 400
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+        
+        items = data.get('items')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'No items provided'}), 400
+        if len(items) > BATCH_MAX_ITEMS:
+            return jsonify({'error': f'Too many items ({len(items)}); the limit is {BATCH_MAX_ITEMS}'}), 413
+        
+        logger.info(f"Processing batch of {len(items)} items")
+        
+        if request.args.get('format') != 'json':
+            return ndjson_response(run_batch(items))
+        
+        results = [None] * len(items)
+        summary = None
+        for record in run_batch(items):
+            if record['type'] == 'summary':
+                summary = record
+            else:
+                results[record['index']] = record
+        return jsonify({'results': results, 'summary': summary})
+    
+    except Exception as e:
+        logger.error(f"Error in batch API: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+# Background jobs
+def run_transcription_job(job, file_path):
+    job.update(progress=0.05, message="Transcribing audio")
+    
+    def on_progress(completed, total):
+        job.update(progress=0.05 + 0.9 * completed / total, message=f"Transcribed segment {completed} of {total}")
+    
+    result = transcribe_audio_file(file_path, on_progress)
+    if not result['transcript']:
+        raise Exception("Failed to transcribe audio - no transcript generated")
+    return result
+
+def run_meeting_minutes_job(job, transcript):
+    job.update(progress=0.05, message="Generating meeting minutes")
+    
+    def on_progress(completed, total):
+        # Chunk summaries make up most of the work; the final merge pass is the rest
+        job.update(progress=0.05 + 0.85 * completed / total, message=f"Summarised part {completed} of {total}")
+    
+    response_data = meeting_minutes(transcript, on_progress=on_progress)
+    job.update(progress=0.95, message="Rendering meeting minutes")
+    return build_minutes_payload(response_data)
+
+def job_accepted(job):
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/api/jobs/{job.id}',
+        'events_url': f'/api/jobs/{job.id}/events'
+    }), 202
+
+@app.route('/api/jobs/transcribe-audio', methods=['POST', 'OPTIONS'])
+def submit_transcription_job():
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+        
+    try:
+        logger.info(f"Transcription job submitted at {datetime.now()}")
+        
+        if 'audio' not in request.files:
+            return jsonify({'error': 'No audio file provided'}), 400
+        
+        audio_file = request.files['audio']
+        if audio_file.filename == '':
+            return jsonify({'error': 'No audio file selected'}), 400
+        
+        # The upload stream closes with the request, so the job reads from a saved copy
+        file_path = os.path.join(app.config['UPLOAD_FOLDER'], f"job_{uuid.uuid4().hex}.wav")
+        audio_file.save(file_path)
+        
+        try:
+            job = submit_job('transcribe-audio', run_transcription_job, file_path,
+                             on_finish=lambda: remove_file_quietly(file_path))
+        except JobQueueFull:
+            remove_file_quietly(file_path)
+            raise
+        
+        logger.info(f"Transcription job queued: {job.id}")
+        return job_accepted(job)
+    
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error submitting transcription job: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@app.route('/api/jobs/generate-meeting-minutes', methods=['POST', 'OPTIONS'])
+def submit_meeting_minutes_job():
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+        
+    try:
+        logger.info(f"Meeting minutes job submitted at {datetime.now()}")
+        
+        if not request.is_json:
+            return jsonify({'error': 'Content-Type must be application/json'}), 400
+            
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+            
+        transcript = data.get('transcript', '')
+        
+        if not transcript:
+            return jsonify({'error': 'No transcript provided'}), 400
+        
+        job = submit_job('generate-meeting-minutes', run_meeting_minutes_job, transcript)
+        
+        logger.info(f"Meeting minutes job queued: {job.id}")
+        return job_accepted(job)
+    
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        logger.error(f"Error submitting meeting minutes job: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@app.route('/api/jobs', methods=['GET'])
+def job_stats():
+    """Get background job counts"""
+    return jsonify(get_job_stats())
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Get the status of a background job, and its result once completed"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream the progress of a background job as Server-Sent Events"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    
+    def generate():
+        version = -1
+        while True:
+            current = job.wait_for_change(version, timeout=15)
+            if current == version:
+                # Keep idle connections open through proxies
+                yield ": keep-alive\n\n"
+                continue
+            version = current
+            if job.status in FINISHED_STATES:
+                yield sse_event(job.status, job.to_dict())
+                return
+            yield sse_event('progress', job.to_dict(include_result=False))
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST', 'OPTIONS'])
+def job_cancel(job_id):
+    """Cancel a queued or running background job"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    job = cancel_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    logger.info(f"Cancellation requested for job {job_id}")
+    return jsonify(job.to_dict(include_result=False))
+
+# Live transcription: the browser uploads audio while recording and the transcript builds up as it goes
+def live_session_urls(session):
+    return {
+        'session_id': session.id,
+        'chunks_url': f'/api/live-transcription/{session.id}/chunks',
+        'events_url': f'/api/live-transcription/{session.id}/events',
+        'finish_url': f'/api/live-transcription/{session.id}/finish'
+    }
+
+@app.route('/api/live-transcription', methods=['GET', 'POST', 'OPTIONS'])
+def live_transcription_start():
+    """Start a live transcription session (POST), or get live session counts (GET)"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    if request.method == 'GET':
+        return jsonify(get_live_stats())
+    
+    try:
+        logger.info(f"Live transcription session started at {datetime.now()}")
+        session = start_session()
+        return jsonify(live_session_urls(session)), 201
+    except LiveTranscriptionError as e:
+        logger.warning(f"Live transcription session rejected: {str(e)}")
+        return jsonify({'error': str(e)}), e.status_code
+
+@app.route('/api/live-transcription/<session_id>/chunks', methods=['POST', 'OPTIONS'])
+def live_transcription_chunk(session_id):
+    """Append the next chunk of audio (WAV, form field 'audio', chunk number in 'seq') to a live session"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    try:
+        session = get_live_session(session_id)
+        if session is None:
+            return jsonify({'error': 'Live transcription session not found or expired'}), 404
+        if 'audio' not in request.files:
+            return jsonify({'error': 'No audio file provided'}), 400
+        try:
+            seq = int(request.form.get('seq', ''))
+        except ValueError:
+            return jsonify({'error': 'Chunk number (seq) must be an integer'}), 400
+        
+        state = add_chunk(session, seq, request.files['audio'].read())
+        return jsonify(state)
+    
+    except LiveTranscriptionError as e:
+        logger.warning(f"Live transcription chunk rejected: {str(e)}")
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"Error in live transcription chunk: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@app.route('/api/live-transcription/<session_id>', methods=['GET'])
+def live_transcription_status(session_id):
+    """Get the transcript of a live session so far"""
+    session = get_live_session(session_id)
+    if session is None:
+        return jsonify({'error': 'Live transcription session not found or expired'}), 404
+    return jsonify(session.to_dict())
+
+@app.route('/api/live-transcription/<session_id>/events', methods=['GET'])
+def live_transcription_events(session_id):
+    """Stream the transcript of a live session as Server-Sent Events as it grows"""
+    session = get_live_session(session_id)
+    if session is None:
+        return jsonify({'error': 'Live transcription session not found or expired'}), 404
+    
+    def generate():
+        version = -1
+        while True:
+            current = session.wait_for_change(version, timeout=15)
+            if current == version:
+                # Keep idle connections open through proxies
+                yield ": keep-alive\n\n"
+                continue
+            version = current
+            state = session.to_dict()
+            if state['status'] == 'completed':
+                yield sse_event('completed', state)
+                return
+            yield sse_event('transcript', state)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/live-transcription/<session_id>/finish', methods=['POST', 'OPTIONS'])
+def live_transcription_finish(session_id):
+    """End a live recording; returns the full transcript once the last segments are transcribed"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 'ok'}), 200
+    
+    try:
+        session = get_live_session(session_id)
+        if session is None:
+            return jsonify({'error': 'Live transcription session not found or expired'}), 404
+        
+        logger.info(f"Live transcription session finished at {datetime.now()}")
+        finish_session(session)
+        # Only the audio since the last cut is left to transcribe, so this is short
+        session.wait_until_complete(timeout=MODEL_TRANSCRIPTION_TIMEOUT)
+        state = session.to_dict()
+        if state['status'] != 'completed':
+            return jsonify(state), 202
+        return jsonify(state)
+    
+    except Exception as e:
+        logger.error(f"Error finishing live transcription: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
 @app.route('/api/cost-stats', methods=['GET'])
 def get_cost_stats():
-    """Get cumulative cost statistics"""
+    """
+    Get cumulative cost statistics
+
+    With ?window= (such as 24h or 7d), also returns usage over that window
+    from the usage ledger rollups: totals, per-endpoint totals and a time
+    series at ?interval= (default 1h), optionally for one ?endpoint=.
+    """
     try:
         from generate import load_cost_log
+        from usage_ledger import query_usage, parse_duration
         cost_data = load_cost_log()
+        if request.args.get('window'):
+            try:
+                window = parse_duration(request.args['window'])
+                interval = parse_duration(request.args['interval']) if request.args.get('interval') else None
+            except ValueError as e:
+                return jsonify({'error': f'Invalid window or interval: {str(e)}'}), 400
+            cost_data['usage'] = query_usage(window, interval, request.args.get('endpoint'))
         return jsonify(cost_data)
     except Exception as e:
         logger.error(f"Error getting cost stats: {str(e)}")
@@ -431,20 +1191,43 @@ def get_cost_stats():
 def reset_costs():
     """Reset cumulative cost data"""
     try:
-        from generate import save_cost_log
-        reset_data = {
-            "total_cost": 0.0,
-            "total_tokens": 0,
-            "total_requests": 0,
-            "last_updated": datetime.now().isoformat()
-        }
-        save_cost_log(reset_data)
+        from generate import reset_cost_log
+        reset_data = reset_cost_log()
         logger.info("Cost data reset successfully")
         return jsonify({'message': 'Cost data reset successfully', 'cost_data': reset_data})
     except Exception as e:
         logger.error(f"Error resetting costs: {str(e)}")
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+@app.route('/api/scheduler-stats', methods=['GET'])
+def scheduler_stats():
+    """Get model admission control statistics"""
+    return jsonify(get_scheduler_stats())
+
+@app.route('/api/cache-stats', methods=['GET'])
+def get_response_cache_stats():
+    """Get response cache hit/miss statistics"""
+    try:
+        from response_cache import get_cache_stats
+        stats = get_cache_stats()
+        stats['markdown'] = get_render_stats()
+        return jsonify(stats)
+    except Exception as e:
+        logger.error(f"Error getting cache stats: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@app.route('/api/clear-cache', methods=['POST'])
+def clear_cache():
+    """Clear the response cache"""
+    try:
+        from response_cache import clear_response_cache
+        clear_response_cache()
+        logger.info("Response cache cleared successfully")
+        return jsonify({'message': 'Response cache cleared successfully'})
+    except Exception as e:
+        logger.error(f"Error clearing response cache: {str(e)}")
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -459,10 +1242,39 @@ def internal_error(error):
 def too_large(error):
     return jsonify({'error': 'File too large'}), 413
 
+def preload():
+    """Load the deferred modules and resources so the first requests do not pay for them"""
+    from model_backends import preload_clients
+    from generate import get_encoding, split_sentences
+    from pdf import load_pdf_reader
+    
+    try:
+        preload_clients()
+        get_encoding("gpt-4")
+        split_sentences("Warm up.")
+        load_pdf_reader()
+        load_markdown()
+        logger.info(f"Preload finished: {get_load_times()}")
+    except Exception as e:
+        logger.error(f"Error preloading: {e}")
+
+add_load_time("app_import", time.perf_counter() - _import_started)
+logger.info(f"App imported in {(time.perf_counter() - _import_started) * 1000:.0f} ms")
+
+if APP_PRELOAD:
+    threading.Thread(target=preload, name="preload", daemon=True).start()
+
 if __name__ == '__main__':
     logger.info("Starting Flask Healthcare Platform server...")
-    logger.info("Access your application at: http://localhost:5000")
+    
+    # Run with HTTP by default (localhost is secure for media access); APP_HTTPS=1 serves HTTPS
+    ssl_context = None
+    if os.environ.get("APP_HTTPS", "0").lower() in ("1", "true", "yes"):
+        cert_path, key_path = create_ssl_context()
+        if cert_path:
+            ssl_context = (cert_path, key_path)
+    scheme = 'https' if ssl_context else 'http'
+    logger.info(f"Access your application at: {scheme}://localhost:5000")
     logger.info("For audio recording: Use localhost (HTTP) - it's considered a secure context")
     
-    # Run with HTTP by default (localhost is secure for media access)
-    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True) 
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True, ssl_context=ssl_context) 
\ No newline at end of file
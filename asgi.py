@@ -0,0 +1,268 @@
+"""
+Asyncio serving mode for the Healthcare Platform
+
+The model-backed API endpoints run as native async handlers on the model
+replicas' AsyncOpenAI clients, so waiting on the model server does not pin an OS thread
+per request. Everything else (pages, uploads, jobs, stats) is served by the
+existing Flask app, mounted underneath.
+
+Run with:  uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import logging
+import functools
+from datetime import datetime
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route, Mount
+
+from app import (app as flask_app, CORS_ORIGINS, build_response_payload, build_minutes_payload, sse_event, delta_payload,
+                 parse_fields, select_fields)
+from chat import achat, achat_stream
+from medical_docs import amedical_docs, amedical_docs_stream, DocumentNotFound
+from meeting_minutes import ameeting_minutes, ameeting_minutes_stream
+from transcription import atranscribe_audio
+from markdown_render import StreamRenderer, MARKDOWN_STREAM_HTML
+from compression import negotiate_encoding, compress, COMPRESSIBLE_TYPES, RESPONSE_COMPRESSION_MIN_BYTES
+from model_backends import aclose_backends
+from scheduler import SchedulerRejected
+from metrics import begin_request, end_request, server_timing_header
+
+logger = logging.getLogger(__name__)
+
+def error(message, status_code):
+    return JSONResponse({'error': message}, status_code=status_code)
+
+async def read_json(request):
+    """Parse a JSON request body, returning (data, error_response)"""
+    if request.headers.get('content-type', '').split(';')[0].strip() != 'application/json':
+        return None, error('Content-Type must be application/json', 400)
+    try:
+        data = await request.json()
+    except ValueError:
+        return None, error('Invalid JSON data', 400)
+    if not data:
+        return None, error('No JSON data provided', 400)
+    return data, None
+
+def requested_fields(request):
+    return parse_fields(request.query_params.get('fields'))
+
+def negotiate_response(request, response):
+    """Compress a JSON response as negotiated with Accept-Encoding (see app.negotiate_response)"""
+    if isinstance(response, StreamingResponse) or response.media_type not in COMPRESSIBLE_TYPES:
+        return response
+    response.headers.add_vary_header('Accept-Encoding')
+    encoding = negotiate_encoding(request.headers.get('accept-encoding'))
+    if encoding and len(response.body) >= RESPONSE_COMPRESSION_MIN_BYTES:
+        response.body = compress(response.body, encoding)
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Content-Length'] = str(len(response.body))
+    return response
+
+def instrumented(handler):
+    """
+    Record request metrics, add Server-Timing and compress the response for a
+    native async route (see app.finish_request_metrics and app.negotiate_response)
+    """
+    @functools.wraps(handler)
+    async def wrapper(request):
+        endpoint = request.url.path
+        start = begin_request(endpoint)
+        response = await handler(request)
+        end_request(endpoint, response.status_code, start)
+        timing = server_timing_header()
+        if timing:
+            response.headers['Server-Timing'] = timing
+        return negotiate_response(request, response)
+    return wrapper
+
+async def sse_stream(events, content_key='response', html_key='response_html', fields=None):
+    """Relay async generate events as Server-Sent Events (see app.sse_response)"""
+    # Start the stream before sending headers so admission control rejections get a status code
+    first_event = await events.__anext__()
+
+    async def remaining_events():
+        yield first_event
+        async for event in events:
+            yield event
+
+    async def generate():
+        renderer = StreamRenderer() if MARKDOWN_STREAM_HTML else None
+        try:
+            async for event in remaining_events():
+                # Markdown rendering is CPU-bound, so it runs off the event loop
+                if event['type'] == 'delta':
+                    yield sse_event('delta', await asyncio.to_thread(delta_payload, event, renderer))
+                else:
+                    yield sse_event('done', await asyncio.to_thread(build_response_payload, event, content_key,
+                                                                    html_key, fields))
+        except Exception as e:
+            logger.error(f"Error while streaming response: {str(e)}")
+            yield sse_event('error', {'error': f'Internal server error: {str(e)}'})
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+async def api_chat(request):
+    if request.method == 'OPTIONS':
+        return JSONResponse({'status': 'ok'})
+
+    try:
+        logger.info(f"Chat API called at {datetime.now()}")
+
+        data, error_response = await read_json(request)
+        if error_response:
+            return error_response
+
+        user_message = data.get('message', '')
+        session_id = data.get('session_id')
+        if not user_message:
+            return error('No message provided', 400)
+
+        if request.url.path.endswith('/stream'):
+            return await sse_stream(achat_stream(user_message, session_id), fields=requested_fields(request))
+
+        response_data = await achat(user_message, session_id)
+        return JSONResponse(await asyncio.to_thread(build_response_payload, response_data,
+                                                    fields=requested_fields(request)))
+
+    except SchedulerRejected as e:
+        return error(str(e), e.status_code)
+    except Exception as e:
+        logger.error(f"Error in chat API: {str(e)}")
+        return error(f'Internal server error: {str(e)}', 500)
+
+async def api_medical_chat(request):
+    if request.method == 'OPTIONS':
+        return JSONResponse({'status': 'ok'})
+
+    try:
+        logger.info(f"Medical chat API called at {datetime.now()}")
+
+        data, error_response = await read_json(request)
+        if error_response:
+            return error_response
+
+        user_message = data.get('message', '')
+        medical_history = data.get('medical_history', '')
+        document_id = data.get('document_id')
+        session_id = data.get('session_id')
+
+        if not user_message:
+            return error('No message provided', 400)
+
+        try:
+            if request.url.path.endswith('/stream'):
+                return await sse_stream(amedical_docs_stream(user_message, medical_history, document_id, session_id),
+                                        fields=requested_fields(request))
+            response_data = await amedical_docs(user_message, medical_history, document_id, session_id)
+        except DocumentNotFound as e:
+            return error(str(e), e.status_code)
+
+        return JSONResponse(await asyncio.to_thread(build_response_payload, response_data,
+                                                    fields=requested_fields(request)))
+
+    except SchedulerRejected as e:
+        return error(str(e), e.status_code)
+    except Exception as e:
+        logger.error(f"Error in medical chat API: {str(e)}")
+        return error(f'Internal server error: {str(e)}', 500)
+
+async def api_generate_meeting_minutes(request):
+    if request.method == 'OPTIONS':
+        return JSONResponse({'status': 'ok'})
+
+    try:
+        logger.info(f"Meeting minutes API called at {datetime.now()}")
+
+        data, error_response = await read_json(request)
+        if error_response:
+            return error_response
+
+        transcript = data.get('transcript', '')
+        if not transcript:
+            return error('No transcript provided', 400)
+
+        if request.url.path.endswith('/stream'):
+            return await sse_stream(ameeting_minutes_stream(transcript), 'minutes', 'minutes_html',
+                                    requested_fields(request))
+
+        response_data = await ameeting_minutes(transcript)
+        return JSONResponse(await asyncio.to_thread(build_minutes_payload, response_data, requested_fields(request)))
+
+    except SchedulerRejected as e:
+        return error(str(e), e.status_code)
+    except Exception as e:
+        logger.error(f"Error in meeting minutes API: {str(e)}")
+        return error(f'Internal server error: {str(e)}', 500)
+
+async def api_transcribe_audio(request):
+    if request.method == 'OPTIONS':
+        return JSONResponse({'status': 'ok'})
+
+    try:
+        logger.info(f"Audio transcription API called at {datetime.now()}")
+
+        # The same upload limit as the Flask app; checked before and after parsing, as the length may be missing
+        max_bytes = flask_app.config['MAX_CONTENT_LENGTH']
+        if int(request.headers.get('content-length') or 0) > max_bytes:
+            return error('Upload too large', 413)
+
+        form = await request.form()
+        audio_file = form.get('audio')
+        if audio_file is None or isinstance(audio_file, str):
+            return error('No audio file provided', 400)
+        if not audio_file.filename:
+            return error('No audio file selected', 400)
+        if audio_file.size is not None and audio_file.size > max_bytes:
+            return error('Upload too large', 413)
+
+        # Send the upload straight to Whisper without a temporary file
+        audio_bytes = await audio_file.read()
+        try:
+            result = await atranscribe_audio(audio_bytes, audio_file.filename)
+        except Exception as transcription_error:
+            logger.error(f"Transcription failed: {transcription_error}")
+            raise Exception(f"Speech recognition failed: {str(transcription_error)}")
+
+        if not result['transcript']:
+            raise Exception("Failed to transcribe audio - no transcript generated")
+
+        logger.info("Audio transcription completed successfully")
+        return JSONResponse(select_fields(result, requested_fields(request)))
+
+    except Exception as e:
+        logger.error(f"Error in audio transcription: {str(e)}")
+        return error(f'Audio transcription failed: {str(e)}', 500)
+
+routes = [
+    Route('/api/chat', instrumented(api_chat), methods=['POST', 'OPTIONS']),
+    Route('/api/chat/stream', instrumented(api_chat), methods=['POST', 'OPTIONS']),
+    Route('/api/medical-chat', instrumented(api_medical_chat), methods=['POST', 'OPTIONS']),
+    Route('/api/medical-chat/stream', instrumented(api_medical_chat), methods=['POST', 'OPTIONS']),
+    Route('/api/generate-meeting-minutes', instrumented(api_generate_meeting_minutes), methods=['POST', 'OPTIONS']),
+    Route('/api/generate-meeting-minutes/stream', instrumented(api_generate_meeting_minutes), methods=['POST', 'OPTIONS']),
+    Route('/api/transcribe-audio', instrumented(api_transcribe_audio), methods=['POST', 'OPTIONS']),
+    # Pages, uploads, jobs and stats are served by the Flask app
+    Mount('/', app=WSGIMiddleware(flask_app)),
+]
+
+middleware = [
+    Middleware(CORSMiddleware, allow_origins=CORS_ORIGINS, allow_methods=['GET', 'POST', 'OPTIONS'],
+               allow_headers=['Content-Type', 'Authorization']),
+]
+
+app = Starlette(routes=routes, middleware=middleware, on_shutdown=[aclose_backends])
+
+if __name__ == '__main__':
+    import uvicorn
+
+    logger.info("Starting Healthcare Platform in asyncio mode...")
+    logger.info("Access your application at: http://localhost:5000")
+    uvicorn.run(app, host='0.0.0.0', port=5000)
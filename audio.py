@@ -6,15 +6,16 @@ import os
 CHUNK = 1024
 FORMAT = pyaudio.paInt16
 CHANNELS = 1
-RATE = 44100
+# Whisper works at 16 kHz; recording at it avoids resampling and keeps files small
+RATE = 16000
 
-from openai import OpenAI 
-client = OpenAI(api_key="dpais", base_url="http://localhost:8553/v1/openai")
+# Long recordings are split at pauses and transcribed in parallel segments
+from transcription import transcribe_audio
 
-audio_file = open("speech.mp3", "rb") 
-transcript = client.audio.transcriptions.create(   model="whisper",   file=audio_file )
+with open("speech.mp3", "rb") as audio_file:
+    transcript = transcribe_audio(audio_file.read(), "speech.mp3")
 
-print(transcript.text)
+print(transcript["transcript"])
 
 
 try:
@@ -61,9 +62,9 @@ try:
 
     # OPTION B
     # Speech recognition by Whisper
-    audio_file = open("output.wav", "rb") 
-    transcript = client.audio.transcriptions.create(   model="whisper",   file=audio_file )
-    print(transcript.text)
+    with open("output.wav", "rb") as audio_file:
+        transcript = transcribe_audio(audio_file.read(), "output.wav")
+    print(transcript["transcript"])
 
 # OPTION A
 # except sr.UnknownValueError:
@@ -0,0 +1,281 @@
+import io
+import os
+import wave
+from metrics import record_load, increment
+
+# Set to 0 to send uploads to Whisper unchanged
+AUDIO_PREPROCESS = os.environ.get("AUDIO_PREPROCESS", "1").lower() in ("1", "true", "yes")
+
+# Sample rate Whisper works at; audio is downmixed to mono and resampled to it
+AUDIO_TARGET_SAMPLE_RATE = int(os.environ.get("AUDIO_TARGET_SAMPLE_RATE", 16000))
+
+# Set to 0 to keep silent spans
+AUDIO_VAD = os.environ.get("AUDIO_VAD", "1").lower() in ("1", "true", "yes")
+
+# Length of the frames whose energy is compared against the silence threshold
+AUDIO_VAD_FRAME_MS = int(os.environ.get("AUDIO_VAD_FRAME_MS", 30))
+
+# Frames this far above the recording's noise floor count as speech
+AUDIO_VAD_MARGIN_DB = float(os.environ.get("AUDIO_VAD_MARGIN_DB", 10))
+
+# Frames within this range of the loud speech always count as speech, however noisy the recording
+AUDIO_VAD_DYNAMIC_RANGE_DB = float(os.environ.get("AUDIO_VAD_DYNAMIC_RANGE_DB", 20))
+
+# Audio kept either side of speech, so word onsets and short pauses survive
+AUDIO_VAD_PADDING_MS = int(os.environ.get("AUDIO_VAD_PADDING_MS", 300))
+
+_np = None
+
+def load_numpy():
+    """numpy, imported on first use to keep it out of startup"""
+    global _np
+    if _np is None:
+        with record_load("numpy"):
+            import numpy
+        _np = numpy
+    return _np
+
+def _read_wav(audio_bytes):
+    """Decode PCM WAV bytes into a float32 array of shape (frames, channels) in [-1, 1]"""
+    np = load_numpy()
+    with wave.open(io.BytesIO(audio_bytes), "rb") as wav:
+        channels = wav.getnchannels()
+        sample_width = wav.getsampwidth()
+        rate = wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+
+    if sample_width == 1:
+        # 8-bit WAV is unsigned
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768
+    elif sample_width == 3:
+        # Widen 24-bit samples to 32 bits, keeping the sign in the top byte
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        widened = np.zeros((len(packed), 4), dtype=np.uint8)
+        widened[:, 1:] = packed
+        samples = widened.view("<i4").ravel().astype(np.float32) / 2147483648
+    elif sample_width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {sample_width} bytes")
+
+    frames = len(samples) // channels
+    return samples[:frames * channels].reshape(frames, channels), rate
+
+def _write_wav(samples, rate):
+    """Encode a mono float32 array as 16-bit PCM WAV bytes"""
+    np = load_numpy()
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+def _resample(samples, rate, target_rate):
+    """
+    Resample a mono signal by linear interpolation
+
+    When downsampling, a moving average over one output sample period is
+    applied first, so frequencies above the new Nyquist limit are attenuated
+    rather than folded back into the speech band.
+    """
+    np = load_numpy()
+    if rate == target_rate or len(samples) == 0:
+        return samples
+    ratio = rate / target_rate
+    if ratio > 1:
+        width = int(round(ratio))
+        if width > 1:
+            cumulative = np.cumsum(np.concatenate(([0.0], samples)), dtype=np.float64)
+            averaged = (cumulative[width:] - cumulative[:-width]) / width
+            # Keep the length, treating the first samples as a partial window
+            samples = np.concatenate((samples[:width - 1], averaged.astype(np.float32)))
+    positions = np.arange(int(len(samples) / ratio), dtype=np.float64) * ratio
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+def _frame_energy_db(samples, frame_length):
+    """Energy of each whole frame in dB relative to full scale"""
+    np = load_numpy()
+    frame_count = len(samples) // frame_length
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    return 10 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-12)
+
+def _speech_frames(energy_db):
+    """
+    Boolean mask of the frames to keep: speech frames plus padding around them
+
+    A frame is speech if its energy is AUDIO_VAD_MARGIN_DB above the noise
+    floor (the quietest tenth of frames), or within AUDIO_VAD_DYNAMIC_RANGE_DB
+    of the loud speech (the loudest tenth), so continuous speech is never
+    trimmed just because it has no silence to measure a floor from.
+    """
+    np = load_numpy()
+    noise_floor, speech_level = np.percentile(energy_db, [10, 90])
+    threshold = min(noise_floor + AUDIO_VAD_MARGIN_DB, speech_level - AUDIO_VAD_DYNAMIC_RANGE_DB)
+    speech = energy_db > threshold
+    if not speech.any():
+        return np.ones(len(energy_db), dtype=bool)
+
+    # Widen each speech frame by the padding on both sides
+    padding = AUDIO_VAD_PADDING_MS // AUDIO_VAD_FRAME_MS
+    if padding:
+        speech = np.convolve(speech, np.ones(2 * padding + 1), mode="same") > 0
+    return speech
+
+def _trim_silence(samples, frame_length):
+    """
+    Cut silent spans
+
+    Returns:
+        tuple: (trimmed samples, per-frame mask of what was kept, or None if nothing was cut)
+    """
+    np = load_numpy()
+    energy_db = _frame_energy_db(samples, frame_length)
+    if len(energy_db) == 0:
+        return samples, None
+    kept = _speech_frames(energy_db)
+    if kept.all():
+        return samples, None
+    mask = np.repeat(kept, frame_length)
+    # The tail shorter than a frame follows the last frame
+    mask = np.concatenate((mask, np.full(len(samples) - len(mask), kept[-1])))
+    return samples[mask], kept
+
+def _original_position(position, kept, kept_cumsum, frame_length):
+    """Map a sample position in trimmed audio back to the position in the untrimmed audio"""
+    np = load_numpy()
+    if kept is None:
+        return position
+    frame, offset = divmod(position, frame_length)
+    if frame >= kept_cumsum[-1]:
+        # In the tail after the last whole frame
+        return len(kept) * frame_length + position - int(kept_cumsum[-1]) * frame_length
+    return int(np.searchsorted(kept_cumsum, frame + 1)) * frame_length + offset
+
+def _cut_points(samples, frame_length, segment_length):
+    """
+    Sample positions to split audio at, at most segment_length apart
+
+    Each cut is placed at the quietest frame in the last fifth of the
+    segment, so segments end in a pause rather than mid-word.
+    """
+    np = load_numpy()
+    energy_db = _frame_energy_db(samples, frame_length)
+    segment_frames = max(1, segment_length // frame_length)
+    search_frames = max(1, segment_frames // 5)
+    cuts = []
+    start = 0
+    while len(energy_db) - start > segment_frames:
+        window_start = start + segment_frames - search_frames
+        start = window_start + int(np.argmin(energy_db[window_start:start + segment_frames]))
+        cuts.append(start * frame_length)
+    return cuts
+
+def decode_audio(audio_bytes):
+    """
+    Decode PCM WAV bytes into mono float32 samples at AUDIO_TARGET_SAMPLE_RATE
+
+    Raises:
+        ValueError: If the audio is not PCM WAV
+    """
+    if audio_bytes[:4] != b"RIFF" or audio_bytes[8:12] != b"WAVE":
+        raise ValueError("Audio must be PCM WAV")
+    samples, rate = _read_wav(audio_bytes)
+    mono = samples[:, 0] if samples.shape[1] == 1 else samples.mean(axis=1)
+    return _resample(mono, rate, AUDIO_TARGET_SAMPLE_RATE)
+
+def encode_audio(samples):
+    """Encode mono float32 samples at AUDIO_TARGET_SAMPLE_RATE as 16-bit PCM WAV bytes"""
+    return _write_wav(samples, AUDIO_TARGET_SAMPLE_RATE)
+
+def find_pause(samples, max_seconds):
+    """
+    Sample position to split audio decoded by decode_audio at, so the first
+    part is at most max_seconds and ends in a pause; None if it is shorter
+    """
+    frame_length = max(1, AUDIO_TARGET_SAMPLE_RATE * AUDIO_VAD_FRAME_MS // 1000)
+    cuts = _cut_points(samples, frame_length, int(max_seconds * AUDIO_TARGET_SAMPLE_RATE))
+    return cuts[0] if cuts else None
+
+def segment_audio(audio_bytes, filename, segment_seconds=None, overlap_seconds=0.0):
+    """
+    Prepare an upload for Whisper: downmix to mono, resample to
+    AUDIO_TARGET_SAMPLE_RATE, cut silent spans and split it into segments
+
+    Only PCM WAV (what the browser recorder uploads) is processed; anything
+    else, or anything that fails to decode, is returned as a single segment
+    unchanged so preprocessing can never fail a transcription.
+
+    Args:
+        audio_bytes: Uploaded audio
+        filename: Upload filename, used for the segments' names
+        segment_seconds: Split into segments of at most this many seconds,
+                         at pauses; None for a single segment
+        overlap_seconds: Audio before each split included again at the
+                         start of the next segment
+
+    Returns:
+        tuple: (segments, info). Each segment is a dict with 'index',
+               'audio', 'filename', and 'start' and 'end' in seconds of the
+               original recording (None if unknown). info has the original
+               and processed durations in seconds, their sizes in bytes and
+               whether preprocessing was applied.
+    """
+    info = {
+        "preprocessed": False,
+        "original_seconds": None,
+        "processed_seconds": None,
+        "original_bytes": len(audio_bytes),
+        "processed_bytes": len(audio_bytes),
+        "segments": 1
+    }
+    unchanged = [{"index": 0, "audio": audio_bytes, "filename": filename, "start": None, "end": None}]
+    if not AUDIO_PREPROCESS or audio_bytes[:4] != b"RIFF" or audio_bytes[8:12] != b"WAVE":
+        return unchanged, info
+
+    try:
+        np = load_numpy()
+        samples, original_rate = _read_wav(audio_bytes)
+        info["original_seconds"] = round(len(samples) / original_rate, 2) if original_rate else None
+        # Average the channels; a mono file is left as it is
+        mono = samples[:, 0] if samples.shape[1] == 1 else samples.mean(axis=1)
+        rate = AUDIO_TARGET_SAMPLE_RATE
+        mono = _resample(mono, original_rate, rate)
+        frame_length = max(1, rate * AUDIO_VAD_FRAME_MS // 1000)
+        kept = None
+        if AUDIO_VAD:
+            mono, kept = _trim_silence(mono, frame_length)
+        kept_cumsum = np.cumsum(kept) if kept is not None else None
+
+        cuts = _cut_points(mono, frame_length, int(segment_seconds * rate)) if segment_seconds else []
+        overlap = int(overlap_seconds * rate)
+        base = os.path.splitext(filename)[0]
+        segments = []
+        for index, (start, end) in enumerate(zip([0] + cuts, cuts + [len(mono)])):
+            start = max(0, start - overlap)
+            segments.append({
+                "index": index,
+                "audio": _write_wav(mono[start:end], rate),
+                "filename": f"{base}_{index}.wav" if cuts else f"{base}.wav",
+                "start": round(_original_position(start, kept, kept_cumsum, frame_length) / rate, 2),
+                "end": round(_original_position(end, kept, kept_cumsum, frame_length) / rate, 2)
+            })
+    except Exception as e:
+        print(f"Error preprocessing audio, sending it unchanged: {e}")
+        return unchanged, info
+
+    info.update({
+        "preprocessed": True,
+        "processed_seconds": round(len(mono) / rate, 2),
+        "processed_bytes": sum(len(segment["audio"]) for segment in segments),
+        "segments": len(segments)
+    })
+    increment("audio_seconds_total", info["original_seconds"], "Seconds of uploaded audio, before and after preprocessing",
+              stage="original")
+    increment("audio_seconds_total", info["processed_seconds"], "Seconds of uploaded audio, before and after preprocessing",
+              stage="processed")
+    return segments, info
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from generate import generate_response, merge_response_data
+from chat import system_prompt as chat_system_prompt, build_chat_input
+from medical_docs import system_prompt as medical_system_prompt, build_medical_input
+from meeting_minutes import meeting_minutes
+from scheduler import BULK
+
+# Distinct items of one batch run concurrently; the scheduler still caps model calls across the app
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", 8))
+
+# Largest number of items accepted in one batch
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 500))
+
+BATCH_TYPES = ("chat", "medical", "minutes")
+
+class BatchItemError(Exception):
+    """Raised for an item that cannot be run; status_code is the HTTP status it would have had on its own"""
+    status_code = 400
+
+def _validate(item):
+    """Return the normalised item, raising BatchItemError if it is malformed"""
+    if not isinstance(item, dict):
+        raise BatchItemError("Item must be an object")
+    item_type = item.get("type", "chat")
+    if item_type not in BATCH_TYPES:
+        raise BatchItemError(f"Unknown item type '{item_type}'; expected one of {', '.join(BATCH_TYPES)}")
+    text = item.get("input", "")
+    if not isinstance(text, str) or not text:
+        raise BatchItemError("No input provided")
+    return {
+        "type": item_type,
+        "input": text,
+        "document_id": item.get("document_id") if item_type == "medical" else None,
+        "medical_history": item.get("medical_history", "") if item_type == "medical" else ""
+    }
+
+def _item_key(item):
+    return json.dumps([item["type"], item["input"], item["document_id"], item["medical_history"]], ensure_ascii=False)
+
+def _run_item(item):
+    """Generate the response for one item, at bulk priority so interactive requests go first"""
+    if item["type"] == "minutes":
+        return meeting_minutes(item["input"])
+    if item["type"] == "medical":
+        # A missing record raises DocumentNotFound, reported with its 404 status
+        full_input = build_medical_input(item["input"], item["medical_history"], item["document_id"])
+        return generate_response(medical_system_prompt, full_input, priority=BULK)
+    return generate_response(chat_system_prompt, build_chat_input(item["input"]), priority=BULK)
+
+def _error_record(index, item_id, e):
+    return {
+        "type": "result",
+        "index": index,
+        "id": item_id,
+        "status": "error",
+        "error": str(e),
+        "status_code": getattr(e, "status_code", 500)
+    }
+
+def run_batch(items):
+    """
+    Run a batch of chat, medical and meeting minutes items concurrently
+
+    Identical items (same type, input and record) are generated once and
+    their result is reported for each of them. Items run at most
+    BATCH_MAX_CONCURRENCY at a time.
+
+    Args:
+        items: List of dicts with 'type' ('chat', 'medical' or 'minutes'),
+               'input', an optional 'document_id' or 'medical_history' for
+               medical items and an optional client 'id' echoed back
+
+    Yields:
+        dict: A 'result' record per item as it completes, with its index
+              in the batch and either the response and token usage or an
+              error, then a single 'summary' record with counts and the
+              token usage and costs summed over the distinct items
+    """
+    started = time.perf_counter()
+    # key -> (item, [(index, id)]) of the items sharing it, in the order first seen
+    distinct = {}
+    failed = 0
+    for index, raw_item in enumerate(items):
+        item_id = raw_item.get("id") if isinstance(raw_item, dict) else None
+        try:
+            item = _validate(raw_item)
+        except BatchItemError as e:
+            failed += 1
+            yield _error_record(index, item_id, e)
+            continue
+        distinct.setdefault(_item_key(item), (item, []))[1].append((index, item_id))
+
+    responses = []
+    workers = max(1, min(BATCH_MAX_CONCURRENCY, len(distinct)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-item")
+    try:
+        # Run each item in a copy of the caller's context so its metrics are labelled with the endpoint
+        futures = {executor.submit(contextvars.copy_context().run, _run_item, item): key
+                   for key, (item, _) in distinct.items()}
+        for future in as_completed(futures):
+            item, targets = distinct[futures[future]]
+            try:
+                response_data = future.result()
+            except Exception as e:
+                print(f"Error in batch {item['type']} item: {e}")
+                failed += len(targets)
+                for index, item_id in targets:
+                    yield _error_record(index, item_id, e)
+                continue
+            responses.append(response_data)
+            for position, (index, item_id) in enumerate(targets):
+                yield {
+                    "type": "result",
+                    "index": index,
+                    "id": item_id,
+                    "status": "ok",
+                    "response": response_data["content"],
+                    "token_usage": response_data["token_usage"],
+                    "cached": response_data.get("cached", False),
+                    # Later copies of an item share the first copy's model call
+                    "duplicate": position > 0
+                }
+    finally:
+        # A client that disconnects stops the batch; queued items are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    totals = merge_response_data(responses, "")
+    yield {
+        "type": "summary",
+        "items": len(items),
+        "distinct": len(distinct),
+        "succeeded": len(items) - failed,
+        "failed": failed,
+        "token_usage": totals["token_usage"],
+        "cost_data": totals["cost_data"],
+        "commercial_costs": totals["commercial_costs"],
+        "cached": sum(1 for response_data in responses if response_data.get("cached", False)),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
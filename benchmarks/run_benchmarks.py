@@ -0,0 +1,335 @@
+"""
+Endpoint benchmarks for the Healthcare Platform
+
+Starts one or more stub model servers (stub_model_server.py) and the app
+pointed at them. It then drives the API endpoints at each concurrency level
+and writes throughput and latency percentiles to a JSON results file. With
+the model's latency taken out, the results measure the app's own overhead:
+request handling, markdown rendering, token counting, cost log I/O and
+PDF extraction.
+
+Run with:  python benchmarks/run_benchmarks.py --concurrency 1,8,32 --requests 200
+
+Pass --baseline with an earlier results file to fail when throughput or p95
+latency regress by more than --tolerance.
+"""
+import os
+import sys
+import io
+import json
+import math
+import time
+import wave
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+import httpx
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+
+SCENARIOS = ["chat", "medical-chat", "generate-meeting-minutes", "upload-medical-record", "transcribe-audio"]
+
+# Filler for generated medical records and meeting transcripts
+RECORD_SENTENCE = ("Patient reviewed for hypertension and type 2 diabetes; metformin 500 mg twice daily, "
+                   "blood pressure 132/84, HbA1c 7.1 percent, advised on diet and exercise.")
+TRANSCRIPT_SENTENCE = ("Alice said the budget review is on track and Bob will circulate the revised clinic "
+                       "rota by Friday while Carol follows up with the supplier about the delayed order.")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode} before listening on port {port}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for port {port}")
+
+def make_pdf(pages, marker):
+    """A minimal text PDF with one paragraph per page; marker makes each file's content unique"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        lines = [f"Record {marker} page {page + 1}"] + [RECORD_SENTENCE[i:i + 90] for i in range(0, len(RECORD_SENTENCE), 90)]
+        text = " ".join(f"({line}) Tj 0 -16 Td" for line in lines)
+        content = f"BT /F1 11 Tf 72 720 Td {text} ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objects)} 0 R "
+                       f"/Resources << /Font << /F1 3 0 R >> >> >>".encode())
+        kids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {pages} >>".encode()
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+def make_wav(seconds, rate=16000):
+    """Silent mono 16-bit WAV of the given duration"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+def make_transcript(words):
+    sentence_words = TRANSCRIPT_SENTENCE.split()
+    sentences = []
+    count = 0
+    while count < words:
+        sentences.append(TRANSCRIPT_SENTENCE)
+        count += len(sentence_words)
+    return " ".join(sentences)
+
+def build_request(scenario, i, args, fixtures):
+    """Keyword arguments for httpx for request number i of a scenario"""
+    # Vary every request so the response cache and PDF cache do not short-circuit the work
+    if scenario == "chat":
+        return {"method": "POST", "url": "/api/chat",
+                "json": {"message": f"Benchmark question {i}: what are the common symptoms of flu?"}}
+    if scenario == "medical-chat":
+        return {"method": "POST", "url": "/api/medical-chat",
+                "json": {"message": f"Benchmark question {i}: summarise the medication history",
+                         "document_id": fixtures["document_id"]}}
+    if scenario == "generate-meeting-minutes":
+        return {"method": "POST", "url": "/api/generate-meeting-minutes",
+                "json": {"transcript": f"Meeting {i}. " + fixtures["transcript"]}}
+    if scenario == "upload-medical-record":
+        return {"method": "POST", "url": "/api/upload-medical-record",
+                "files": {"file": (f"record_{i}.pdf", make_pdf(args.pdf_pages, i), "application/pdf")}}
+    if scenario == "transcribe-audio":
+        return {"method": "POST", "url": "/api/transcribe-audio",
+                "files": {"audio": (f"recording_{i}.wav", fixtures["audio"], "audio/wav")}}
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+async def run_level(client, scenario, concurrency, requests, args, fixtures, offset=0):
+    """Send requests for one scenario with at most concurrency in flight; return timings"""
+    latencies = []
+    statuses = {}
+    counter = iter(range(offset, offset + requests))
+
+    async def worker():
+        for i in counter:
+            request = build_request(scenario, i, args, fixtures)
+            start = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                await response.aread()
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "200":
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": requests,
+        "succeeded": len(latencies),
+        "errors": requests - len(latencies),
+        "statuses": statuses,
+        "duration_seconds": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 2) if duration else 0.0,
+        "latency_ms": {
+            "mean": ms(sum(latencies) / len(latencies)) if latencies else None,
+            "p50": ms(percentile(latencies, 50)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "max": ms(latencies[-1]) if latencies else None
+        }
+    }
+
+async def prepare_fixtures(client, scenarios, args):
+    fixtures = {
+        "transcript": make_transcript(args.transcript_words),
+        "audio": make_wav(args.audio_seconds)
+    }
+    if "medical-chat" in scenarios:
+        response = await client.post("/api/upload-medical-record", files={
+            "file": ("benchmark_record.pdf", make_pdf(args.pdf_pages, "medical-chat"), "application/pdf")
+        })
+        response.raise_for_status()
+        fixtures["document_id"] = response.json()["document_id"]
+    return fixtures
+
+async def run_benchmarks(base_url, scenarios, levels, args):
+    limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels) * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+        fixtures = await prepare_fixtures(client, scenarios, args)
+        results = []
+        offset = 0
+        for scenario in scenarios:
+            if args.warmup:
+                await run_level(client, scenario, min(levels), args.warmup, args, fixtures, offset)
+                offset += args.warmup
+            for concurrency in levels:
+                result = await run_level(client, scenario, concurrency, args.requests, args, fixtures, offset)
+                offset += args.requests
+                results.append(result)
+                latency = result["latency_ms"]
+                print(f"{scenario:<26} c={concurrency:<4} {result['throughput_rps']:>9.2f} req/s  "
+                      f"p50 {latency['p50']} ms  p95 {latency['p95']} ms  p99 {latency['p99']} ms  "
+                      f"errors {result['errors']}", flush=True)
+        return results
+
+def start_servers(args, workdir):
+    """Start the stub model servers and the app; returns (base_url, processes)"""
+    processes = []
+    stub_urls = []
+    for _ in range(args.replicas):
+        port = free_port()
+        process = subprocess.Popen([
+            sys.executable, os.path.join(BENCHMARK_DIR, "stub_model_server.py"), "--port", str(port),
+            "--latency", str(args.latency), "--jitter", str(args.jitter),
+            "--response-words", str(args.response_words),
+            "--transcription-latency", str(args.transcription_latency)
+        ], stdout=subprocess.DEVNULL)
+        processes.append(process)
+        wait_for_port(port, process)
+        stub_urls.append(f"http://127.0.0.1:{port}/v1/openai")
+
+    env = dict(os.environ)
+    env["MODEL_BASE_URLS"] = ",".join(stub_urls)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_DIR, env.get("PYTHONPATH")]))
+    port = free_port()
+    if args.server == "asgi":
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "flask", "--app", "app", "run", "--host", "127.0.0.1",
+                   "--port", str(port), "--with-threads", "--no-reload", "--no-debugger"]
+    # Run from a scratch directory so uploads and the cost log do not touch the checkout
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    processes.append(process)
+    wait_for_port(port, process, timeout=120)
+    return f"http://127.0.0.1:{port}", processes
+
+def stop_servers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """Return descriptions of results that regressed against the baseline file"""
+    with open(baseline_path, "r") as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["scenario"], result["concurrency"]))
+        if previous is None:
+            continue
+        label = f"{result['scenario']} c={result['concurrency']}"
+        if result["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {result['throughput_rps']} req/s "
+                               f"(baseline {previous['throughput_rps']})")
+        p95, previous_p95 = result["latency_ms"]["p95"], previous["latency_ms"]["p95"]
+        if p95 is not None and previous_p95 is not None and p95 > previous_p95 * (1 + tolerance):
+            regressions.append(f"{label}: p95 {p95} ms (baseline {previous_p95} ms)")
+        if result["errors"] > previous["errors"]:
+            regressions.append(f"{label}: {result['errors']} errors (baseline {previous['errors']})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Healthcare Platform API against a stub model server")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests before each scenario")
+    parser.add_argument("--server", choices=["flask", "asgi"], default="flask", help="Serving mode to start")
+    parser.add_argument("--url", help="Benchmark an already running app instead of starting one")
+    parser.add_argument("--replicas", type=int, default=1, help="Stub model servers to start")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub chat latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Stub random extra latency in seconds")
+    parser.add_argument("--response-words", type=int, default=300, help="Stub chat response size")
+    parser.add_argument("--transcription-latency", type=float, default=0.0, help="Stub transcription latency in seconds")
+    parser.add_argument("--pdf-pages", type=int, default=20, help="Pages per uploaded medical record")
+    parser.add_argument("--audio-seconds", type=float, default=10.0, help="Duration of uploaded recordings")
+    parser.add_argument("--transcript-words", type=int, default=1500, help="Meeting transcript size")
+    parser.add_argument("--request-timeout", type=float, default=300.0, help="Client timeout per request in seconds")
+    parser.add_argument("--output", help="Results file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed regression against the baseline (fraction)")
+    args = parser.parse_args(argv)
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    processes = []
+    with tempfile.TemporaryDirectory(prefix="healthcare-bench-") as workdir:
+        try:
+            if args.url:
+                base_url = args.url.rstrip("/")
+            else:
+                base_url, processes = start_servers(args, workdir)
+            started = datetime.now()
+            results = asyncio.run(run_benchmarks(base_url, scenarios, levels, args))
+        finally:
+            stop_servers(processes)
+
+    report = {
+        "started_at": started.isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {name: value for name, value in vars(args).items() if name not in ("output", "baseline")},
+        "results": results
+    }
+    output = args.output or os.path.join(BENCHMARK_DIR, "results", f"{started.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
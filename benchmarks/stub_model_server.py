@@ -0,0 +1,157 @@
+"""
+Stub of the OpenAI-compatible model server used by the benchmarks
+
+Serves chat completions (plain and streamed) and audio transcriptions under
+any base path, such as /v1/openai, after a configurable delay. It returns
+markdown of a configurable size, so the app does its real rendering,
+token counting and cost accounting without the model's latency masking it.
+
+Run with:  python benchmarks/stub_model_server.py --port 8553 --latency 0.2
+"""
+import sys
+import json
+import time
+import random
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Repeated to build responses; mixes headings, emphasis, lists and a table like real replies
+REPLY_BLOCKS = [
+    "## Summary\n\nThe patient reports **improved** symptoms since the last visit.\n\n",
+    "- Blood pressure is within the target range\n- Continue the current medication\n- Review again in six weeks\n\n",
+    "| Measurement | Value |\n|---|---|\n| Heart rate | 72 bpm |\n| Temperature | 36.8 C |\n\n",
+    "Discussed diet, exercise and sleep. No new concerns were raised during the appointment.\n\n",
+]
+
+TRANSCRIPT_WORDS = ("we reviewed the quarterly budget and agreed the next steps for the clinic schedule "
+                    "with follow up actions assigned to each team lead before the next meeting").split()
+
+def build_reply(words):
+    """Markdown reply of roughly the given number of words"""
+    parts = []
+    count = 0
+    while count < words:
+        block = REPLY_BLOCKS[len(parts) % len(REPLY_BLOCKS)]
+        parts.append(block)
+        count += len(block.split())
+    return "".join(parts)
+
+def build_transcript(words):
+    return " ".join(TRANSCRIPT_WORDS[i % len(TRANSCRIPT_WORDS)] for i in range(words)) + "."
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per response
+    disable_nagle_algorithm = True
+
+    # Set from the command line in main()
+    latency = 0.0
+    jitter = 0.0
+    token_delay = 0.0
+    stream_chunk_words = 4
+    reply = build_reply(300)
+    transcription_latency = 0.0
+    transcript = build_transcript(200)
+
+    def log_message(self, format, *args):
+        pass
+
+    def delay(self, seconds):
+        if self.jitter:
+            seconds += random.uniform(0, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.endswith("/audio/transcriptions"):
+            self.delay(self.transcription_latency)
+            self.send_json({"text": self.transcript})
+        elif self.path.endswith("/chat/completions"):
+            request = json.loads(body)
+            self.delay(self.latency)
+            # Roughly four characters per token
+            usage = {
+                "prompt_tokens": len(body) // 4,
+                "completion_tokens": len(self.reply) // 4,
+                "total_tokens": (len(body) + len(self.reply)) // 4
+            }
+            if request.get("stream"):
+                self.stream_reply(request.get("model", "stub"), usage)
+            else:
+                self.send_json({
+                    "id": "stub", "object": "chat.completion", "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": self.reply},
+                                 "finish_reason": "stop"}],
+                    "usage": usage
+                })
+        else:
+            self.send_error(404)
+
+    def stream_reply(self, model, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(data):
+            payload = f"data: {data}\n\n".encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+
+        words = self.reply.split(" ")
+        for start in range(0, len(words), self.stream_chunk_words):
+            text = " ".join(words[start:start + self.stream_chunk_words])
+            if start + self.stream_chunk_words < len(words):
+                text += " "
+            send_event(json.dumps({
+                "id": "stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]
+            }))
+            if self.token_delay:
+                time.sleep(self.token_delay)
+        send_event(json.dumps({
+            "id": "stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [], "usage": usage
+        }))
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible model server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8553)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each chat response starts")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay of up to this many seconds")
+    parser.add_argument("--response-words", type=int, default=300, help="Size of each chat response")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--transcription-latency", type=float, default=0.0, help="Seconds per transcription")
+    parser.add_argument("--transcript-words", type=int, default=200, help="Size of each transcript")
+    args = parser.parse_args(argv)
+
+    StubHandler.latency = args.latency
+    StubHandler.jitter = args.jitter
+    StubHandler.token_delay = args.token_delay
+    StubHandler.reply = build_reply(args.response_words)
+    StubHandler.transcription_latency = args.transcription_latency
+    StubHandler.transcript = build_transcript(args.transcript_words)
+
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"Stub model server listening on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
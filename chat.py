@@ -1,4 +1,5 @@
-from generate import generate_response
+from generate import generate_response, generate_response_stream, agenerate_response, agenerate_response_stream
+from chat_sessions import open_session, build_history, record_turn, session_fields, session_events, asession_events
 
 
 system_prompt = """
@@ -15,7 +16,42 @@ Ensure the markdown is well-structured, professional, and easy to read.
 Note: Always recommend consulting with healthcare professionals for serious concerns.
 """
 
-def chat(user_input):
-    response_data = generate_response(system_prompt, user_input)
+def build_chat_input(user_input, history=""):
+    """Prefix the user message with the conversation so far, if any"""
+    if not history:
+        return user_input
+    return f"{history}\n\nUser Question: {user_input}"
+
+def chat(user_input, session_id=None):
+    requested_id = session_id
+    session_id = open_session(session_id)
+    full_input = build_chat_input(user_input, build_history(session_id))
+    
+    response_data = generate_response(system_prompt, full_input)
+    record_turn(session_id, user_input, response_data['content'])
+    response_data.update(session_fields(requested_id, session_id))
+    return response_data
+
+def chat_stream(user_input, session_id=None):
+    requested_id = session_id
+    session_id = open_session(session_id)
+    full_input = build_chat_input(user_input, build_history(session_id))
+    
+    return session_events(session_id, user_input, generate_response_stream(system_prompt, full_input), requested_id)
+
+async def achat(user_input, session_id=None):
+    requested_id = session_id
+    session_id = open_session(session_id)
+    full_input = build_chat_input(user_input, build_history(session_id))
+    
+    response_data = await agenerate_response(system_prompt, full_input)
+    record_turn(session_id, user_input, response_data['content'])
+    response_data.update(session_fields(requested_id, session_id))
     return response_data
 
+def achat_stream(user_input, session_id=None):
+    requested_id = session_id
+    session_id = open_session(session_id)
+    full_input = build_chat_input(user_input, build_history(session_id))
+    
+    return asession_events(session_id, user_input, agenerate_response_stream(system_prompt, full_input), requested_id)
@@ -0,0 +1,289 @@
+import os
+import time
+import uuid
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from generate import generate_response, count_tokens_accurate
+from scheduler import BULK
+
+# Tokens of conversation (running summary plus recent turns) included in each prompt
+CHAT_HISTORY_TOKENS = int(os.environ.get("CHAT_HISTORY_TOKENS", 2000))
+
+# Target length of the running summary that older turns are folded into
+CHAT_SUMMARY_TOKENS = int(os.environ.get("CHAT_SUMMARY_TOKENS", 400))
+
+# Seconds since last use after which a session expires
+CHAT_SESSION_TTL = float(os.environ.get("CHAT_SESSION_TTL", 3600))
+
+# Bytes of conversation text kept across all sessions before least recently used sessions are dropped
+CHAT_SESSION_MAX_MEMORY_BYTES = int(os.environ.get("CHAT_SESSION_MAX_MEMORY_BYTES", 32 * 1024 * 1024))
+
+# Summaries generated concurrently in the background
+CHAT_SUMMARY_WORKERS = int(os.environ.get("CHAT_SUMMARY_WORKERS", 2))
+
+# session_id a client sends to start a conversation kept on the server
+NEW_SESSION = "new"
+
+summary_system_prompt = f"""
+You maintain a running summary of a conversation between a user and a healthcare assistant.
+
+Merge the new exchanges into the existing summary:
+- Keep everything the user has shared about themselves (symptoms, conditions, medications, history, concerns)
+- Keep the key advice and explanations already given, and any open questions
+- Drop greetings, repetition and formatting
+
+Respond with concise plain-text bullet points only, at most {int(CHAT_SUMMARY_TOKENS * 0.75)} words.
+"""
+
+class ChatSession:
+    """A conversation: a running summary of older turns and the recent turns verbatim"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.summary = ""
+        self.summary_tokens = 0
+        # [(user message, assistant reply, tokens)], oldest first
+        self.turns = []
+        self.turn_count = 0
+        self.folded_turns = 0
+        self.summarizing = False
+        self.size = 0
+        self.created = time.time()
+        self.last_access = self.created
+
+    def turn_tokens(self):
+        return sum(tokens for _, _, tokens in self.turns)
+
+_sessions_lock = threading.Lock()
+# session_id -> ChatSession, least recently used first
+_sessions = OrderedDict()
+_memory_bytes = 0
+_stats = {
+    "summaries": 0,
+    "summary_errors": 0,
+    "evicted": 0,
+    "expired": 0
+}
+_summary_executor = ThreadPoolExecutor(max_workers=max(1, CHAT_SUMMARY_WORKERS), thread_name_prefix="chat-summary")
+
+def _format_turns(turns):
+    return "\n".join(f"User: {user}\nAssistant: {assistant}" for user, assistant, _ in turns)
+
+def _remove(session_id):
+    # Caller must hold _sessions_lock
+    global _memory_bytes
+    session = _sessions.pop(session_id, None)
+    if session is not None:
+        _memory_bytes -= session.size
+
+def _enforce_limits(now):
+    # Caller must hold _sessions_lock
+    expired = [session_id for session_id, session in _sessions.items()
+               if now - session.last_access > CHAT_SESSION_TTL]
+    for session_id in expired:
+        _remove(session_id)
+    _stats["expired"] += len(expired)
+
+    while _memory_bytes > CHAT_SESSION_MAX_MEMORY_BYTES and len(_sessions) > 1:
+        _remove(next(iter(_sessions)))
+        _stats["evicted"] += 1
+
+def _resize(session):
+    # Caller must hold _sessions_lock
+    global _memory_bytes
+    size = len(session.summary.encode("utf-8")) + sum(
+        len(user.encode("utf-8")) + len(assistant.encode("utf-8")) for user, assistant, _ in session.turns)
+    if session.id in _sessions:
+        _memory_bytes += size - session.size
+    session.size = size
+
+def open_session(session_id=None):
+    """
+    Return the ID of an active session, starting a new one if session_id is
+    NEW_SESSION, unknown or expired (session_fields reports the restart)
+
+    Requests without a session_id are stateless: None is returned and no
+    session is kept, so API clients that send their own context do not
+    leave a session behind on every call.
+    """
+    if not session_id:
+        return None
+    now = time.time()
+    with _sessions_lock:
+        _enforce_limits(now)
+        session = _sessions.get(session_id)
+        if session is None:
+            session = ChatSession()
+            _sessions[session.id] = session
+        session.last_access = now
+        _sessions.move_to_end(session.id)
+        return session.id
+
+def build_history(session_id):
+    """
+    Conversation so far, to include in the prompt for the next turn
+
+    The running summary is followed by the most recent turns that fit in
+    CHAT_HISTORY_TOKENS, so prompt size stays bounded however long the
+    conversation runs. Turns that no longer fit are folded into the summary
+    in the background.
+
+    Returns:
+        str: The conversation text, or "" for a new session
+    """
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+        if session is None:
+            return ""
+        summary = session.summary
+        budget = CHAT_HISTORY_TOKENS - session.summary_tokens
+        recent = []
+        for turn in reversed(session.turns):
+            budget -= turn[2]
+            if budget < 0:
+                break
+            recent.append(turn)
+        recent.reverse()
+
+    parts = []
+    if summary:
+        parts.append(f"Summary of the earlier conversation:\n{summary}")
+    if recent:
+        parts.append(f"Recent conversation:\n{_format_turns(recent)}")
+    return "\n\n".join(parts)
+
+def record_turn(session_id, user_input, response_content):
+    """Add a completed turn to a session, folding older turns into the summary if over budget"""
+    if session_id is None:
+        return
+    tokens = count_tokens_accurate(f"User: {user_input}\nAssistant: {response_content}", model="qwen2.5")
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+        if session is None:
+            return
+        session.turns.append((user_input, response_content, tokens))
+        session.turn_count += 1
+        session.last_access = time.time()
+        _resize(session)
+        _enforce_limits(session.last_access)
+        fold = _turns_to_fold(session)
+        if fold:
+            session.summarizing = True
+    if fold:
+        # Attributed to the endpoint that triggered it in metrics and the usage ledger
+        _summary_executor.submit(contextvars.copy_context().run, _fold_turns, session, fold)
+
+def _turns_to_fold(session):
+    """
+    Number of oldest turns to fold into the summary, or 0
+
+    Folding starts once the summary and turns exceed CHAT_HISTORY_TOKENS and
+    brings the turns down to half the remaining budget, so a summary is
+    generated every few turns rather than on every one. Caller must hold
+    _sessions_lock.
+    """
+    if session.summarizing or session.summary_tokens + session.turn_tokens() <= CHAT_HISTORY_TOKENS:
+        return 0
+    target = max(0, CHAT_HISTORY_TOKENS - max(session.summary_tokens, CHAT_SUMMARY_TOKENS)) // 2
+    remaining = session.turn_tokens()
+    count = 0
+    while count < len(session.turns) and remaining > target:
+        remaining -= session.turns[count][2]
+        count += 1
+    return count
+
+def _fold_turns(session, count):
+    """Merge the oldest turns of a session into its running summary"""
+    try:
+        with _sessions_lock:
+            summary = session.summary
+            turns = session.turns[:count]
+        summary_input = f"Existing summary:\n{summary or '(none yet)'}\n\nNew exchanges:\n{_format_turns(turns)}"
+        response_data = generate_response(summary_system_prompt, summary_input, priority=BULK)
+        with _sessions_lock:
+            # Turns added meanwhile were appended after the folded ones
+            session.summary = response_data['content'].strip()
+            session.summary_tokens = response_data['token_usage']['output_tokens']
+            session.turns = session.turns[count:]
+            session.folded_turns += count
+            _resize(session)
+            _stats["summaries"] += 1
+    except Exception as e:
+        print(f"Error summarising chat session {session.id}: {e}")
+        with _sessions_lock:
+            _stats["summary_errors"] += 1
+    finally:
+        with _sessions_lock:
+            session.summarizing = False
+
+def session_fields(requested_id, session_id):
+    """
+    Fields added to a response for its session
+
+    Returns:
+        dict: Empty for a stateless request, otherwise 'session_id' and
+              'session_restarted', which is True when requested_id was
+              unknown or expired and the conversation so far was lost
+    """
+    if session_id is None:
+        return {}
+    return {
+        'session_id': session_id,
+        'session_restarted': requested_id not in (NEW_SESSION, session_id)
+    }
+
+def session_events(session_id, user_input, events, requested_id=None):
+    """Relay generate_response_stream events, recording the turn and adding the session fields to the done event"""
+    for event in events:
+        if event['type'] == 'done':
+            record_turn(session_id, user_input, event['content'])
+            event.update(session_fields(requested_id, session_id))
+        yield event
+
+async def asession_events(session_id, user_input, events, requested_id=None):
+    """Asyncio variant of session_events"""
+    async for event in events:
+        if event['type'] == 'done':
+            record_turn(session_id, user_input, event['content'])
+            event.update(session_fields(requested_id, session_id))
+        yield event
+
+def get_session_info(session_id):
+    """Return metadata for an active session, or None"""
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+        if session is None:
+            return None
+        return {
+            "session_id": session.id,
+            "turns": session.turn_count,
+            "recent_turns": len(session.turns),
+            "folded_turns": session.folded_turns,
+            "history_tokens": session.summary_tokens + session.turn_tokens(),
+            "summary": session.summary,
+            "size": session.size,
+            "created": session.created,
+            "last_access": session.last_access
+        }
+
+def delete_session(session_id):
+    """Forget a session; returns whether it existed"""
+    with _sessions_lock:
+        existed = session_id in _sessions
+        _remove(session_id)
+        return existed
+
+def get_session_stats():
+    """Return session counts, memory usage and summarisation counters"""
+    with _sessions_lock:
+        _enforce_limits(time.time())
+        return {
+            "sessions": len(_sessions),
+            "memory_bytes": _memory_bytes,
+            "max_memory_bytes": CHAT_SESSION_MAX_MEMORY_BYTES,
+            "history_tokens": CHAT_HISTORY_TOKENS,
+            "ttl_seconds": CHAT_SESSION_TTL,
+            **_stats
+        }
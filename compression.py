@@ -0,0 +1,84 @@
+import os
+import zlib
+import functools
+from metrics import record_load
+
+# Set to 0 to send JSON and NDJSON responses uncompressed
+RESPONSE_COMPRESSION = os.environ.get("RESPONSE_COMPRESSION", "1").lower() in ("1", "true", "yes")
+
+# Responses smaller than this many bytes are sent uncompressed; the headers would outweigh the saving
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESSION_MIN_BYTES", 1024))
+
+# Moderate levels: most of the size reduction for a fraction of the CPU of the maximum levels
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson")
+
+@functools.lru_cache(maxsize=None)
+def load_brotli():
+    """The brotli module if installed, else None (responses then fall back to gzip)"""
+    with record_load("brotli"):
+        try:
+            import brotli
+        except ImportError:
+            return None
+        return brotli
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick the content encoding for a response from the Accept-Encoding header
+
+    Returns:
+        str: "br" (if brotli is installed), "gzip", or None for identity
+    """
+    if not RESPONSE_COMPRESSION or not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if accepted.get("br", 0) > 0 and load_brotli() is not None:
+        return "br"
+    if accepted.get("gzip", accepted.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+def compress(body, encoding):
+    """Compress a complete response body with the negotiated encoding"""
+    if encoding == "br":
+        return load_brotli().compress(body, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+class StreamCompressor:
+    """
+    Compress a streamed response piece by piece
+
+    Each piece is flushed as it is compressed, so the client can decode it
+    as soon as it arrives rather than when the stream ends.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = load_brotli().Compressor(quality=BROTLI_QUALITY)
+        else:
+            self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == "br":
+            return self.compressor.process(data) + self.compressor.flush()
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from pdf import content_hash
+from retrieval import remove_index
+
+# Bytes of document text kept in memory before least recently used documents spill to disk
+DOCUMENT_STORE_MAX_MEMORY_BYTES = int(os.environ.get("DOCUMENT_STORE_MAX_MEMORY_BYTES", 64 * 1024 * 1024))
+
+# Directory holding documents spilled from memory
+DOCUMENT_STORE_DIR = os.environ.get("DOCUMENT_STORE_DIR", os.path.join("uploads", "documents"))
+
+# Seconds since last access after which a document expires
+DOCUMENT_STORE_TTL = float(os.environ.get("DOCUMENT_STORE_TTL", 24 * 3600))
+
+_store_lock = threading.Lock()
+# document_id -> text, for documents held in memory, least recently used first
+_memory = OrderedDict()
+# document_id -> {'filename', 'size', 'created', 'last_access'} for every stored document
+_metadata = {}
+_memory_bytes = 0
+
+def _disk_path(document_id):
+    return os.path.join(DOCUMENT_STORE_DIR, f"{document_id}.txt")
+
+def _spill(document_id, text):
+    # Caller must hold _store_lock. The record's retrieval index goes too; it is rebuilt when next asked about
+    remove_index(document_id)
+    try:
+        os.makedirs(DOCUMENT_STORE_DIR, exist_ok=True)
+        tmp_path = f"{_disk_path(document_id)}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, _disk_path(document_id))
+    except OSError as e:
+        print(f"Error spilling document {document_id} to disk: {e}")
+        _metadata.pop(document_id, None)
+
+def _remove(document_id):
+    # Caller must hold _store_lock
+    global _memory_bytes
+    remove_index(document_id)
+    meta = _metadata.pop(document_id, None)
+    if document_id in _memory:
+        del _memory[document_id]
+        _memory_bytes -= meta["size"] if meta else 0
+    try:
+        os.remove(_disk_path(document_id))
+    except OSError:
+        pass
+
+def _enforce_limits(now):
+    # Caller must hold _store_lock
+    global _memory_bytes
+    expired = [document_id for document_id, meta in _metadata.items()
+               if now - meta["last_access"] > DOCUMENT_STORE_TTL]
+    for document_id in expired:
+        _remove(document_id)
+
+    while _memory_bytes > DOCUMENT_STORE_MAX_MEMORY_BYTES and len(_memory) > 1:
+        document_id, text = _memory.popitem(last=False)
+        _memory_bytes -= _metadata[document_id]["size"]
+        _spill(document_id, text)
+
+def put_document(text, filename=None):
+    """
+    Store extracted document text and return its handle
+
+    Identical text always gets the same handle, so re-uploads are stored once.
+
+    Args:
+        text: Extracted document text
+        filename: Original filename, kept for reference
+
+    Returns:
+        str: Document ID to pass to get_document and the medical chat endpoints
+    """
+    global _memory_bytes
+    document_id = content_hash(text.encode("utf-8"))
+    now = time.time()
+    with _store_lock:
+        meta = _metadata.get(document_id)
+        if meta is not None:
+            meta["last_access"] = now
+            if document_id in _memory:
+                _memory.move_to_end(document_id)
+        else:
+            size = len(text.encode("utf-8"))
+            _metadata[document_id] = {
+                "filename": filename,
+                "size": size,
+                "created": now,
+                "last_access": now
+            }
+            _memory[document_id] = text
+            _memory_bytes += size
+        _enforce_limits(now)
+    return document_id
+
+def get_document(document_id):
+    """
+    Return the text of a stored document, or None if unknown or expired
+
+    Documents spilled to disk are loaded back into memory.
+    """
+    global _memory_bytes
+    now = time.time()
+    with _store_lock:
+        meta = _metadata.get(document_id)
+        if meta is None:
+            return None
+        if now - meta["last_access"] > DOCUMENT_STORE_TTL:
+            _remove(document_id)
+            return None
+        meta["last_access"] = now
+
+        text = _memory.get(document_id)
+        if text is not None:
+            _memory.move_to_end(document_id)
+            return text
+
+        try:
+            with open(_disk_path(document_id), 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            _metadata.pop(document_id, None)
+            return None
+        _memory[document_id] = text
+        _memory_bytes += meta["size"]
+        _enforce_limits(now)
+        return text
+
+def get_document_info(document_id):
+    """Return metadata for a stored document, or None"""
+    with _store_lock:
+        meta = _metadata.get(document_id)
+        if meta is None:
+            return None
+        info = dict(meta)
+        info["document_id"] = document_id
+        info["in_memory"] = document_id in _memory
+        return info
+
+def delete_document(document_id):
+    """Remove a document from memory and disk; returns whether it existed"""
+    with _store_lock:
+        existed = document_id in _metadata
+        _remove(document_id)
+        return existed
+
+def get_store_stats():
+    """Return document counts and memory usage"""
+    with _store_lock:
+        _enforce_limits(time.time())
+        return {
+            "documents": len(_metadata),
+            "in_memory": len(_memory),
+            "on_disk": len(_metadata) - len(_memory),
+            "memory_bytes": _memory_bytes,
+            "max_memory_bytes": DOCUMENT_STORE_MAX_MEMORY_BYTES,
+            "ttl_seconds": DOCUMENT_STORE_TTL
+        }
@@ -1,20 +1,16 @@
-from openai import OpenAI
 import os
-import nltk
-from nltk.tokenize import word_tokenize, sent_tokenize
-import json
-from datetime import datetime
 import re
-import tiktoken
+import functools
+import time
+from response_cache import cache_key, get_cached_response, store_cached_response
+from scheduler import model_slot, amodel_slot, INTERACTIVE
+from model_backends import call_model, acall_model, model_stream, amodel_stream
+from metrics import stage, record_stage, record_tokens, record_load, current_endpoint
+from usage_ledger import record_usage, get_totals, reset_totals
 # Note: Qwen tokenizer via transformers removed to avoid dependency conflicts.
 
-# Download required NLTK data
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
-
-client = OpenAI(api_key="dpais", base_url="http://localhost:8553/v1/openai")
+# NLTK and tiktoken are loaded on first use rather than at import, and NLTK data is never
+# downloaded: without a locally installed punkt model, sentences are split with a regex.
 
 # Local deployment - no costs since models run on your hardware
 
@@ -30,35 +26,44 @@ COMMERCIAL_RATES = {
     }
 }
 
-# File to store cumulative cost data
-COST_LOG_FILE = "cost_log.json"
-
 QWEN_TOKENIZER = None
 
 def load_cost_log():
-    """Load cumulative cost data from file"""
-    try:
-        if os.path.exists(COST_LOG_FILE):
-            with open(COST_LOG_FILE, 'r') as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"Error loading cost log: {e}")
-    
-    # Return default structure if file doesn't exist or error
-    return {
-        "total_cost": 0.0,
-        "total_tokens": 0,
-        "total_requests": 0,
-        "last_updated": datetime.now().isoformat()
-    }
+    """Return a snapshot of the cumulative cost data, derived from the usage ledger"""
+    return get_totals()
 
-def save_cost_log(cost_data):
-    """Save cumulative cost data to file"""
+def reset_cost_log():
+    """Reset the cumulative cost data and return the new totals"""
+    return reset_totals()
+
+# Runs of whitespace that collapse to a single space, and punctuation/special
+# characters, matched together so the approximation scans the text once
+_APPROX_TOKEN_PATTERN = re.compile(r'\s{2,}|[^\w\s]')
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model):
+    """
+    Return the cached tiktoken encoding for a model, building it on first use
+
+    Args:
+        model: Model name (gpt-4, gpt-3.5-turbo, qwen2.5, etc.)
+
+    Returns:
+        tiktoken.Encoding, or None when no tokenizer is available for the model
+        and counts should fall back to count_tokens_approximate
+    """
+    # Prefer model-specific tokenizers when available (disabled; using approximate or tiktoken)
+    if model.lower().startswith("qwen"):
+        # No Qwen tokenizer available; fall back
+        return None
+    
     try:
-        with open(COST_LOG_FILE, 'w') as f:
-            json.dump(cost_data, f, indent=2)
+        with record_load(f"tiktoken:{model}"):
+            import tiktoken
+            return tiktoken.encoding_for_model(model)
     except Exception as e:
-        print(f"Error saving cost log: {e}")
+        print(f"Error with tiktoken, falling back to approximation: {e}")
+        return None
 
 def count_tokens_accurate(text, model="gpt-4"):
     """
@@ -75,17 +80,37 @@ def count_tokens_accurate(text, model="gpt-4"):
     if not text:
         return 0
     
-    # Prefer model-specific tokenizers when available (disabled; using approximate or tiktoken)
-    if model.lower().startswith("qwen"):
-        # No Qwen tokenizer available; fall back
+    encoding = get_encoding(model)
+    if encoding is None:
         return count_tokens_approximate(text)
+    return len(encoding.encode(text))
 
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
-    except Exception as e:
-        print(f"Error with tiktoken, falling back to approximation: {e}")
-        return count_tokens_approximate(text)
+def count_tokens_batch(texts, model="gpt-4"):
+    """
+    Count tokens for several texts in one call
+
+    Args:
+        texts: Iterable of texts to tokenize
+        model: Model to use for tokenization
+
+    Returns:
+        list: Token count for each text, in order
+    """
+    texts = [text or "" for text in texts]
+    encoding = get_encoding(model)
+    if encoding is None:
+        return [count_tokens_approximate(text) for text in texts]
+    return [len(tokens) for tokens in encoding.encode_batch(texts)]
+
+@functools.lru_cache(maxsize=128)
+def count_prompt_tokens(system_prompt, model="qwen2.5"):
+    """
+    Memoized token count for static system prompts
+
+    The prompts in chat.py, medical_docs.py and meeting_minutes.py never change,
+    so they are only tokenized once per process.
+    """
+    return count_tokens_accurate(system_prompt, model=model)
 
 def count_tokens_approximate(text):
     """
@@ -95,22 +120,85 @@ def count_tokens_approximate(text):
     if not text:
         return 0
     
-    # Remove extra whitespace and normalize
-    text = re.sub(r'\s+', ' ', text.strip())
+    text = text.strip()
     
-    # Count characters and apply tokenization rules
+    # Count characters as if whitespace runs were collapsed to a single space,
+    # and count special characters and punctuation, in a single pass
     char_count = len(text)
+    special_chars = 0
+    for match in _APPROX_TOKEN_PATTERN.finditer(text):
+        length = match.end() - match.start()
+        if length > 1:
+            char_count -= length - 1
+        else:
+            special_chars += 1
     
     # Rough approximation: 1 token ≈ 4 characters for English text
     # This is more accurate than word counting
     estimated_tokens = char_count / 4
     
     # Add tokens for special characters and punctuation
-    special_chars = len(re.findall(r'[^\w\s]', text))
     estimated_tokens += special_chars * 0.5
     
     return int(estimated_tokens)
 
+# Fallback sentence splitter used when the NLTK punkt model is not installed
+_SENTENCE_BOUNDARY_PATTERN = re.compile(r'(?<=[.!?])\s+|\n{2,}')
+
+@functools.lru_cache(maxsize=None)
+def _nltk_sent_tokenize():
+    """NLTK's sent_tokenize if NLTK and its punkt model are installed locally, else None"""
+    with record_load("nltk_punkt"):
+        try:
+            import nltk
+            nltk.data.find('tokenizers/punkt')
+        except (ImportError, LookupError):
+            return None
+        from nltk.tokenize import sent_tokenize
+        return sent_tokenize
+
+def split_sentences(text):
+    """Split text into sentences, using NLTK punkt when it is available"""
+    sent_tokenize = _nltk_sent_tokenize()
+    if sent_tokenize is not None:
+        try:
+            return sent_tokenize(text)
+        except LookupError:
+            pass
+    return [sentence for sentence in _SENTENCE_BOUNDARY_PATTERN.split(text) if sentence.strip()]
+
+def chunk_text_by_sentences(text, max_tokens, model="qwen2.5"):
+    """
+    Split text into chunks on sentence boundaries within a token budget
+
+    Sentences are never split, so a single sentence longer than max_tokens
+    becomes a chunk of its own.
+
+    Args:
+        text: Text to split
+        max_tokens: Token budget per chunk
+        model: Model to use for tokenization
+
+    Returns:
+        list: Chunks of text, in order
+    """
+    sentences = split_sentences(text)
+    sentence_tokens = count_tokens_batch(sentences, model=model)
+    
+    chunks = []
+    current = []
+    current_tokens = 0
+    for sentence, tokens in zip(sentences, sentence_tokens):
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(" ".join(current))
+            current = []
+            current_tokens = 0
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
 def count_tokens_legacy(text):
     """
     Legacy method using NLTK word tokenization
@@ -120,6 +208,7 @@ def count_tokens_legacy(text):
         return 0
     
     # Tokenize by words
+    from nltk.tokenize import word_tokenize
     word_tokens = word_tokenize(text)
     return len(word_tokens)
 
@@ -172,21 +261,48 @@ def calculate_commercial_cost(input_tokens, output_tokens, commercial_model="gpt
         "output_cost_per_token": rates["output_cost_per_token"]
     }
 
-def generate_response(system_prompt, user_input, audio_duration_minutes=None):
-    response = client.chat.completions.create(
-        model="qwen2.5",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_input},
-        ],
-        stream=False
-    )
+def count_request_tokens(system_prompt, user_input, response_content, usage=None):
+    """
+    Token counts for a completed request
+
+    Args:
+        system_prompt: System prompt sent to the model
+        user_input: User input sent to the model
+        response_content: Full text generated by the model
+        usage: `usage` block reported by the model server, if any
 
-    response_content = response.choices[0].message.content
+    Returns:
+        tuple: (input_tokens, output_tokens)
+    """
+    prompt_tokens = getattr(usage, 'prompt_tokens', None)
+    completion_tokens = getattr(usage, 'completion_tokens', None)
+    
+    if prompt_tokens is not None and completion_tokens is not None:
+        # Prefer the exact counts reported by the model server
+        return prompt_tokens, completion_tokens
     
     # Use accurate token counting with Qwen tokenizer
-    input_tokens = count_tokens_accurate(system_prompt + user_input, model="qwen2.5")
+    input_tokens = count_prompt_tokens(system_prompt, model="qwen2.5") + count_tokens_accurate(user_input, model="qwen2.5")
     output_tokens = count_tokens_accurate(response_content, model="qwen2.5")
+    return input_tokens, output_tokens
+
+def build_response_data(response_content, input_tokens, output_tokens, audio_duration_minutes=None, cached=False, queue_wait=0.0, latency=0.0):
+    """
+    Calculate costs and record a completed response in the usage ledger
+
+    Args:
+        response_content: Full text generated by the model
+        input_tokens: Number of input tokens
+        output_tokens: Number of output tokens
+        audio_duration_minutes: Duration in minutes (for audio models)
+        cached: Whether the response was served from the response cache.
+                Cached responses did not use the model and are not added to the cost totals.
+        queue_wait: Seconds spent waiting for a model slot
+        latency: Seconds taken to produce the response, including queue_wait
+
+    Returns:
+        dict: Response content with token usage and cost information
+    """
     total_tokens = input_tokens + output_tokens
     
     # Calculate local cost
@@ -197,13 +313,13 @@ def generate_response(system_prompt, user_input, audio_duration_minutes=None):
     for model in ["gpt-5", "claude-4-sonnet"]:
         commercial_costs[model] = calculate_commercial_cost(input_tokens, output_tokens, model)
     
-    # Update cumulative cost log
-    cost_log = load_cost_log()
-    cost_log["total_cost"] += cost_data["request_cost"]
-    cost_log["total_tokens"] += total_tokens
-    cost_log["total_requests"] += 1
-    cost_log["last_updated"] = datetime.now().isoformat()
-    save_cost_log(cost_log)
+    # Record the response in the usage ledger; written to disk in the background
+    with stage("cost_log"):
+        cost_log = record_usage(current_endpoint(), "qwen2.5", input_tokens, output_tokens, latency, cached,
+                                cost_data["request_cost"],
+                                {model: costs["total_cost"] for model, costs in commercial_costs.items()},
+                                queue_wait)
+    record_tokens(input_tokens, output_tokens, cached)
     
     return {
         'content': response_content,
@@ -214,7 +330,211 @@ def generate_response(system_prompt, user_input, audio_duration_minutes=None):
         },
         'cost_data': cost_data,
         'commercial_costs': commercial_costs,
-        'cumulative_cost': cost_log["total_cost"]
+        'cumulative_cost': cost_log["total_cost"],
+        'cached': cached,
+        'queue_wait_ms': round(queue_wait * 1000, 2)
     }
 
+def merge_response_data(responses, content):
+    """
+    Combine the response data of several model calls into one
 
+    Token usage and costs are summed across all calls; content is the final
+    text to return.
+
+    Args:
+        responses: Response data dicts returned by generate_response
+        content: Content of the combined response
+
+    Returns:
+        dict: Response data in the same format as generate_response
+    """
+    input_tokens = sum(r['token_usage']['input_tokens'] for r in responses)
+    output_tokens = sum(r['token_usage']['output_tokens'] for r in responses)
+    
+    commercial_costs = {}
+    for model in ["gpt-5", "claude-4-sonnet"]:
+        commercial_costs[model] = calculate_commercial_cost(input_tokens, output_tokens, model)
+    
+    return {
+        'content': content,
+        'token_usage': {
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'total_tokens': input_tokens + output_tokens
+        },
+        'cost_data': {
+            'request_cost': sum(r['cost_data']['request_cost'] for r in responses)
+        },
+        'commercial_costs': commercial_costs,
+        'cumulative_cost': load_cost_log()["total_cost"],
+        'cached': bool(responses) and all(r.get('cached', False) for r in responses),
+        'queue_wait_ms': round(sum(r.get('queue_wait_ms', 0.0) for r in responses), 2),
+        'model_calls': len(responses)
+    }
+
+def generate_response(system_prompt, user_input, audio_duration_minutes=None, priority=INTERACTIVE, use_cache=True):
+    start = time.perf_counter()
+    key = cache_key("qwen2.5", system_prompt, user_input)
+    # Callers that validate the response themselves skip the cache, so a reply they reject is not served again
+    cached = get_cached_response(key) if use_cache else None
+    if cached is not None:
+        return build_response_data(cached["content"], cached["input_tokens"], cached["output_tokens"], audio_duration_minutes, cached=True, latency=time.perf_counter() - start)
+    
+    # Wait for a model slot; interactive requests are admitted ahead of bulk work
+    with model_slot(priority) as queue_wait:
+        # Chat may be hedged across replicas; bulk work is not worth the duplicate load
+        record_stage("queue_wait", queue_wait)
+        with stage("model_call"):
+            response = call_model(lambda client: client.chat.completions.create(
+                model="qwen2.5",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_input},
+                ],
+                stream=False
+            ), hedge=priority == INTERACTIVE)
+
+    response_content = response.choices[0].message.content
+    with stage("token_count"):
+        input_tokens, output_tokens = count_request_tokens(system_prompt, user_input, response_content, response.usage)
+    if use_cache:
+        store_cached_response(key, response_content, input_tokens, output_tokens)
+    
+    return build_response_data(response_content, input_tokens, output_tokens, audio_duration_minutes, queue_wait=queue_wait, latency=time.perf_counter() - start)
+
+def generate_response_stream(system_prompt, user_input, audio_duration_minutes=None, priority=INTERACTIVE, use_cache=True):
+    """
+    Streaming variant of generate_response
+
+    Yields:
+        dict: {'type': 'delta', 'content': ...} for each chunk of generated markdown,
+              followed by a single {'type': 'done', ...} event carrying the same
+              fields returned by generate_response
+    """
+    start = time.perf_counter()
+    key = cache_key("qwen2.5", system_prompt, user_input)
+    cached = get_cached_response(key) if use_cache else None
+    if cached is not None:
+        yield {'type': 'delta', 'content': cached["content"]}
+        response_data = build_response_data(cached["content"], cached["input_tokens"], cached["output_tokens"], audio_duration_minutes, cached=True, latency=time.perf_counter() - start)
+        response_data['type'] = 'done'
+        yield response_data
+        return
+    
+    parts = []
+    usage = None
+    # The model slot is held until the whole response has been streamed
+    with model_slot(priority) as queue_wait, model_stream(lambda client: client.chat.completions.create(
+            model="qwen2.5",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_input},
+            ],
+            stream=True
+        )) as stream:
+        record_stage("queue_wait", queue_wait)
+        stream_start = time.perf_counter()
+        try:
+            for chunk in stream:
+                # Some servers report usage on the final chunk
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield {'type': 'delta', 'content': delta}
+        finally:
+            # Release the connection if the client disconnects mid-stream
+            stream.response.close()
+            record_stage("model_stream", time.perf_counter() - stream_start)
+
+    response_content = "".join(parts)
+    with stage("token_count"):
+        input_tokens, output_tokens = count_request_tokens(system_prompt, user_input, response_content, usage)
+    if use_cache:
+        store_cached_response(key, response_content, input_tokens, output_tokens)
+    
+    response_data = build_response_data(response_content, input_tokens, output_tokens, audio_duration_minutes, queue_wait=queue_wait, latency=time.perf_counter() - start)
+    response_data['type'] = 'done'
+    yield response_data
+
+async def agenerate_response(system_prompt, user_input, audio_duration_minutes=None, priority=INTERACTIVE, use_cache=True):
+    """Asyncio variant of generate_response using the replicas' AsyncOpenAI clients"""
+    start = time.perf_counter()
+    key = cache_key("qwen2.5", system_prompt, user_input)
+    cached = get_cached_response(key) if use_cache else None
+    if cached is not None:
+        return build_response_data(cached["content"], cached["input_tokens"], cached["output_tokens"], audio_duration_minutes, cached=True, latency=time.perf_counter() - start)
+    
+    async with amodel_slot(priority) as queue_wait:
+        record_stage("queue_wait", queue_wait)
+        with stage("model_call"):
+            response = await acall_model(lambda client: client.chat.completions.create(
+                model="qwen2.5",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_input},
+                ],
+                stream=False
+            ), hedge=priority == INTERACTIVE)
+
+    response_content = response.choices[0].message.content
+    with stage("token_count"):
+        input_tokens, output_tokens = count_request_tokens(system_prompt, user_input, response_content, response.usage)
+    if use_cache:
+        store_cached_response(key, response_content, input_tokens, output_tokens)
+    
+    return build_response_data(response_content, input_tokens, output_tokens, audio_duration_minutes, queue_wait=queue_wait, latency=time.perf_counter() - start)
+
+async def agenerate_response_stream(system_prompt, user_input, audio_duration_minutes=None, priority=INTERACTIVE, use_cache=True):
+    """Asyncio variant of generate_response_stream, yielding the same events"""
+    start = time.perf_counter()
+    key = cache_key("qwen2.5", system_prompt, user_input)
+    cached = get_cached_response(key) if use_cache else None
+    if cached is not None:
+        yield {'type': 'delta', 'content': cached["content"]}
+        response_data = build_response_data(cached["content"], cached["input_tokens"], cached["output_tokens"], audio_duration_minutes, cached=True, latency=time.perf_counter() - start)
+        response_data['type'] = 'done'
+        yield response_data
+        return
+    
+    parts = []
+    usage = None
+    async with amodel_slot(priority) as queue_wait, amodel_stream(lambda client: client.chat.completions.create(
+            model="qwen2.5",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_input},
+            ],
+            stream=True
+        )) as stream:
+        record_stage("queue_wait", queue_wait)
+        stream_start = time.perf_counter()
+        try:
+            async for chunk in stream:
+                # Some servers report usage on the final chunk
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield {'type': 'delta', 'content': delta}
+        finally:
+            # Release the connection if the client disconnects mid-stream
+            await stream.response.aclose()
+            record_stage("model_stream", time.perf_counter() - stream_start)
+
+    response_content = "".join(parts)
+    with stage("token_count"):
+        input_tokens, output_tokens = count_request_tokens(system_prompt, user_input, response_content, usage)
+    if use_cache:
+        store_cached_response(key, response_content, input_tokens, output_tokens)
+    
+    response_data = build_response_data(response_content, input_tokens, output_tokens, audio_duration_minutes, queue_wait=queue_wait, latency=time.perf_counter() - start)
+    response_data['type'] = 'done'
+    yield response_data
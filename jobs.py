@@ -0,0 +1,205 @@
+import os
+import time
+import uuid
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Worker threads running background jobs (transcription, meeting minutes)
+JOB_MAX_WORKERS = int(os.environ.get("JOB_MAX_WORKERS", 2))
+
+# Maximum number of queued or running jobs; further submissions are rejected
+JOB_MAX_PENDING = int(os.environ.get("JOB_MAX_PENDING", 32))
+
+# Seconds a finished job and its result are kept before expiring
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", 3600))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+class JobQueueFull(Exception):
+    """Raised when JOB_MAX_PENDING jobs are already queued or running"""
+
+class JobCancelled(Exception):
+    """Raised inside a job function to stop after a cancellation request"""
+
+# The job whose function is running, seen by model calls made on its behalf in any thread
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+def raise_if_cancelled():
+    """Raise JobCancelled if the calling code runs for a job that has been cancelled"""
+    job = _current_job.get()
+    if job is not None and job.cancel_requested:
+        raise JobCancelled()
+
+class Job:
+    """A unit of background work and its progress, result or error"""
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self.future = None
+        self.on_finish = None
+        # Incremented on every change so progress streams can wait for updates
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def update(self, progress=None, message=None):
+        """Report progress from inside a job function"""
+        if self.cancel_requested:
+            raise JobCancelled()
+        with self.changed:
+            if progress is not None:
+                self.progress = progress
+            if message is not None:
+                self.message = message
+            self.version += 1
+            self.changed.notify_all()
+
+    def _set_state(self, status, **fields):
+        with self.changed:
+            self.status = status
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait_for_change(self, version, timeout):
+        """Block until the job changes after version, or timeout; returns the current version"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+    def to_dict(self, include_result=True):
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': round(self.progress, 4),
+            'message': self.message,
+            'created_at': datetime.fromtimestamp(self.created_at).isoformat(),
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat() if self.started_at else None,
+            'finished_at': datetime.fromtimestamp(self.finished_at).isoformat() if self.finished_at else None
+        }
+        if self.status == COMPLETED and include_result:
+            data['result'] = self.result
+        if self.status == FAILED:
+            data['error'] = self.error
+        return data
+
+_executor = ThreadPoolExecutor(max_workers=JOB_MAX_WORKERS, thread_name_prefix="job-worker")
+_jobs_lock = threading.Lock()
+_jobs = {}
+
+def _run(job, func, args, kwargs):
+    # Worker threads keep their context between jobs, so the job is unset when it finishes
+    token = _current_job.set(job)
+    try:
+        if job.cancel_requested:
+            raise JobCancelled()
+        job._set_state(RUNNING, started_at=time.time(), message="Running")
+        result = func(job, *args, **kwargs)
+        job._set_state(COMPLETED, result=result, progress=1.0, message="Completed", finished_at=time.time())
+    except JobCancelled:
+        job._set_state(CANCELLED, message="Cancelled", finished_at=time.time())
+    except Exception as e:
+        job._set_state(FAILED, error=str(e), message="Failed", finished_at=time.time())
+    finally:
+        _current_job.reset(token)
+        _finish(job)
+
+def _finish(job):
+    if job.on_finish is not None:
+        try:
+            job.on_finish()
+        except Exception as e:
+            print(f"Error cleaning up job {job.id}: {e}")
+
+def _expire_jobs():
+    # Caller must hold _jobs_lock
+    now = time.time()
+    expired = [job_id for job_id, job in _jobs.items()
+               if job.finished_at is not None and now - job.finished_at > JOB_RESULT_TTL]
+    for job_id in expired:
+        del _jobs[job_id]
+
+def submit_job(kind, func, *args, on_finish=None, **kwargs):
+    """
+    Queue func(job, *args, **kwargs) on the background worker pool
+
+    Args:
+        kind: Job type reported by the status endpoints
+        func: Job function; receives the Job as first argument and may call
+              job.update() to report progress. Cancellation is honoured there
+              and before each model call the job makes
+        on_finish: Optional cleanup callback run after the job finishes
+
+    Returns:
+        Job: The queued job
+
+    Raises:
+        JobQueueFull: When JOB_MAX_PENDING jobs are already queued or running
+    """
+    job = Job(kind)
+    job.on_finish = on_finish
+    with _jobs_lock:
+        _expire_jobs()
+        # Jobs that are being cancelled are about to stop, so they do not hold up new ones
+        pending = sum(1 for j in _jobs.values() if j.status not in FINISHED_STATES and not j.cancel_requested)
+        if pending >= JOB_MAX_PENDING:
+            raise JobQueueFull(f"Job queue is full ({pending} jobs pending)")
+        _jobs[job.id] = job
+    job.future = _executor.submit(_run, job, func, args, kwargs)
+    return job
+
+def get_job(job_id):
+    """Return the job with job_id, or None if it does not exist or has expired"""
+    with _jobs_lock:
+        _expire_jobs()
+        return _jobs.get(job_id)
+
+def cancel_job(job_id):
+    """
+    Request cancellation of a job
+
+    Queued jobs are cancelled immediately. Running jobs stop at their next
+    progress update or model call.
+
+    Returns:
+        Job: The job, or None if it does not exist
+    """
+    job = get_job(job_id)
+    if job is None or job.status in FINISHED_STATES:
+        return job
+    job.cancel_requested = True
+    if job.future is not None and job.future.cancel():
+        # The job never started, so _run will not clean up after it
+        job._set_state(CANCELLED, message="Cancelled", finished_at=time.time())
+        _finish(job)
+    return job
+
+def get_job_stats():
+    """Return job counts by status"""
+    with _jobs_lock:
+        _expire_jobs()
+        stats = {state: 0 for state in (QUEUED, RUNNING) + FINISHED_STATES}
+        for job in _jobs.values():
+            stats[job.status] += 1
+    stats['max_workers'] = JOB_MAX_WORKERS
+    stats['max_pending'] = JOB_MAX_PENDING
+    return stats
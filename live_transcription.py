@@ -0,0 +1,257 @@
+import os
+import time
+import uuid
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from audio_processing import load_numpy, decode_audio, encode_audio, find_pause, AUDIO_TARGET_SAMPLE_RATE
+from transcription import transcribe_audio, merge_transcripts, TRANSCRIBE_SEGMENT_OVERLAP_SECONDS
+
+# Buffered audio is transcribed once it exceeds this many seconds, split at a pause
+LIVE_SEGMENT_SECONDS = float(os.environ.get("LIVE_SEGMENT_SECONDS", 15))
+
+# Segments of live recordings transcribed concurrently, across all sessions
+LIVE_TRANSCRIBE_WORKERS = int(os.environ.get("LIVE_TRANSCRIBE_WORKERS", 4))
+
+# Recordings in progress at once; further sessions are rejected
+LIVE_MAX_SESSIONS = int(os.environ.get("LIVE_MAX_SESSIONS", 16))
+
+# Seconds since the last chunk or request after which a session expires
+LIVE_SESSION_TTL = float(os.environ.get("LIVE_SESSION_TTL", 3600))
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+class LiveTranscriptionError(Exception):
+    """Raised when a live transcription request cannot be accepted; status_code is the HTTP status to return"""
+    status_code = 400
+
+class LiveSessionLimit(LiveTranscriptionError):
+    """LIVE_MAX_SESSIONS recordings are already in progress"""
+    status_code = 503
+
+class ChunkOutOfOrder(LiveTranscriptionError):
+    """A chunk arrived before the ones preceding it"""
+    status_code = 409
+
+class SessionFinished(LiveTranscriptionError):
+    """A chunk arrived after the recording was finished"""
+    status_code = 409
+
+class LiveSession:
+    """A recording transcribed while it is made: audio not yet sent and the transcripts of its segments"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        # Audio received since the last segment was cut, and its position in the recording in samples
+        self.buffer = None
+        self.buffer_start = 0
+        # End of the previous segment, repeated at the start of the next so words at a cut are not lost
+        self.overlap = None
+        self.next_seq = 0
+        self.received_bytes = 0
+        # [{'index', 'start', 'end', 'status', 'text', 'error'}] in recording order
+        self.segments = []
+        self.finished = False
+        self.created = time.time()
+        self.last_access = self.created
+        # Incremented on every change so transcript streams can wait for updates
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def _notify(self):
+        # Caller must hold self.changed
+        self.version += 1
+        self.changed.notify_all()
+
+    def _complete(self):
+        # Caller must hold self.changed
+        return self.finished and all(segment['status'] != PENDING for segment in self.segments)
+
+    def wait_for_change(self, version, timeout):
+        """Block until the session changes after version, or timeout; returns the current version"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+    def wait_until_complete(self, timeout):
+        """Block until every segment is transcribed after the recording finished, or timeout"""
+        with self.changed:
+            return self.changed.wait_for(self._complete, timeout=timeout)
+
+    def to_dict(self):
+        with self.changed:
+            received_seconds = (self.buffer_start + (len(self.buffer) if self.buffer is not None else 0)) / AUDIO_TARGET_SAMPLE_RATE
+            # The running transcript covers segments up to the first one still in progress
+            texts = []
+            for segment in self.segments:
+                if segment['status'] == PENDING:
+                    break
+                texts.append(segment['text'])
+            return {
+                'session_id': self.id,
+                'status': 'completed' if self._complete() else 'finishing' if self.finished else 'recording',
+                'transcript': merge_transcripts(texts),
+                'segments': [{'start': segment['start'], 'end': segment['end'], 'text': segment['text']}
+                             for segment in self.segments if segment['status'] == DONE],
+                'pending_segments': sum(1 for segment in self.segments if segment['status'] == PENDING),
+                'failed_segments': sum(1 for segment in self.segments if segment['status'] == FAILED),
+                'received_seconds': round(received_seconds, 2),
+                'received_bytes': self.received_bytes,
+                'next_seq': self.next_seq,
+                'version': self.version,
+                'created_at': datetime.fromtimestamp(self.created).isoformat()
+            }
+
+_sessions_lock = threading.Lock()
+_sessions = {}
+_executor = ThreadPoolExecutor(max_workers=max(1, LIVE_TRANSCRIBE_WORKERS), thread_name_prefix="live-transcribe")
+
+def _expire_sessions():
+    # Caller must hold _sessions_lock
+    now = time.time()
+    expired = [session_id for session_id, session in _sessions.items() if now - session.last_access > LIVE_SESSION_TTL]
+    for session_id in expired:
+        del _sessions[session_id]
+
+def start_session():
+    """
+    Start a live transcription session
+
+    Raises:
+        LiveSessionLimit: When LIVE_MAX_SESSIONS recordings are already in progress
+    """
+    session = LiveSession()
+    with _sessions_lock:
+        _expire_sessions()
+        recording = sum(1 for s in _sessions.values() if not s.finished)
+        if recording >= LIVE_MAX_SESSIONS:
+            raise LiveSessionLimit(f"Too many live recordings in progress ({recording})")
+        _sessions[session.id] = session
+    return session
+
+def get_session(session_id):
+    """Return the live session with session_id, or None if it does not exist or has expired"""
+    with _sessions_lock:
+        _expire_sessions()
+        session = _sessions.get(session_id)
+        if session is not None:
+            session.last_access = time.time()
+        return session
+
+def _cut_segment(session, end):
+    """
+    Queue buffer[:end] for transcription and keep the rest buffered
+
+    Caller must hold session.changed.
+    """
+    np = load_numpy()
+    audio = session.buffer[:end]
+    overlap = session.overlap if session.overlap is not None else audio[:0]
+    segment = {
+        'index': len(session.segments),
+        'start': round((session.buffer_start - len(overlap)) / AUDIO_TARGET_SAMPLE_RATE, 2),
+        'end': round((session.buffer_start + end) / AUDIO_TARGET_SAMPLE_RATE, 2),
+        'status': PENDING,
+        'text': None,
+        'error': None
+    }
+    session.segments.append(segment)
+    wav = encode_audio(np.concatenate((overlap, audio)))
+    overlap_length = int(TRANSCRIBE_SEGMENT_OVERLAP_SECONDS * AUDIO_TARGET_SAMPLE_RATE)
+    session.overlap = audio[-overlap_length:] if overlap_length else None
+    session.buffer = session.buffer[end:]
+    session.buffer_start += end
+    # Attributed to the endpoint that received the chunk in metrics and the usage ledger
+    _executor.submit(contextvars.copy_context().run, _transcribe_segment, session, segment, wav)
+
+def _transcribe_segment(session, segment, wav):
+    try:
+        text = transcribe_audio(wav, f"live_{session.id}_{segment['index']}.wav")['transcript']
+        status, error = DONE, None
+    except Exception as e:
+        print(f"Error transcribing live segment {segment['index']} of session {session.id}: {e}")
+        text, status, error = "", FAILED, str(e)
+    with session.changed:
+        segment.update(status=status, text=text, error=error)
+        session._notify()
+
+def add_chunk(session, seq, audio_bytes):
+    """
+    Append a chunk of a recording to a live session
+
+    Chunks are numbered from 0 and must arrive in order; a chunk that was
+    already received (a retried upload) is ignored. Whenever more than
+    LIVE_SEGMENT_SECONDS are buffered, audio up to a pause is cut off and
+    transcribed in the background.
+
+    Args:
+        session: LiveSession
+        seq: Chunk number
+        audio_bytes: PCM WAV audio
+
+    Returns:
+        dict: The session state
+
+    Raises:
+        ChunkOutOfOrder: If chunks before seq are missing
+        SessionFinished: If the recording was already finished
+        LiveTranscriptionError: If the audio cannot be decoded
+    """
+    np = load_numpy()
+    with session.changed:
+        if seq < session.next_seq:
+            return session.to_dict()
+        if session.finished:
+            raise SessionFinished("Recording already finished")
+        if seq > session.next_seq:
+            raise ChunkOutOfOrder(f"Expected chunk {session.next_seq}, got {seq}")
+
+    try:
+        samples = decode_audio(audio_bytes)
+    except Exception as e:
+        raise LiveTranscriptionError(f"Could not decode audio chunk: {e}")
+
+    with session.changed:
+        # Another upload of the same chunk may have been accepted while this one was decoding
+        if seq != session.next_seq or session.finished:
+            return session.to_dict()
+        session.buffer = samples if session.buffer is None else np.concatenate((session.buffer, samples))
+        session.next_seq += 1
+        session.received_bytes += len(audio_bytes)
+        while True:
+            cut = find_pause(session.buffer, LIVE_SEGMENT_SECONDS)
+            if cut is None:
+                break
+            _cut_segment(session, cut)
+        session._notify()
+    return session.to_dict()
+
+def finish_session(session):
+    """Mark a recording as finished and transcribe the audio still buffered"""
+    with session.changed:
+        if not session.finished:
+            if session.buffer is not None and len(session.buffer):
+                _cut_segment(session, len(session.buffer))
+            session.finished = True
+            session._notify()
+    return session.to_dict()
+
+def get_live_stats():
+    """Return live session counts and segments waiting for transcription"""
+    with _sessions_lock:
+        _expire_sessions()
+        sessions = list(_sessions.values())
+    pending = 0
+    for session in sessions:
+        with session.changed:
+            pending += sum(1 for segment in session.segments if segment['status'] == PENDING)
+    return {
+        "sessions": len(sessions),
+        "recording": sum(1 for session in sessions if not session.finished),
+        "pending_segments": pending,
+        "max_sessions": LIVE_MAX_SESSIONS,
+        "segment_seconds": LIVE_SEGMENT_SECONDS
+    }
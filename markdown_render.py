@@ -0,0 +1,151 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from metrics import record_load
+
+# Rendered HTML kept for recently rendered markdown (least recently used are evicted first); 0 disables the cache
+MARKDOWN_CACHE_MAX_ENTRIES = int(os.environ.get("MARKDOWN_CACHE_MAX_ENTRIES", 256))
+
+# Set to 0 to send only raw markdown in streamed delta events
+MARKDOWN_STREAM_HTML = os.environ.get("MARKDOWN_STREAM_HTML", "1").lower() in ("1", "true", "yes")
+
+# Minimum milliseconds between renderings of a stream's unfinished last block
+MARKDOWN_STREAM_INTERVAL_MS = int(os.environ.get("MARKDOWN_STREAM_INTERVAL_MS", 100))
+
+MARKDOWN_EXTENSIONS = ['tables', 'fenced_code', 'nl2br']
+
+# A line that may continue the block before it even after a blank line: indented, or a list item
+_CONTINUATION_PATTERN = re.compile(r"[ \t]|[-*+][ \t]|\d+[.)][ \t]")
+_FENCE_PATTERN = re.compile(r"(```|~~~)")
+
+_markdown = None
+_local = threading.local()
+_cache_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_stats = {
+    "hits": 0,
+    "misses": 0,
+    "evictions": 0
+}
+
+def load_markdown():
+    """The markdown package, imported on first use to keep it out of startup"""
+    global _markdown
+    if _markdown is None:
+        with record_load("markdown"):
+            import markdown
+        _markdown = markdown
+    return _markdown
+
+def _renderer():
+    """
+    This thread's Markdown instance
+
+    Building a Markdown instance loads and configures every extension, so
+    each thread keeps one and resets it between documents instead.
+    """
+    renderer = getattr(_local, "renderer", None)
+    if renderer is None:
+        renderer = load_markdown().Markdown(extensions=MARKDOWN_EXTENSIONS)
+        _local.renderer = renderer
+    return renderer
+
+def _convert(text):
+    return _renderer().reset().convert(text)
+
+def render_markdown(text):
+    """Render markdown to HTML, reusing the HTML of identical documents rendered recently"""
+    if MARKDOWN_CACHE_MAX_ENTRIES <= 0:
+        return _convert(text)
+
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    with _cache_lock:
+        html = _cache.get(key)
+        if html is not None:
+            _cache.move_to_end(key)
+            _cache_stats["hits"] += 1
+            return html
+        _cache_stats["misses"] += 1
+
+    html = _convert(text)
+    with _cache_lock:
+        _cache[key] = html
+        _cache.move_to_end(key)
+        while len(_cache) > MARKDOWN_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+            _cache_stats["evictions"] += 1
+    return html
+
+def get_render_stats():
+    """Return markdown render cache hit/miss counters and size"""
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats["entries"] = len(_cache)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["max_entries"] = MARKDOWN_CACHE_MAX_ENTRIES
+    return stats
+
+class StreamRenderer:
+    """
+    Render a markdown document as it is generated
+
+    Finished blocks are rendered once; only the trailing block, which may
+    still change, is rendered again as text arrives, at most every
+    MARKDOWN_STREAM_INTERVAL_MS. A block is finished once a blank line is
+    followed by a line that starts a new block, outside a fenced code block.
+    The finished blocks followed by the trailing block render to the same
+    HTML as the whole document.
+    """
+
+    def __init__(self):
+        self.text = ""
+        # Length of the text whose blocks are finished and rendered
+        self.rendered = 0
+        self.tail_rendered_at = 0.0
+
+    def _block_end(self):
+        """Offset in self.text where the unfinished trailing block starts"""
+        boundary = self.rendered
+        in_fence = False
+        previous_blank = False
+        position = self.rendered
+        # The last line may be incomplete, so only complete lines are examined
+        for line in self.text[self.rendered:].splitlines(keepends=True):
+            if not line.endswith("\n"):
+                break
+            stripped = line.strip()
+            if not in_fence and previous_blank and stripped and not _CONTINUATION_PATTERN.match(line):
+                boundary = position
+            if _FENCE_PATTERN.match(stripped):
+                in_fence = not in_fence
+            previous_blank = not stripped
+            position += len(line)
+        return boundary
+
+    def feed(self, delta):
+        """
+        Add generated markdown
+
+        Returns:
+            tuple: (HTML of blocks finished by this delta, to append to what
+                    was shown before; HTML of the unfinished trailing block,
+                    replacing the previous trailing HTML, or None if it was
+                    rendered too recently to render again)
+        """
+        self.text += delta
+        end = self._block_end()
+        finished_html = ""
+        if end > self.rendered:
+            # Blocks of one document are separated by a newline
+            finished_html = _convert(self.text[self.rendered:end]) + "\n"
+            self.rendered = end
+
+        now = time.monotonic()
+        if not finished_html and now - self.tail_rendered_at < MARKDOWN_STREAM_INTERVAL_MS / 1000:
+            return finished_html, None
+        self.tail_rendered_at = now
+        return finished_html, _convert(self.text[self.rendered:])
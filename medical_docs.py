@@ -1,4 +1,9 @@
-from generate import generate_response
+import asyncio
+from generate import generate_response, generate_response_stream, agenerate_response, agenerate_response_stream
+from retrieval import retrieve_passages, index_document
+from document_store import get_document
+from metrics import stage
+from chat_sessions import open_session, build_history, record_turn, session_fields, session_events, asession_events
 
 system_prompt = """
 You are an experienced healthcare assistant that specializes in analyzing medical documents and providing insights.
@@ -20,9 +25,72 @@ Respond in properly formatted markdown that includes:
 Always recommend consulting with healthcare professionals for medical decisions.
 """
 
-def medical_docs(user_input, medical_history=""):
-    # Combine user input with medical history context
-    full_input = f"Medical History Context: {medical_history}\n\nUser Question: {user_input}"
+class DocumentNotFound(Exception):
+    """Raised when a document_id is no longer stored; status_code is the HTTP status to return"""
+    status_code = 404
+
+def build_medical_input(user_input, medical_history="", document_id=None, history=""):
+    """
+    Combine the user question with medical record context and the conversation so far
+
+    With a document_id, only the passages of the indexed record relevant to the
+    question are included, so prompt size stays bounded however large the record is.
+
+    Raises:
+        DocumentNotFound: If document_id is not stored and no medical_history was given
+    """
+    if document_id:
+        with stage("retrieval"):
+            try:
+                medical_history = "\n...\n".join(retrieve_passages(document_id, user_input))
+            except KeyError:
+                # The index may have been evicted; rebuild it from the document store
+                text = get_document(document_id)
+                if text is not None:
+                    index_document(text, document_id)
+                    medical_history = "\n...\n".join(retrieve_passages(document_id, user_input))
+                elif not medical_history:
+                    raise DocumentNotFound("Medical record not found; please upload it again") from None
+    
+    if history:
+        return f"Medical History Context: {medical_history}\n\n{history}\n\nUser Question: {user_input}"
+    return f"Medical History Context: {medical_history}\n\nUser Question: {user_input}"
+
+def medical_docs(user_input, medical_history="", document_id=None, session_id=None):
+    requested_id = session_id
+    session_id = open_session(session_id)
+    # Combine user input with medical history context and earlier turns
+    full_input = build_medical_input(user_input, medical_history, document_id, build_history(session_id))
     
     response_data = generate_response(system_prompt, full_input)
+    record_turn(session_id, user_input, response_data['content'])
+    response_data.update(session_fields(requested_id, session_id))
+    return response_data
+
+def medical_docs_stream(user_input, medical_history="", document_id=None, session_id=None):
+    requested_id = session_id
+    session_id = open_session(session_id)
+    full_input = build_medical_input(user_input, medical_history, document_id, build_history(session_id))
+    
+    return session_events(session_id, user_input, generate_response_stream(system_prompt, full_input), requested_id)
+
+async def amedical_docs(user_input, medical_history="", document_id=None, session_id=None):
+    requested_id = session_id
+    session_id = open_session(session_id)
+    # Retrieval may rebuild an index or read the record from disk, so it runs off the event loop
+    full_input = await asyncio.to_thread(build_medical_input, user_input, medical_history, document_id,
+                                         build_history(session_id))
+    
+    response_data = await agenerate_response(system_prompt, full_input)
+    record_turn(session_id, user_input, response_data['content'])
+    response_data.update(session_fields(requested_id, session_id))
     return response_data
+
+async def amedical_docs_stream(user_input, medical_history="", document_id=None, session_id=None):
+    requested_id = session_id
+    session_id = open_session(session_id)
+    full_input = await asyncio.to_thread(build_medical_input, user_input, medical_history, document_id,
+                                         build_history(session_id))
+    
+    async for event in asession_events(session_id, user_input, agenerate_response_stream(system_prompt, full_input), requested_id):
+        yield event
@@ -1,4 +1,34 @@
-from generate import generate_response
+import os
+import json
+import time
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from generate import (generate_response, generate_response_stream, agenerate_response,
+                      agenerate_response_stream, count_tokens_accurate, chunk_text_by_sentences,
+                      merge_response_data)
+from scheduler import BULK
+
+# Transcripts longer than this many tokens are summarised chunk by chunk
+MINUTES_CHUNK_TOKENS = int(os.environ.get("MINUTES_CHUNK_TOKENS", 3000))
+
+# Maximum number of chunk summaries generated concurrently
+MINUTES_MAX_WORKERS = int(os.environ.get("MINUTES_MAX_WORKERS", 4))
+
+# Discussion points kept in incremental minutes; related points are combined beyond this
+MINUTES_MAX_POINTS = int(os.environ.get("MINUTES_MAX_POINTS", 20))
+
+# Seconds since the last update after which a meeting's incremental minutes are dropped
+MINUTES_MEETING_TTL = float(os.environ.get("MINUTES_MEETING_TTL", 6 * 3600))
+
+# Meetings whose incremental minutes are kept; the least recently updated are dropped beyond this
+MINUTES_MAX_MEETINGS = int(os.environ.get("MINUTES_MAX_MEETINGS", 64))
+
+# Words of already processed transcript repeated before new text, so sentences cut at an update keep their context
+MINUTES_CONTEXT_WORDS = 50
 
 system_prompt = """
 You are an expert at creating professional meeting minutes from transcripts.
@@ -21,7 +51,321 @@ Format the output in clean markdown with:
 Focus on extracting actionable insights and important decisions from the transcript.
 """
 
-def meeting_minutes(transcript):
-    response_data = generate_response(system_prompt, transcript)
-    return response_data
+chunk_system_prompt = """
+You are summarising one part of a longer meeting transcript. Other parts are summarised separately.
+
+Write concise notes in markdown covering only this part:
+- Attendees mentioned
+- Key discussion points
+- Action items with assignees and deadlines (as stated; write "Not specified" if missing)
+- Decisions made
+- Next steps
+
+Do not invent information and do not write a meeting title or introduction.
+"""
+
+reduce_system_prompt = system_prompt + """
+The input consists of notes summarising consecutive parts of one meeting, in order.
+Merge them into a single set of meeting minutes, combining duplicate attendees,
+discussion points and action items.
+"""
+
+incremental_system_prompt = f"""
+You keep the minutes of a meeting that is still in progress.
+
+You receive the current minutes as JSON, the end of the transcript already covered by them
+(for context only), and the next part of the transcript. Update the minutes with what is
+said in the next part:
+- Add new attendees, discussion points, action items, decisions and next steps
+- Change existing entries only where the next part changes them (for example an action
+  item that is reassigned, given a deadline or completed)
+- Combine duplicates, and keep at most {MINUTES_MAX_POINTS} concise discussion points by merging related ones
+- Write "Not specified" for a missing assignee or deadline, and "Open" or "Done" as status
+- Do not invent information
+
+Respond with only the updated JSON object, with exactly these keys:
+{{"title": "", "attendees": [], "discussion_points": [], "action_items": [{{"task": "", "assignee": "", "deadline": "", "status": ""}}], "decisions": [], "next_steps": []}}
+"""
+
+def summarise_chunks(chunks, on_progress=None):
+    """
+    Summarise transcript chunks concurrently
+
+    Args:
+        chunks: Transcript chunks
+        on_progress: Optional callback(completed, total) called as chunks finish
+
+    Returns:
+        list: Response data for each chunk, in chunk order
+    """
+    workers = max(1, min(MINUTES_MAX_WORKERS, len(chunks)))
+    responses = [None] * len(chunks)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="minutes-chunk") as executor:
+        # Run each chunk in a copy of the caller's context so its metrics are labelled with the endpoint
+        futures = {executor.submit(contextvars.copy_context().run, generate_response, chunk_system_prompt, chunk, priority=BULK): i
+                   for i, chunk in enumerate(chunks)}
+        try:
+            for completed, future in enumerate(as_completed(futures), start=1):
+                responses[futures[future]] = future.result()
+                if on_progress is not None:
+                    on_progress(completed, len(chunks))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return responses
+
+def build_reduce_input(chunk_responses):
+    return "\n\n".join(
+        f"### Part {i} of {len(chunk_responses)}\n{response['content']}"
+        for i, response in enumerate(chunk_responses, start=1)
+    )
+
+def split_transcript(transcript):
+    """Return transcript chunks, or None when it fits in a single prompt"""
+    if count_tokens_accurate(transcript, model="qwen2.5") <= MINUTES_CHUNK_TOKENS:
+        return None
+    chunks = chunk_text_by_sentences(transcript, MINUTES_CHUNK_TOKENS)
+    return chunks if len(chunks) > 1 else None
+
+def meeting_minutes(transcript, on_progress=None):
+    chunks = split_transcript(transcript)
+    if chunks is None:
+        response_data = generate_response(system_prompt, transcript, priority=BULK)
+        return response_data
+    
+    # Map: summarise chunks in parallel, then reduce the notes into the final minutes
+    chunk_responses = summarise_chunks(chunks, on_progress)
+    reduce_response = generate_response(reduce_system_prompt, build_reduce_input(chunk_responses), priority=BULK)
+    
+    return merge_response_data(chunk_responses + [reduce_response], reduce_response['content'])
+
+def meeting_minutes_stream(transcript):
+    chunks = split_transcript(transcript)
+    if chunks is None:
+        yield from generate_response_stream(system_prompt, transcript, priority=BULK)
+        return
+    
+    # The map phase is not streamed; the reduce pass streams the final minutes
+    chunk_responses = summarise_chunks(chunks)
+    for event in generate_response_stream(reduce_system_prompt, build_reduce_input(chunk_responses), priority=BULK):
+        if event['type'] == 'done':
+            event = merge_response_data(chunk_responses + [event], event['content'])
+            event['type'] = 'done'
+        yield event
+
+async def asummarise_chunks(chunks):
+    """Asyncio variant of summarise_chunks, bounded by MINUTES_MAX_WORKERS"""
+    semaphore = asyncio.Semaphore(max(1, MINUTES_MAX_WORKERS))
+    
+    async def summarise(chunk):
+        async with semaphore:
+            return await agenerate_response(chunk_system_prompt, chunk, priority=BULK)
+    
+    return await asyncio.gather(*(summarise(chunk) for chunk in chunks))
+
+async def ameeting_minutes(transcript):
+    # Counting the tokens of a long transcript is CPU-bound, so it runs off the event loop
+    chunks = await asyncio.to_thread(split_transcript, transcript)
+    if chunks is None:
+        return await agenerate_response(system_prompt, transcript, priority=BULK)
+    
+    chunk_responses = await asummarise_chunks(chunks)
+    reduce_response = await agenerate_response(reduce_system_prompt, build_reduce_input(chunk_responses), priority=BULK)
+    
+    return merge_response_data(chunk_responses + [reduce_response], reduce_response['content'])
+
+async def ameeting_minutes_stream(transcript):
+    chunks = await asyncio.to_thread(split_transcript, transcript)
+    if chunks is None:
+        async for event in agenerate_response_stream(system_prompt, transcript, priority=BULK):
+            yield event
+        return
+    
+    chunk_responses = await asummarise_chunks(chunks)
+    async for event in agenerate_response_stream(reduce_system_prompt, build_reduce_input(chunk_responses), priority=BULK):
+        if event['type'] == 'done':
+            event = merge_response_data(chunk_responses + [event], event['content'])
+            event['type'] = 'done'
+        yield event
+
+class MeetingState:
+    """Structured minutes of a meeting in progress and how much of its transcript they cover"""
+
+    def __init__(self, meeting_id):
+        self.id = meeting_id
+        self.minutes = {
+            "title": "",
+            "attendees": [],
+            "discussion_points": [],
+            "action_items": [],
+            "decisions": [],
+            "next_steps": []
+        }
+        self.processed_words = 0
+        self.context = ""
+        self.updates = 0
+        self.created = time.time()
+        self.last_access = self.created
+        # Held while the minutes are updated, so concurrent refreshes do not process the same text twice
+        self.lock = threading.Lock()
+
+_meetings_lock = threading.Lock()
+# meeting_id -> MeetingState, least recently used first
+_meetings = OrderedDict()
+
+def _get_meeting(meeting_id):
+    now = time.time()
+    with _meetings_lock:
+        expired = [key for key, meeting in _meetings.items() if now - meeting.last_access > MINUTES_MEETING_TTL]
+        for key in expired:
+            del _meetings[key]
+        meeting = _meetings.get(meeting_id)
+        if meeting is None:
+            meeting = MeetingState(meeting_id)
+            _meetings[meeting_id] = meeting
+        meeting.last_access = now
+        _meetings.move_to_end(meeting_id)
+        while len(_meetings) > MINUTES_MAX_MEETINGS:
+            _meetings.popitem(last=False)
+        return meeting
+
+def _text_list(value):
+    if not isinstance(value, list):
+        return []
+    return [str(item).strip() for item in value if str(item).strip()]
+
+def parse_minutes_state(content):
+    """
+    Parse the JSON minutes returned for an incremental update
+
+    Raises:
+        ValueError: If the response does not contain a JSON object
+    """
+    start, end = content.find("{"), content.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("Minutes update did not contain a JSON object")
+    data = json.loads(content[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("Minutes update was not a JSON object")
+
+    action_items = []
+    for item in data.get("action_items") or []:
+        if isinstance(item, dict) and str(item.get("task", "")).strip():
+            action_items.append({
+                field: str(item.get(field) or default).strip()
+                for field, default in (("task", ""), ("assignee", "Not specified"),
+                                       ("deadline", "Not specified"), ("status", "Open"))
+            })
+    return {
+        "title": str(data.get("title") or "").strip(),
+        "attendees": _text_list(data.get("attendees")),
+        "discussion_points": _text_list(data.get("discussion_points"))[:MINUTES_MAX_POINTS],
+        "action_items": action_items,
+        "decisions": _text_list(data.get("decisions")),
+        "next_steps": _text_list(data.get("next_steps"))
+    }
+
+def render_minutes(minutes, date=None):
+    """Render structured minutes in the markdown layout of the generated minutes"""
+    def table_cell(text):
+        return text.replace("|", "\\|").replace("\n", " ")
+
+    def bullets(items):
+        return "\n".join(f"- {item}" for item in items) if items else "- None recorded yet"
+
+    lines = [
+        "## Meeting Minutes",
+        f"**{minutes['title'] or 'Meeting'}** - {date or datetime.now().strftime('%Y-%m-%d')}",
+        "",
+        "## Attendees",
+        bullets(minutes["attendees"]) if minutes["attendees"] else "- Not specified",
+        "",
+        "## Discussion Points",
+        bullets(minutes["discussion_points"]),
+        "",
+        "## Action Items",
+    ]
+    if minutes["action_items"]:
+        lines += ["| Task | Assignee | Deadline | Status |", "| --- | --- | --- | --- |"]
+        lines += [f"| {table_cell(item['task'])} | {table_cell(item['assignee'])} | "
+                  f"{table_cell(item['deadline'])} | {table_cell(item['status'])} |"
+                  for item in minutes["action_items"]]
+    else:
+        lines.append("- None recorded yet")
+    lines += ["", "## Decisions", bullets(minutes["decisions"]), "", "## Next Steps", bullets(minutes["next_steps"])]
+    return "\n".join(lines)
+
+def build_incremental_input(minutes, context, new_text):
+    return (f"Current minutes:\n{json.dumps(minutes, ensure_ascii=False)}\n\n"
+            f"End of the transcript already covered:\n{context or '(start of meeting)'}\n\n"
+            f"Next part of the transcript:\n{new_text}")
+
+def update_meeting_minutes(meeting_id, transcript):
+    """
+    Bring a meeting's minutes up to date with its transcript so far
+
+    Only the words appended since the last update are sent to the model,
+    together with the current structured minutes, so each refresh costs
+    about the same however long the meeting has run. Long additions are
+    processed in MINUTES_CHUNK_TOKENS parts.
+
+    Args:
+        meeting_id: Meeting whose minutes to update; new IDs start empty minutes
+        transcript: The meeting's full transcript so far
+
+    Returns:
+        dict: Response data as returned by generate_response (token usage
+              summed over this update's model calls) with the rendered
+              markdown as 'content', plus 'meeting_id', 'minutes_state',
+              'processed_words' and 'new_words', and a 'warning' when a
+              model reply could not be parsed and the previous minutes
+              were kept
+    """
+    meeting = _get_meeting(meeting_id)
+    with meeting.lock:
+        words = transcript.split()
+        new_words = words[meeting.processed_words:]
+        responses = []
+        warning = None
+        if new_words:
+            new_text = " ".join(new_words)
+            chunks = split_transcript(new_text) or [new_text]
+            for chunk in chunks:
+                # Uncached: a reply that does not parse must not be served again when the update is retried
+                response_data = generate_response(incremental_system_prompt,
+                                                  build_incremental_input(meeting.minutes, meeting.context, chunk),
+                                                  priority=BULK, use_cache=False)
+                responses.append(response_data)
+                try:
+                    minutes = parse_minutes_state(response_data['content'])
+                except ValueError as e:
+                    # Keep the last good minutes; the words not yet covered are sent again on the next update
+                    print(f"Error parsing minutes update for meeting {meeting.id}: {e}")
+                    warning = "The minutes could not be updated with the latest part of the meeting; showing the last good minutes"
+                    break
+                # State advances chunk by chunk, so a failure part way keeps the progress made
+                meeting.minutes = minutes
+                meeting.context = " ".join((meeting.context.split() + chunk.split())[-MINUTES_CONTEXT_WORDS:])
+                meeting.processed_words += len(chunk.split())
+                meeting.updates += 1
+            else:
+                # Sentence chunking may re-space the text; the whole addition is covered now
+                meeting.processed_words = len(words)
+
+        response_data = merge_response_data(responses, render_minutes(meeting.minutes,
+                                                                      datetime.fromtimestamp(meeting.created).strftime('%Y-%m-%d')))
+        response_data.update({
+            'meeting_id': meeting.id,
+            'minutes_state': meeting.minutes,
+            'processed_words': meeting.processed_words,
+            'new_words': len(new_words)
+        })
+        if warning:
+            response_data['warning'] = warning
+        return response_data
 
+def delete_meeting_minutes(meeting_id):
+    """Forget a meeting's incremental minutes; returns whether they existed"""
+    with _meetings_lock:
+        return _meetings.pop(meeting_id, None) is not None
@@ -0,0 +1,198 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Add a Server-Timing header with the per-stage timings to API responses
+METRICS_SERVER_TIMING = os.environ.get("METRICS_SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+
+# Histogram bucket upper bounds in seconds, from cache hits up to long model calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+METRIC_PREFIX = "healthcare"
+
+# Label for work done outside a request, such as background jobs
+BACKGROUND = "background"
+
+# Endpoint being served and the stage timings recorded for it, for the current request
+_endpoint = contextvars.ContextVar("metrics_endpoint", default=BACKGROUND)
+_timings = contextvars.ContextVar("metrics_timings", default=None)
+
+_lock = threading.Lock()
+# (name, labels) -> [bucket counts..., +Inf count], sum
+_histograms = {}
+# (name, labels) -> value
+_counters = {}
+_help = {}
+# name -> (help, function returning [(labels dict, value)]) evaluated at scrape time
+_gauges = {}
+# name -> seconds spent loading a deferred module or resource
+_load_times = {}
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+def observe(name, seconds, help_text="", **labels):
+    """Record one observation in a latency histogram"""
+    key = (name, _labels(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0]
+            _help.setdefault(name, help_text)
+        counts = histogram[0]
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        histogram[1] += seconds
+
+def increment(name, amount=1, help_text="", **labels):
+    """Add to a counter"""
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+        _help.setdefault(name, help_text)
+
+@contextmanager
+def record_load(name):
+    """Time the one-off loading of a module or resource (deferred imports, tokenizers) for startup reporting"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_load_time(name, time.perf_counter() - start)
+
+def add_load_time(name, seconds):
+    with _lock:
+        _load_times[name] = _load_times.get(name, 0.0) + seconds
+
+def get_load_times():
+    """Seconds spent loading each deferred module or resource so far, including app import"""
+    with _lock:
+        return {name: round(seconds, 4) for name, seconds in _load_times.items()}
+
+def register_gauge(name, help_text, collect):
+    """Register a gauge whose values are read at scrape time; collect returns [(labels dict, value)]"""
+    _gauges[name] = (help_text, collect)
+
+def current_endpoint():
+    return _endpoint.get()
+
+def begin_request(endpoint):
+    """Start collecting metrics for a request; returns its start time"""
+    _endpoint.set(endpoint)
+    _timings.set([])
+    return time.perf_counter()
+
+def end_request(endpoint, status_code, start):
+    """Record a finished request's latency and status"""
+    observe("request_seconds", time.perf_counter() - start,
+            "Time from receiving a request to returning its response headers", endpoint=endpoint)
+    increment("requests_total", help_text="Requests served", endpoint=endpoint, status=str(status_code))
+    if status_code >= 500:
+        increment("request_errors_total", help_text="Requests that failed with a server error", endpoint=endpoint)
+
+def record_stage(stage_name, seconds):
+    """Record time spent in a stage of the current request"""
+    observe("stage_seconds", seconds, "Time spent in each processing stage", stage=stage_name, endpoint=_endpoint.get())
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage_name, seconds))
+
+@contextmanager
+def stage(stage_name):
+    """Time the enclosed block as a stage of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage_name, time.perf_counter() - start)
+
+def record_tokens(input_tokens, output_tokens, cached=False):
+    """Count a model call and its tokens against the current endpoint"""
+    endpoint = _endpoint.get()
+    increment("model_calls_total", help_text="Model responses produced, including cache hits",
+              endpoint=endpoint, cached=str(bool(cached)).lower())
+    if not cached:
+        increment("tokens_total", input_tokens, "Tokens processed by the model", endpoint=endpoint, type="input")
+        increment("tokens_total", output_tokens, "Tokens processed by the model", endpoint=endpoint, type="output")
+
+def server_timing_header():
+    """Server-Timing header value for the current request, or None if disabled or empty"""
+    if not METRICS_SERVER_TIMING:
+        return None
+    timings = _timings.get()
+    if not timings:
+        return None
+    # Merge repeated stages (such as several model calls) into one entry each
+    totals = {}
+    for stage_name, seconds in timings:
+        totals[stage_name] = totals.get(stage_name, 0.0) + seconds
+    return ", ".join(f"{stage_name};dur={seconds * 1000:.2f}" for stage_name, seconds in totals.items())
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + "}"
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        histograms = {key: ([*value[0]], value[1]) for key, value in _histograms.items()}
+        counters = dict(_counters)
+        help_texts = dict(_help)
+
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        full_name = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# HELP {full_name} {help_texts.get(name, '')}")
+        lines.append(f"# TYPE {full_name} counter")
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f"{full_name}{_format_labels(labels)} {_format_value(value)}")
+
+    for name in sorted({name for name, _ in histograms}):
+        full_name = f"{METRIC_PREFIX}_{name}"
+        lines.append(f"# HELP {full_name} {help_texts.get(name, '')}")
+        lines.append(f"# TYPE {full_name} histogram")
+        for (histogram_name, labels), (counts, total) in sorted(histograms.items()):
+            if histogram_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, counts):
+                cumulative += count
+                lines.append(f"{full_name}_bucket{_format_labels(labels, [('le', repr(bound))])} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{full_name}_bucket{_format_labels(labels, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{full_name}_count{_format_labels(labels)} {cumulative}")
+
+    load_times = get_load_times()
+    if load_times:
+        full_name = f"{METRIC_PREFIX}_load_seconds"
+        lines.append(f"# HELP {full_name} Time spent importing the app and loading deferred modules and resources")
+        lines.append(f"# TYPE {full_name} gauge")
+        for name, seconds in sorted(load_times.items()):
+            lines.append(f"{full_name}{_format_labels(_labels({'resource': name}))} {_format_value(seconds)}")
+
+    for name, (help_text, collect) in sorted(_gauges.items()):
+        full_name = f"{METRIC_PREFIX}_{name}"
+        try:
+            samples = collect()
+        except Exception as e:
+            print(f"Error collecting metric {name}: {e}")
+            continue
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} gauge")
+        for labels, value in samples:
+            lines.append(f"{full_name}{_format_labels(_labels(labels))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,515 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager, asynccontextmanager
+from scheduler import SchedulerRejected, LLM_MAX_IN_FLIGHT
+from metrics import record_load
+from jobs import raise_if_cancelled
+
+MODEL_API_KEY = os.environ.get("MODEL_API_KEY", "dpais")
+
+# Comma-separated base URLs of the model server replicas
+MODEL_BASE_URLS = [url.strip() for url in
+                   os.environ.get("MODEL_BASE_URLS", "http://localhost:8553/v1/openai").split(",")
+                   if url.strip()]
+
+# HTTP connection pool kept to each replica
+MODEL_MAX_CONNECTIONS = int(os.environ.get("MODEL_MAX_CONNECTIONS", 256))
+MODEL_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("MODEL_MAX_KEEPALIVE_CONNECTIONS", 64))
+MODEL_KEEPALIVE_EXPIRY = float(os.environ.get("MODEL_KEEPALIVE_EXPIRY", 60))
+
+# Seconds a model call may take in total, across retries
+MODEL_REQUEST_TIMEOUT = float(os.environ.get("MODEL_REQUEST_TIMEOUT", 120))
+MODEL_TRANSCRIPTION_TIMEOUT = float(os.environ.get("MODEL_TRANSCRIPTION_TIMEOUT", 600))
+
+# Retries on connection errors, timeouts, 429 and 5xx, with exponential backoff and jitter
+MODEL_MAX_RETRIES = int(os.environ.get("MODEL_MAX_RETRIES", 2))
+MODEL_RETRY_BACKOFF = float(os.environ.get("MODEL_RETRY_BACKOFF", 0.25))
+MODEL_RETRY_BACKOFF_MAX = float(os.environ.get("MODEL_RETRY_BACKOFF_MAX", 4))
+
+# Seconds before a hedged chat call is duplicated to a second replica; 0 disables hedging
+MODEL_HEDGE_DELAY = float(os.environ.get("MODEL_HEDGE_DELAY", 0))
+
+# Consecutive failures that eject a replica, and seconds before it is probed again
+MODEL_BREAKER_FAILURES = int(os.environ.get("MODEL_BREAKER_FAILURES", 5))
+MODEL_BREAKER_COOLDOWN = float(os.environ.get("MODEL_BREAKER_COOLDOWN", 30))
+
+# Weight of the newest sample in each replica's moving average latency
+LATENCY_SMOOTHING = 0.2
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# The OpenAI SDK and httpx are imported on the first model call (see _load_sdk), which keeps
+# them out of startup. Until then these match nothing, and no model error can occur.
+httpx = None
+openai = None
+
+# Errors worth retrying on another replica; anything else is the caller's problem
+TRANSIENT_ERRORS = ()
+
+# Errors that can break a stream once it is open, which reach the caller unwrapped
+STREAM_ERRORS = ()
+
+# Errors where the replica answered but rejected the request
+API_STATUS_ERRORS = ()
+
+# Outcomes reported when a call on a replica ends
+_SUCCEEDED = "succeeded"
+_FAILED = "failed"
+_ABANDONED = "abandoned"
+
+class BackendUnavailable(SchedulerRejected):
+    """No healthy model replica could serve the call"""
+    status_code = 503
+
+class DeadlineExceeded(BackendUnavailable):
+    """The call did not complete within its deadline"""
+    status_code = 504
+
+_sdk_lock = threading.Lock()
+
+def _load_sdk():
+    global httpx, openai, TRANSIENT_ERRORS, STREAM_ERRORS, API_STATUS_ERRORS
+    with _sdk_lock:
+        if openai is not None:
+            return
+        with record_load("openai_sdk"):
+            import httpx as httpx_module
+            import openai as openai_module
+        TRANSIENT_ERRORS = (openai_module.APIConnectionError, openai_module.RateLimitError,
+                            openai_module.InternalServerError)
+        STREAM_ERRORS = TRANSIENT_ERRORS + (httpx_module.TransportError,)
+        API_STATUS_ERRORS = (openai_module.APIStatusError,)
+        httpx = httpx_module
+        openai = openai_module
+
+def _http_limits():
+    return httpx.Limits(
+        max_connections=MODEL_MAX_CONNECTIONS,
+        max_keepalive_connections=MODEL_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=MODEL_KEEPALIVE_EXPIRY
+    )
+
+class Backend:
+    """One model server replica: its clients, load and circuit breaker state"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self._client = None
+        self._async_client = None
+        self.outstanding = 0
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.requests = 0
+        self.failures = 0
+        self.latency = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            _load_sdk()
+            with _sdk_lock:
+                if self._client is None:
+                    # Retries are done here, across replicas, rather than inside the client
+                    self._client = openai.OpenAI(api_key=MODEL_API_KEY, base_url=self.base_url, max_retries=0,
+                                                 http_client=httpx.Client(limits=_http_limits()))
+        return self._client
+
+    @property
+    def async_client(self):
+        # Created on first use so its connection pool belongs to the running event loop
+        if self._async_client is None:
+            _load_sdk()
+            self._async_client = openai.AsyncOpenAI(api_key=MODEL_API_KEY, base_url=self.base_url, max_retries=0,
+                                                    http_client=httpx.AsyncClient(limits=_http_limits()))
+        return self._async_client
+
+    def available(self, now):
+        # Caller must hold _lock. An ejected replica gets one probe call once its cooldown ends.
+        if self.state == OPEN and now - self.opened_at >= MODEL_BREAKER_COOLDOWN:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            return not self.probing
+        return self.state == CLOSED
+
+_lock = threading.Lock()
+_backends = [Backend(url) for url in MODEL_BASE_URLS]
+_stats = {"retries": 0, "hedged": 0, "hedge_wins": 0, "deadline_exceeded": 0}
+
+# Runs both legs of hedged calls so the caller can wait on whichever answers first
+_hedge_executor = ThreadPoolExecutor(max_workers=max(2, 2 * LLM_MAX_IN_FLIGHT), thread_name_prefix="model-hedge")
+
+def _acquire(exclude=(), strict=False):
+    """
+    Pick the available replica with the fewest calls outstanding and count a call against it
+
+    Replicas in exclude (already tried for this call) are avoided when possible;
+    with strict=True they are never picked and None is returned instead.
+    """
+    now = time.monotonic()
+    with _lock:
+        candidates = [backend for backend in _backends if backend.available(now)]
+        fresh = [backend for backend in candidates if backend not in exclude]
+        if fresh or strict:
+            candidates = fresh
+        if not candidates:
+            if strict:
+                return None
+            raise BackendUnavailable("No model server is available; please retry shortly")
+        # Shuffle so equally loaded replicas share the traffic
+        random.shuffle(candidates)
+        backend = min(candidates, key=lambda b: (b.outstanding, b.latency or 0.0))
+        if backend.state == HALF_OPEN:
+            backend.probing = True
+        backend.outstanding += 1
+        backend.requests += 1
+        return backend
+
+def _report(backend, outcome, latency=None, release=True):
+    """Record how a call on backend went, and release it unless the call is still streaming"""
+    with _lock:
+        if release:
+            backend.outstanding -= 1
+        if outcome == _FAILED:
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if backend.state == HALF_OPEN or backend.consecutive_failures >= MODEL_BREAKER_FAILURES:
+                if backend.state != OPEN:
+                    print(f"Ejecting model server {backend.base_url} after {backend.consecutive_failures} failures")
+                backend.state = OPEN
+                backend.opened_at = time.monotonic()
+            backend.probing = False
+        elif outcome == _SUCCEEDED:
+            backend.consecutive_failures = 0
+            backend.state = CLOSED
+            backend.probing = False
+            if latency is not None:
+                backend.latency = latency if backend.latency is None else (
+                    LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * backend.latency)
+        elif backend.state == HALF_OPEN:
+            # The probe was abandoned before it told us anything; allow another
+            backend.probing = False
+
+def _count(stat):
+    with _lock:
+        _stats[stat] += 1
+
+def _backoff(attempt, deadline):
+    """Seconds to wait before retry number attempt + 1, never past the deadline"""
+    delay = random.uniform(0, min(MODEL_RETRY_BACKOFF * 2 ** attempt, MODEL_RETRY_BACKOFF_MAX))
+    return max(0.0, min(delay, deadline - time.monotonic()))
+
+def _give_up(deadline, error):
+    if time.monotonic() >= deadline:
+        _count("deadline_exceeded")
+        return DeadlineExceeded("The model server did not respond in time; please retry shortly")
+    return BackendUnavailable(f"Model server unavailable: {error}")
+
+def _attempt(backend, fn, deadline):
+    start = time.monotonic()
+    try:
+        result = fn(backend.client.with_options(timeout=max(deadline - start, 0.001)))
+    except TRANSIENT_ERRORS:
+        _report(backend, _FAILED)
+        raise
+    except API_STATUS_ERRORS:
+        # The replica answered; the request itself was rejected
+        _report(backend, _SUCCEEDED)
+        raise
+    except BaseException:
+        _report(backend, _ABANDONED)
+        raise
+    _report(backend, _SUCCEEDED, time.monotonic() - start)
+    return result
+
+def _hedged_attempt(fn, deadline, hedge_delay, tried):
+    """Call one replica, duplicating the call to a second if the first is slow; first answer wins"""
+    primary = _acquire(tried)
+    tried.append(primary)
+    legs = {_hedge_executor.submit(_attempt, primary, fn, deadline): primary}
+    done, _ = wait(legs, timeout=max(0.0, min(hedge_delay, deadline - time.monotonic())))
+    if not done:
+        secondary = _acquire(tried, strict=True)
+        if secondary is not None:
+            tried.append(secondary)
+            _count("hedged")
+            legs[_hedge_executor.submit(_attempt, secondary, fn, deadline)] = secondary
+
+    error = None
+    pending = set(legs)
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                if legs[future] is not primary:
+                    _count("hedge_wins")
+                # The slower leg finishes in the background and releases its replica
+                return future.result()
+            error = future.exception()
+            if not isinstance(error, TRANSIENT_ERRORS):
+                raise error
+    if error is not None:
+        raise error
+    raise _give_up(deadline, None)
+
+def call_model(fn, timeout=None, hedge=False):
+    """
+    Run a model call on the least loaded healthy replica
+
+    Transient failures are retried on other replicas with backoff until the
+    retries or the deadline run out.
+
+    Args:
+        fn: Function taking an OpenAI client and making the call with it
+        timeout: Deadline in seconds for the whole call, retries included
+                 (default MODEL_REQUEST_TIMEOUT)
+        hedge: Duplicate the call to a second replica if the first has not
+               answered after MODEL_HEDGE_DELAY seconds (for latency-sensitive chat)
+
+    Returns:
+        The value returned by fn
+
+    Raises:
+        BackendUnavailable: If no replica could serve the call (HTTP 503)
+        DeadlineExceeded: If the deadline passed first (HTTP 504)
+    """
+    deadline = time.monotonic() + (timeout or MODEL_REQUEST_TIMEOUT)
+    hedge = hedge and MODEL_HEDGE_DELAY > 0 and len(_backends) > 1
+    tried = []
+    error = None
+    for attempt in range(MODEL_MAX_RETRIES + 1):
+        if attempt:
+            _count("retries")
+            time.sleep(_backoff(attempt - 1, deadline))
+        # A background job that was cancelled stops before it calls the model again
+        raise_if_cancelled()
+        if time.monotonic() >= deadline:
+            break
+        try:
+            if hedge:
+                return _hedged_attempt(fn, deadline, MODEL_HEDGE_DELAY, tried)
+            backend = _acquire(tried)
+            tried.append(backend)
+            return _attempt(backend, fn, deadline)
+        except TRANSIENT_ERRORS as e:
+            error = e
+    raise _give_up(deadline, error) from error
+
+@contextmanager
+def model_stream(fn, timeout=None):
+    """
+    Open a streaming model call on the least loaded healthy replica
+
+    Opening the stream is retried like call_model; once data flows, errors are
+    passed to the caller. timeout bounds opening the stream and each wait for
+    the next chunk. The replica counts the call as outstanding until the block exits.
+
+    Yields:
+        The stream returned by fn
+    """
+    deadline = time.monotonic() + (timeout or MODEL_REQUEST_TIMEOUT)
+    tried = []
+    error = None
+    stream = None
+    for attempt in range(MODEL_MAX_RETRIES + 1):
+        if attempt:
+            _count("retries")
+            time.sleep(_backoff(attempt - 1, deadline))
+        raise_if_cancelled()
+        if time.monotonic() >= deadline:
+            break
+        backend = _acquire(tried)
+        tried.append(backend)
+        start = time.monotonic()
+        try:
+            stream = fn(backend.client.with_options(timeout=max(deadline - start, 0.001)))
+        except TRANSIENT_ERRORS as e:
+            _report(backend, _FAILED)
+            error = e
+            continue
+        except API_STATUS_ERRORS:
+            _report(backend, _SUCCEEDED)
+            raise
+        except BaseException:
+            _report(backend, _ABANDONED)
+            raise
+        break
+    if stream is None:
+        raise _give_up(deadline, error) from error
+
+    # Latency is time to the response headers, so long answers do not count against the replica
+    _report(backend, _SUCCEEDED, time.monotonic() - start, release=False)
+    outcome = _ABANDONED
+    try:
+        yield stream
+    except STREAM_ERRORS:
+        outcome = _FAILED
+        raise
+    finally:
+        _report(backend, outcome)
+
+async def _aattempt(backend, fn, deadline):
+    start = time.monotonic()
+    remaining = max(deadline - start, 0.001)
+    try:
+        # The client timeout bounds each network operation; wait_for bounds the whole call
+        result = await asyncio.wait_for(fn(backend.async_client.with_options(timeout=remaining)), remaining)
+    except asyncio.TimeoutError:
+        _report(backend, _FAILED)
+        raise _give_up(deadline, None)
+    except TRANSIENT_ERRORS:
+        _report(backend, _FAILED)
+        raise
+    except API_STATUS_ERRORS:
+        _report(backend, _SUCCEEDED)
+        raise
+    except BaseException:
+        _report(backend, _ABANDONED)
+        raise
+    _report(backend, _SUCCEEDED, time.monotonic() - start)
+    return result
+
+async def _ahedged_attempt(fn, deadline, hedge_delay, tried):
+    primary = _acquire(tried)
+    tried.append(primary)
+    legs = {asyncio.ensure_future(_aattempt(primary, fn, deadline)): primary}
+    try:
+        done, _ = await asyncio.wait(legs, timeout=max(0.0, min(hedge_delay, deadline - time.monotonic())))
+        if not done:
+            secondary = _acquire(tried, strict=True)
+            if secondary is not None:
+                tried.append(secondary)
+                _count("hedged")
+                legs[asyncio.ensure_future(_aattempt(secondary, fn, deadline))] = secondary
+
+        error = None
+        pending = set(legs)
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                if task.exception() is None:
+                    if legs[task] is not primary:
+                        _count("hedge_wins")
+                    return task.result()
+                error = task.exception()
+                if not isinstance(error, TRANSIENT_ERRORS):
+                    raise error
+        if error is not None:
+            raise error
+        raise _give_up(deadline, None)
+    finally:
+        # Cancel the slower leg; cancelling releases its replica
+        for task in legs:
+            if not task.done():
+                task.cancel()
+
+async def acall_model(fn, timeout=None, hedge=False):
+    """Asyncio variant of call_model; fn takes an AsyncOpenAI client and returns an awaitable"""
+    deadline = time.monotonic() + (timeout or MODEL_REQUEST_TIMEOUT)
+    hedge = hedge and MODEL_HEDGE_DELAY > 0 and len(_backends) > 1
+    tried = []
+    error = None
+    for attempt in range(MODEL_MAX_RETRIES + 1):
+        if attempt:
+            _count("retries")
+            await asyncio.sleep(_backoff(attempt - 1, deadline))
+        if time.monotonic() >= deadline:
+            break
+        try:
+            if hedge:
+                return await _ahedged_attempt(fn, deadline, MODEL_HEDGE_DELAY, tried)
+            backend = _acquire(tried)
+            tried.append(backend)
+            return await _aattempt(backend, fn, deadline)
+        except TRANSIENT_ERRORS as e:
+            error = e
+    raise _give_up(deadline, error) from error
+
+@asynccontextmanager
+async def amodel_stream(fn, timeout=None):
+    """Asyncio variant of model_stream; fn takes an AsyncOpenAI client and returns an awaitable"""
+    deadline = time.monotonic() + (timeout or MODEL_REQUEST_TIMEOUT)
+    tried = []
+    error = None
+    stream = None
+    for attempt in range(MODEL_MAX_RETRIES + 1):
+        if attempt:
+            _count("retries")
+            await asyncio.sleep(_backoff(attempt - 1, deadline))
+        if time.monotonic() >= deadline:
+            break
+        backend = _acquire(tried)
+        tried.append(backend)
+        start = time.monotonic()
+        try:
+            stream = await fn(backend.async_client.with_options(timeout=max(deadline - start, 0.001)))
+        except TRANSIENT_ERRORS as e:
+            _report(backend, _FAILED)
+            error = e
+            continue
+        except API_STATUS_ERRORS:
+            _report(backend, _SUCCEEDED)
+            raise
+        except BaseException:
+            _report(backend, _ABANDONED)
+            raise
+        break
+    if stream is None:
+        raise _give_up(deadline, error) from error
+
+    _report(backend, _SUCCEEDED, time.monotonic() - start, release=False)
+    outcome = _ABANDONED
+    try:
+        yield stream
+    except STREAM_ERRORS:
+        outcome = _FAILED
+        raise
+    finally:
+        _report(backend, outcome)
+
+def preload_clients():
+    """Import the SDK and create every replica's client ahead of the first model call"""
+    for backend in _backends:
+        backend.client
+
+def get_backend_health():
+    """Return the load, latency and circuit breaker state of every model replica"""
+    now = time.monotonic()
+    with _lock:
+        backends = []
+        for backend in _backends:
+            backend.available(now)
+            backends.append({
+                "base_url": backend.base_url,
+                "state": backend.state,
+                "outstanding": backend.outstanding,
+                "requests": backend.requests,
+                "failures": backend.failures,
+                "consecutive_failures": backend.consecutive_failures,
+                "avg_latency_ms": round(backend.latency * 1000, 2) if backend.latency is not None else None
+            })
+        return {
+            "available": sum(1 for backend in backends if backend["state"] != OPEN),
+            "total": len(backends),
+            "backends": backends,
+            **_stats
+        }
+
+async def aclose_backends():
+    """Close the async clients of all replicas (on asyncio server shutdown)"""
+    for backend in _backends:
+        if backend._async_client is not None:
+            await backend._async_client.close()
+            backend._async_client = None
@@ -1,8 +1,131 @@
-from PyPDF2 import PdfReader
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from metrics import record_load
 
-def pdf_to_text_pypdf2(pdf_path):
-    reader = PdfReader(pdf_path)
-    with open("output.txt", "w", encoding="utf-8") as f:
+# Documents with at least this many pages are extracted across a process pool
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 32))
+
+# Worker processes used for parallel extraction
+PDF_MAX_WORKERS = int(os.environ.get("PDF_MAX_WORKERS", os.cpu_count() or 1))
+
+# Extracted documents kept in memory, keyed by content hash
+PDF_CACHE_MAX_ENTRIES = int(os.environ.get("PDF_CACHE_MAX_ENTRIES", 64))
+
+_pool = None
+_PdfReader = None
+_pool_lock = threading.Lock()
+_cache_lock = threading.Lock()
+_cache = OrderedDict()
+
+def load_pdf_reader():
+    """PyPDF2's PdfReader class; PyPDF2 is imported on first use to keep it out of startup"""
+    global _PdfReader
+    if _PdfReader is None:
+        with record_load("pypdf2"):
+            from PyPDF2 import PdfReader
+        _PdfReader = PdfReader
+    return _PdfReader
+
+def _open_pdf(source):
+    return load_pdf_reader()(source)
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_MAX_WORKERS)
+        return _pool
+
+def _extract_page_range(data, start, stop):
+    """Extract the text of pages [start, stop) from PDF bytes (runs in a worker process)"""
+    reader = _open_pdf(io.BytesIO(data))
+    return [reader.pages[i].extract_text() for i in range(start, stop)]
+
+def content_hash(data):
+    """SHA-256 of document bytes, used as the extraction cache key"""
+    return hashlib.sha256(data).hexdigest()
+
+def extract_pages(data, parallel=True):
+    """
+    Extract the text of every page of a PDF
+
+    Large documents are split into page ranges and extracted across a process pool.
+
+    Args:
+        data: PDF file contents as bytes
+        parallel: Allow fanning pages out across the process pool
+
+    Returns:
+        list: Text of each page, in order
+    """
+    reader = _open_pdf(io.BytesIO(data))
+    page_count = len(reader.pages)
+    
+    workers = min(PDF_MAX_WORKERS, page_count)
+    if not parallel or page_count < PDF_PARALLEL_MIN_PAGES or workers < 2:
+        return [page.extract_text() for page in reader.pages]
+    
+    # One contiguous page range per worker keeps the number of PDF re-parses low
+    step = -(-page_count // workers)
+    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    pool = _get_pool()
+    futures = [pool.submit(_extract_page_range, data, start, stop) for start, stop in ranges]
+    
+    pages = []
+    for future in futures:
+        pages.extend(future.result())
+    return pages
+
+def join_pages(pages):
+    """Join page texts into one document, one newline after each page"""
+    return "".join(f"{text}\n" for text in pages)
+
+def extract_pages_cached(data):
+    """
+    Extract the text of each page of a PDF, reusing the result for identical documents
+
+    Args:
+        data: PDF file contents as bytes
+
+    Returns:
+        list: Text of each page, in order
+    """
+    key = content_hash(data)
+    with _cache_lock:
+        pages = _cache.get(key)
+        if pages is not None:
+            _cache.move_to_end(key)
+            return pages
+    
+    pages = extract_pages(data)
+    
+    with _cache_lock:
+        _cache[key] = pages
+        _cache.move_to_end(key)
+        while len(_cache) > PDF_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return pages
+
+def extract_text_cached(data):
+    """
+    Extract the text of a PDF, reusing the result for identical documents
+
+    Args:
+        data: PDF file contents as bytes
+
+    Returns:
+        str: Text of all pages
+    """
+    return join_pages(extract_pages_cached(data))
+
+def pdf_to_text_pypdf2(pdf_path, output_path="output.txt"):
+    """Write the text of a PDF file to output_path; pdf_bulk.py extracts many files at once"""
+    reader = _open_pdf(pdf_path)
+    with open(output_path, "w", encoding="utf-8") as f:
         for page in reader.pages:
             text = page.extract_text()
             if text:
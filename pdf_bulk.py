@@ -0,0 +1,214 @@
+"""
+Bulk PDF to text extraction
+
+Walks directories for PDF files and extracts their text across a process
+pool with the same code the upload endpoint uses (pdf.extract_pages). Each
+document is written to a JSONL file as soon as it is extracted: a
+'document' line with its path, content hash, page count and text, or with
+--per-page a 'document' line followed by one 'page' line per page. Files
+that cannot be read get an 'error' line.
+
+Documents whose content hash is already in the output file are skipped,
+so an interrupted run picks up where it stopped; a document left half
+written is removed and extracted again. Files with only an 'error' line
+are retried, and their new line follows the old one. Progress, including pages per
+second, is reported on stderr.
+
+Run with:  python pdf_bulk.py records/ --output records.jsonl --workers 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pdf import extract_pages, join_pages, content_hash, PDF_MAX_WORKERS
+
+PDF_EXTENSIONS = (".pdf",)
+
+# Content hashes already in the output file, set in each worker process
+_done_hashes = frozenset()
+
+def _init_worker(done_hashes):
+    global _done_hashes
+    _done_hashes = done_hashes
+
+def _extract_file(path):
+    """
+    Read and extract one file (runs in a worker process)
+
+    Returns:
+        tuple: (status, path, sha256, pages or error message), where status
+               is 'ok', 'skipped' (already in the output) or 'error'
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return "error", path, None, str(e)
+    sha256 = content_hash(data)
+    if sha256 in _done_hashes:
+        return "skipped", path, sha256, None
+    try:
+        # Files are already spread across the pool, so pages of one file are not fanned out again
+        return "ok", path, sha256, extract_pages(data, parallel=False)
+    except Exception as e:
+        return "error", path, sha256, str(e)
+
+def find_pdfs(paths):
+    """Yield PDF files under the given files and directories, in sorted order"""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(PDF_EXTENSIONS):
+                    yield os.path.join(root, name)
+
+def load_done_hashes(output):
+    """
+    Content hashes of the documents written completely to an existing output file
+
+    A document whose lines were cut short by an interrupted run is always the
+    last one in the file; it is truncated away so it can be written again.
+
+    Returns:
+        set: SHA-256 hashes of completed documents; files that failed are left out so they are retried
+    """
+    done = set()
+    if not os.path.exists(output):
+        return done
+
+    complete_end = 0
+    # Hash, page count and pages seen of a document whose page lines are still expected
+    pending = None
+    with open(output, "rb") as f:
+        offset = 0
+        for line in f:
+            offset += len(line)
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            kind = record.get("type")
+            if pending is not None:
+                if kind != "page" or record.get("sha256") != pending[0]:
+                    break
+                pending[2] += 1
+                if pending[2] < pending[1]:
+                    continue
+                pending = None
+            elif kind == "document" and "text" not in record and record.get("pages"):
+                pending = [record.get("sha256"), record["pages"], 0]
+                continue
+            if kind != "error" and record.get("sha256"):
+                done.add(record["sha256"])
+            complete_end = offset
+
+    if os.path.getsize(output) > complete_end:
+        print(f"Removing an incomplete document at the end of {output}", file=sys.stderr)
+        with open(output, "r+b") as f:
+            f.truncate(complete_end)
+    return done
+
+def format_records(path, sha256, pages, per_page):
+    """The JSONL lines for one extracted document"""
+    if not per_page:
+        return json.dumps({"type": "document", "path": path, "sha256": sha256, "pages": len(pages),
+                           "text": join_pages(pages)}) + "\n"
+    lines = [json.dumps({"type": "document", "path": path, "sha256": sha256, "pages": len(pages)})]
+    lines.extend(json.dumps({"type": "page", "path": path, "sha256": sha256, "page": number, "text": text})
+                 for number, text in enumerate(pages, start=1))
+    return "\n".join(lines) + "\n"
+
+def report(counts, started, final=False):
+    elapsed = time.perf_counter() - started
+    rate = counts["pages"] / elapsed if elapsed > 0 else 0.0
+    prefix = "Done:" if final else "Progress:"
+    print(f"{prefix} {counts['documents']} documents, {counts['pages']} pages ({rate:.1f} pages/sec), "
+          f"{counts['skipped']} skipped, {counts['failed']} failed in {elapsed:.1f}s", file=sys.stderr)
+
+def run(paths, output, workers=PDF_MAX_WORKERS, per_page=False, resume=True, progress_interval=10.0):
+    """
+    Extract every PDF under paths into output
+
+    At most two files per worker are read or extracted at a time and each
+    document is written as soon as it is done, so memory use does not grow
+    with the number of files.
+
+    Returns:
+        dict: Counts of documents, pages, skipped and failed files
+    """
+    done = load_done_hashes(output) if resume else set()
+    counts = {"documents": 0, "pages": 0, "skipped": 0, "failed": 0}
+    started = time.perf_counter()
+    last_report = started
+    files = find_pdfs(paths)
+    max_in_flight = max(1, workers) * 2
+
+    with open(output, "a" if resume else "w", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_worker,
+                                initargs=(frozenset(done),)) as pool:
+        in_flight = set()
+        try:
+            while True:
+                for path in files:
+                    in_flight.add(pool.submit(_extract_file, path))
+                    if len(in_flight) >= max_in_flight:
+                        break
+                if not in_flight:
+                    break
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    status, path, sha256, result = future.result()
+                    # The same content may be found under two paths in one run
+                    if status == "skipped" or sha256 in done:
+                        counts["skipped"] += 1
+                        continue
+                    if status == "error":
+                        print(f"Error extracting {path}: {result}", file=sys.stderr)
+                        out.write(json.dumps({"type": "error", "path": path, "sha256": sha256, "error": result}) + "\n")
+                        counts["failed"] += 1
+                    else:
+                        out.write(format_records(path, sha256, result, per_page))
+                        counts["documents"] += 1
+                        counts["pages"] += len(result)
+                        done.add(sha256)
+                    # Each document is flushed whole, so an interruption can only cut short the last one
+                    out.flush()
+
+                now = time.perf_counter()
+                if progress_interval > 0 and now - last_report >= progress_interval:
+                    report(counts, started)
+                    last_report = now
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
+            raise
+
+    report(counts, started, final=True)
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract the text of PDF files to JSONL")
+    parser.add_argument("paths", nargs="+", help="PDF files or directories to search for PDF files")
+    parser.add_argument("--output", default="pdf_text.jsonl", help="JSONL output file (default pdf_text.jsonl)")
+    parser.add_argument("--workers", type=int, default=PDF_MAX_WORKERS, help="Worker processes (default PDF_MAX_WORKERS)")
+    parser.add_argument("--per-page", action="store_true", help="Write one line per page instead of per document")
+    parser.add_argument("--no-resume", action="store_true", help="Overwrite the output instead of skipping documents already in it")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="Seconds between progress reports (0 for none)")
+    args = parser.parse_args(argv)
+
+    try:
+        counts = run(args.paths, args.output, args.workers, args.per_page, not args.no_resume, args.progress_interval)
+    except KeyboardInterrupt:
+        print("Interrupted; run again to resume", file=sys.stderr)
+        return 130
+    return 1 if counts["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
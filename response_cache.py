@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Maximum number of responses kept in memory (least recently used are evicted first)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 512))
+
+# Seconds a cached response stays valid; 0 disables the cache
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 3600))
+
+# Optional directory for a disk-backed store that survives restarts
+RESPONSE_CACHE_DIR = os.environ.get("RESPONSE_CACHE_DIR", "")
+
+# Maximum number of responses kept in the disk store (least recently used are pruned first)
+RESPONSE_CACHE_MAX_DISK_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_DISK_ENTRIES", 4096))
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_stats = {
+    "hits": 0,
+    "misses": 0,
+    "disk_hits": 0,
+    "evictions": 0,
+    "expirations": 0,
+    "disk_evictions": 0
+}
+# Disk writes since the process started; the disk store is swept on the first and then periodically
+_disk_writes = 0
+
+def cache_key(model, system_prompt, user_input):
+    """Hash of the inputs that determine a model response"""
+    payload = json.dumps([model, system_prompt, user_input], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _disk_path(key):
+    return os.path.join(RESPONSE_CACHE_DIR, f"{key}.json")
+
+def _read_disk_entry(key):
+    try:
+        with open(_disk_path(key), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_disk_entry(key, entry):
+    global _disk_writes
+    try:
+        os.makedirs(RESPONSE_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{_disk_path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, _disk_path(key))
+    except OSError as e:
+        print(f"Error writing response cache entry: {e}")
+        return
+
+    with _cache_lock:
+        _disk_writes += 1
+        # Sweeping every tenth of the cap keeps the store within about 10% of it
+        sweep = (_disk_writes - 1) % max(1, RESPONSE_CACHE_MAX_DISK_ENTRIES // 10) == 0
+    if sweep:
+        _sweep_disk()
+
+def _touch_disk_entry(key):
+    # The file's modification time records when it was last used
+    try:
+        os.utime(_disk_path(key))
+    except OSError:
+        pass
+
+def _remove_disk_entry(key):
+    try:
+        os.remove(_disk_path(key))
+    except OSError:
+        pass
+
+def _sweep_disk():
+    """
+    Remove expired files from the disk store, then the least recently used
+    beyond RESPONSE_CACHE_MAX_DISK_ENTRIES
+    """
+    now = time.time()
+    files = []
+    try:
+        names = os.listdir(RESPONSE_CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            last_used = os.path.getmtime(os.path.join(RESPONSE_CACHE_DIR, name))
+        except OSError:
+            continue
+        files.append((last_used, name[:-len(".json")]))
+
+    # A file is last used no earlier than it was created, so one unused for the TTL has expired
+    removed = [key for last_used, key in files if now - last_used > RESPONSE_CACHE_TTL]
+    live = sorted(item for item in files if now - item[0] <= RESPONSE_CACHE_TTL)
+    evicted = [key for _, key in live[:max(0, len(live) - RESPONSE_CACHE_MAX_DISK_ENTRIES)]]
+    for key in removed + evicted:
+        _remove_disk_entry(key)
+    with _cache_lock:
+        _cache_stats["expirations"] += len(removed)
+        _cache_stats["disk_evictions"] += len(evicted)
+
+def _expired(entry, now):
+    return now - entry["created"] > RESPONSE_CACHE_TTL
+
+def get_cached_response(key):
+    """
+    Look up a cached response
+
+    Args:
+        key: Key returned by cache_key
+
+    Returns:
+        dict: Cached entry with 'content', 'input_tokens' and 'output_tokens',
+              or None on a miss
+    """
+    if RESPONSE_CACHE_TTL <= 0:
+        return None
+
+    now = time.time()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            if not _expired(entry, now):
+                _cache.move_to_end(key)
+                _cache_stats["hits"] += 1
+                return entry
+            del _cache[key]
+            _cache_stats["expirations"] += 1
+
+    if RESPONSE_CACHE_DIR:
+        entry = _read_disk_entry(key)
+        if entry is not None:
+            if not _expired(entry, now):
+                _touch_disk_entry(key)
+                with _cache_lock:
+                    _cache_stats["hits"] += 1
+                    _cache_stats["disk_hits"] += 1
+                    _insert(key, entry)
+                return entry
+            _remove_disk_entry(key)
+            with _cache_lock:
+                _cache_stats["expirations"] += 1
+
+    with _cache_lock:
+        _cache_stats["misses"] += 1
+    return None
+
+def _insert(key, entry):
+    # Caller must hold _cache_lock
+    _cache[key] = entry
+    _cache.move_to_end(key)
+    while len(_cache) > RESPONSE_CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+        _cache_stats["evictions"] += 1
+
+def store_cached_response(key, content, input_tokens, output_tokens):
+    """Cache a completed response under key"""
+    if RESPONSE_CACHE_TTL <= 0 or not content:
+        return
+
+    entry = {
+        "content": content,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "created": time.time()
+    }
+    with _cache_lock:
+        _insert(key, entry)
+
+    if RESPONSE_CACHE_DIR:
+        _write_disk_entry(key, entry)
+
+def get_cache_stats():
+    """Return hit/miss counters and current cache size"""
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats["entries"] = len(_cache)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["max_entries"] = RESPONSE_CACHE_MAX_ENTRIES
+    stats["ttl_seconds"] = RESPONSE_CACHE_TTL
+    stats["disk_store"] = RESPONSE_CACHE_DIR or None
+    stats["max_disk_entries"] = RESPONSE_CACHE_MAX_DISK_ENTRIES
+    return stats
+
+def clear_response_cache():
+    """Drop all cached responses (memory and disk) and reset the counters"""
+    with _cache_lock:
+        _cache.clear()
+        for name in _cache_stats:
+            _cache_stats[name] = 0
+
+    if RESPONSE_CACHE_DIR and os.path.isdir(RESPONSE_CACHE_DIR):
+        for filename in os.listdir(RESPONSE_CACHE_DIR):
+            if filename.endswith(".json"):
+                _remove_disk_entry(filename[:-len(".json")])
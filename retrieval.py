@@ -0,0 +1,243 @@
+import os
+import re
+import math
+import threading
+from collections import Counter, OrderedDict
+from generate import chunk_text_by_sentences, count_tokens_accurate, count_tokens_batch
+from pdf import content_hash
+
+# Target size of an indexed passage
+RETRIEVAL_PASSAGE_TOKENS = int(os.environ.get("RETRIEVAL_PASSAGE_TOKENS", 200))
+
+# Passages returned per question, and the token budget they must fit in
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", 6))
+RETRIEVAL_TOKEN_BUDGET = int(os.environ.get("RETRIEVAL_TOKEN_BUDGET", 1500))
+
+# Indexed documents kept in memory (least recently used are evicted first)
+RETRIEVAL_MAX_DOCUMENTS = int(os.environ.get("RETRIEVAL_MAX_DOCUMENTS", 128))
+
+# Approximate bytes of passages and postings kept across all indexes before least recently used are evicted;
+# an evicted index is rebuilt from the document store on its next question
+RETRIEVAL_MAX_MEMORY_BYTES = int(os.environ.get("RETRIEVAL_MAX_MEMORY_BYTES", 64 * 1024 * 1024))
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Approximate CPython memory per posting (tuple, its ints and list slot), per term and per passage
+_POSTING_BYTES = 72
+_TERM_BYTES = 150
+_PASSAGE_BYTES = 64
+
+_TERM_PATTERN = re.compile(r"[a-z0-9]+")
+_PARAGRAPH_PATTERN = re.compile(r"\n[ \t]*\n")
+
+_index_lock = threading.Lock()
+_indexes = OrderedDict()
+_memory_bytes = 0
+
+def tokenize_terms(text):
+    """Lowercase alphanumeric terms used for lexical matching"""
+    return _TERM_PATTERN.findall(text.lower())
+
+def _split_long_line(line, max_tokens):
+    """Split a line longer than max_tokens on sentences, and text without sentence punctuation on words"""
+    pieces = []
+    for chunk in chunk_text_by_sentences(line, max_tokens):
+        if count_tokens_accurate(chunk, model="qwen2.5") <= max_tokens * 2:
+            pieces.append(chunk)
+            continue
+        words = chunk.split()
+        # English text averages about 0.75 words per token
+        window = max(1, int(max_tokens * 0.75))
+        for start in range(0, len(words), window):
+            pieces.append(" ".join(words[start:start + window]))
+    return pieces
+
+def split_passages(text, max_tokens=RETRIEVAL_PASSAGE_TOKENS):
+    """
+    Split a document into passages of roughly max_tokens
+
+    Passages follow paragraph and line boundaries and keep the document's
+    line breaks, so table rows and lab listings stay one per line. Lines
+    longer than max_tokens are split on sentences, or on words where there
+    is no sentence punctuation.
+    """
+    # Each non-blank line with the separator that precedes it in the document
+    lines = []
+    for paragraph in _PARAGRAPH_PATTERN.split(text):
+        separator = "\n\n"
+        for line in paragraph.split("\n"):
+            if line.strip():
+                lines.append((line.rstrip(), separator))
+                separator = "\n"
+    if not lines:
+        return []
+
+    passages = []
+    current = []
+    current_tokens = 0
+    for (line, separator), tokens in zip(lines, count_tokens_batch([line for line, _ in lines], model="qwen2.5")):
+        if tokens <= max_tokens:
+            pieces = [(line, separator, tokens)]
+        else:
+            parts = _split_long_line(line, max_tokens)
+            pieces = [(part, separator if i == 0 else " ", part_tokens)
+                      for i, (part, part_tokens) in enumerate(zip(parts, count_tokens_batch(parts, model="qwen2.5")))]
+        for piece, piece_separator, piece_tokens in pieces:
+            if current and current_tokens + piece_tokens > max_tokens:
+                passages.append("".join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece if not current else piece_separator + piece)
+            current_tokens += piece_tokens
+    if current:
+        passages.append("".join(current))
+    return passages
+
+class DocumentIndex:
+    """BM25 index over the passages of one document"""
+
+    def __init__(self, document_id, text):
+        self.document_id = document_id
+        self.passages = split_passages(text)
+        self.passage_tokens = count_tokens_batch(self.passages, model="qwen2.5")
+        self.total_tokens = sum(self.passage_tokens)
+        term_freqs = [Counter(tokenize_terms(passage)) for passage in self.passages]
+        self.lengths = [sum(freqs.values()) for freqs in term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        # Inverted index: term -> [(passage index, term frequency)]
+        self.postings = {}
+        for i, freqs in enumerate(term_freqs):
+            for term, tf in freqs.items():
+                self.postings.setdefault(term, []).append((i, tf))
+
+        count = len(self.passages)
+        self.idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+        # Estimated memory held by the index; postings usually outweigh the passage text several times over
+        self.size = (sum(len(passage.encode("utf-8")) + _PASSAGE_BYTES for passage in self.passages)
+                     + sum(len(postings) for postings in self.postings.values()) * _POSTING_BYTES
+                     + len(self.postings) * _TERM_BYTES)
+
+    def score(self, query_terms):
+        """BM25 score of every passage for the query terms"""
+        scores = [0.0] * len(self.passages)
+        for term in set(query_terms):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            idf = self.idf[term]
+            for i, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / self.avg_length)
+                scores[i] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, top_k=RETRIEVAL_TOP_K, token_budget=RETRIEVAL_TOKEN_BUDGET):
+        """
+        Select the passages most relevant to a query
+
+        Args:
+            query: Question text
+            top_k: Maximum number of passages
+            token_budget: Maximum total tokens across the selected passages
+
+        Returns:
+            list: Selected passages, in document order
+        """
+        # Small documents fit whole; send them unchanged
+        if self.total_tokens <= token_budget:
+            return list(self.passages)
+
+        scores = self.score(tokenize_terms(query))
+        ranked = sorted(range(len(self.passages)), key=lambda i: scores[i], reverse=True)
+
+        selected = []
+        used = 0
+        for i in ranked:
+            if len(selected) >= top_k:
+                break
+            if scores[i] <= 0 and selected:
+                break
+            if used + self.passage_tokens[i] > token_budget:
+                continue
+            selected.append(i)
+            used += self.passage_tokens[i]
+        return [self.passages[i] for i in sorted(selected)]
+
+def index_document(text, document_id=None):
+    """
+    Build and register the retrieval index for a document
+
+    Args:
+        text: Extracted document text
+        document_id: ID to register the index under; defaults to the content hash
+
+    Returns:
+        str: The document ID
+    """
+    if document_id is None:
+        document_id = content_hash(text.encode("utf-8"))
+
+    with _index_lock:
+        if document_id in _indexes:
+            _indexes.move_to_end(document_id)
+            return document_id
+
+    index = DocumentIndex(document_id, text)
+
+    global _memory_bytes
+    with _index_lock:
+        previous = _indexes.pop(document_id, None)
+        if previous is not None:
+            _memory_bytes -= previous.size
+        _indexes[document_id] = index
+        _memory_bytes += index.size
+        # The newest index is kept even if it alone exceeds the budget
+        while len(_indexes) > 1 and (len(_indexes) > RETRIEVAL_MAX_DOCUMENTS or
+                                     _memory_bytes > RETRIEVAL_MAX_MEMORY_BYTES):
+            _, evicted = _indexes.popitem(last=False)
+            _memory_bytes -= evicted.size
+    return document_id
+
+def get_index(document_id):
+    """Return the index for document_id, or None if it is not indexed"""
+    with _index_lock:
+        index = _indexes.get(document_id)
+        if index is not None:
+            _indexes.move_to_end(document_id)
+        return index
+
+def retrieve_passages(document_id, query, top_k=RETRIEVAL_TOP_K, token_budget=RETRIEVAL_TOKEN_BUDGET):
+    """
+    Passages of an indexed document relevant to a query
+
+    Raises:
+        KeyError: If document_id is not indexed
+    """
+    index = get_index(document_id)
+    if index is None:
+        raise KeyError(document_id)
+    return index.search(query, top_k=top_k, token_budget=token_budget)
+
+def remove_index(document_id):
+    """Drop the index for document_id, if any"""
+    global _memory_bytes
+    with _index_lock:
+        index = _indexes.pop(document_id, None)
+        if index is not None:
+            _memory_bytes -= index.size
+
+def get_index_stats():
+    """Return the number of indexed documents and their estimated memory"""
+    with _index_lock:
+        return {
+            "documents": len(_indexes),
+            "memory_bytes": _memory_bytes,
+            "max_documents": RETRIEVAL_MAX_DOCUMENTS,
+            "max_memory_bytes": RETRIEVAL_MAX_MEMORY_BYTES
+        }
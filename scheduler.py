@@ -0,0 +1,229 @@
+import os
+import time
+import heapq
+import asyncio
+import threading
+import itertools
+from contextlib import contextmanager, asynccontextmanager
+from jobs import raise_if_cancelled, JobCancelled
+
+# Maximum number of model calls in flight at once across the whole process
+LLM_MAX_IN_FLIGHT = int(os.environ.get("LLM_MAX_IN_FLIGHT", 8))
+
+# Seconds a request may wait for a slot before it is rejected with 503
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", 30))
+
+# Seconds bulk work (jobs, batch items, minutes chunks, chat summaries) may wait; it yields to
+# interactive requests by design, so under sustained load it waits rather than fails
+LLM_QUEUE_TIMEOUT_BULK = float(os.environ.get("LLM_QUEUE_TIMEOUT_BULK", 600))
+
+# Priority classes; lower values are served first
+INTERACTIVE = 0
+BULK = 1
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# Maximum number of requests waiting per priority class; further requests get 429.
+# Bulk callers are already bounded by their own worker pools, so their queue is deeper
+QUEUE_LIMITS = {
+    INTERACTIVE: int(os.environ.get("LLM_QUEUE_LIMIT_INTERACTIVE", 64)),
+    BULK: int(os.environ.get("LLM_QUEUE_LIMIT_BULK", 256)),
+}
+
+QUEUE_TIMEOUTS = {
+    INTERACTIVE: LLM_QUEUE_TIMEOUT,
+    BULK: LLM_QUEUE_TIMEOUT_BULK,
+}
+
+class SchedulerRejected(Exception):
+    """Raised when a model call cannot be admitted; status_code is the HTTP status to return"""
+    status_code = 503
+
+class QueueFull(SchedulerRejected):
+    """The waiting queue for the request's priority class is full"""
+    status_code = 429
+
+class QueueTimeout(SchedulerRejected):
+    """The request waited longer than its class's queue timeout for a slot"""
+    status_code = 503
+
+class _Waiter:
+    def __init__(self, priority):
+        self.priority = priority
+        self.granted = False
+        self.abandoned = False
+
+class _SyncWaiter(_Waiter):
+    def __init__(self, priority):
+        super().__init__(priority)
+        self.event = threading.Event()
+
+    def wake(self):
+        self.event.set()
+
+class _AsyncWaiter(_Waiter):
+    def __init__(self, priority, loop):
+        super().__init__(priority)
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def wake(self):
+        def resolve():
+            if not self.future.done():
+                self.future.set_result(None)
+        self.loop.call_soon_threadsafe(resolve)
+
+_lock = threading.Lock()
+_in_flight = 0
+_heap = []
+_sequence = itertools.count()
+_queued = {priority: 0 for priority in QUEUE_LIMITS}
+_stats = {
+    priority: {"admitted": 0, "rejected": 0, "timed_out": 0, "cancelled": 0, "total_wait": 0.0, "max_wait": 0.0}
+    for priority in QUEUE_LIMITS
+}
+
+def _enqueue(waiter):
+    # Caller must hold _lock. Returns True if the slot was granted immediately.
+    global _in_flight
+    if _in_flight < LLM_MAX_IN_FLIGHT and not _queued_total():
+        _in_flight += 1
+        waiter.granted = True
+        return True
+    if _queued[waiter.priority] >= QUEUE_LIMITS[waiter.priority]:
+        _stats[waiter.priority]["rejected"] += 1
+        raise QueueFull(f"Too many {PRIORITY_NAMES[waiter.priority]} requests waiting for the model; please retry shortly")
+    heapq.heappush(_heap, (waiter.priority, next(_sequence), waiter))
+    _queued[waiter.priority] += 1
+    return False
+
+def _queued_total():
+    return sum(_queued.values())
+
+def _abandon(waiter, outcome="timed_out"):
+    # Caller must hold _lock. Returns True if the waiter had already been granted a slot.
+    if waiter.granted:
+        return True
+    waiter.abandoned = True
+    _queued[waiter.priority] -= 1
+    _stats[waiter.priority][outcome] += 1
+    return False
+
+def _release():
+    global _in_flight
+    with _lock:
+        _in_flight -= 1
+        # Hand the slot to the highest-priority waiter that is still waiting
+        while _heap and _in_flight < LLM_MAX_IN_FLIGHT:
+            _, _, waiter = heapq.heappop(_heap)
+            if waiter.abandoned:
+                continue
+            _queued[waiter.priority] -= 1
+            _in_flight += 1
+            waiter.granted = True
+            waiter.wake()
+
+def _record_admission(priority, wait):
+    with _lock:
+        stats = _stats[priority]
+        stats["admitted"] += 1
+        stats["total_wait"] += wait
+        stats["max_wait"] = max(stats["max_wait"], wait)
+
+@contextmanager
+def model_slot(priority=INTERACTIVE):
+    """
+    Hold one of the LLM_MAX_IN_FLIGHT model call slots for the duration of the block
+
+    Yields:
+        float: Seconds spent waiting in the queue
+
+    Raises:
+        QueueFull: If the priority class queue is full (HTTP 429)
+        QueueTimeout: If no slot became free within the class's queue timeout (HTTP 503)
+    """
+    # A cancelled background job does not queue for a slot it would not use
+    raise_if_cancelled()
+    start = time.perf_counter()
+    deadline = start + QUEUE_TIMEOUTS[priority]
+    waiter = _SyncWaiter(priority)
+    with _lock:
+        granted = _enqueue(waiter)
+    try:
+        # Waiting in short steps lets a background job that is cancelled leave the queue
+        while not granted and not waiter.event.wait(max(0.0, min(1.0, deadline - time.perf_counter()))):
+            raise_if_cancelled()
+            if time.perf_counter() >= deadline:
+                break
+    except JobCancelled:
+        with _lock:
+            granted = _abandon(waiter, "cancelled")
+        if granted:
+            # The slot was handed over as we gave up; pass it on
+            _release()
+        raise
+    if not granted and not waiter.event.is_set():
+        with _lock:
+            granted = _abandon(waiter)
+        if not granted:
+            raise QueueTimeout("Timed out waiting for the model; please retry shortly")
+
+    wait = time.perf_counter() - start
+    _record_admission(priority, wait)
+    try:
+        yield wait
+    finally:
+        _release()
+
+@asynccontextmanager
+async def amodel_slot(priority=INTERACTIVE):
+    """Asyncio variant of model_slot, sharing the same slots and queues"""
+    start = time.perf_counter()
+    waiter = _AsyncWaiter(priority, asyncio.get_running_loop())
+    with _lock:
+        granted = _enqueue(waiter)
+    if not granted:
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), QUEUE_TIMEOUTS[priority])
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            # A client that disconnects while queued is not a queue timeout
+            cancelled = isinstance(e, asyncio.CancelledError)
+            with _lock:
+                granted = _abandon(waiter, "cancelled" if cancelled else "timed_out")
+            if granted:
+                # The slot was handed over as we gave up; pass it on
+                _release()
+            if cancelled:
+                raise
+            raise QueueTimeout("Timed out waiting for the model; please retry shortly")
+
+    wait = time.perf_counter() - start
+    _record_admission(priority, wait)
+    try:
+        yield wait
+    finally:
+        _release()
+
+def get_scheduler_stats():
+    """Return in-flight and queued counts, rejections and queue wait times per priority class"""
+    with _lock:
+        classes = {}
+        for priority, stats in _stats.items():
+            admitted = stats["admitted"]
+            classes[PRIORITY_NAMES[priority]] = {
+                "queued": _queued[priority],
+                "queue_limit": QUEUE_LIMITS[priority],
+                "queue_timeout_seconds": QUEUE_TIMEOUTS[priority],
+                "admitted": admitted,
+                "rejected": stats["rejected"],
+                "timed_out": stats["timed_out"],
+                "cancelled": stats["cancelled"],
+                "avg_wait_ms": round(stats["total_wait"] / admitted * 1000, 2) if admitted else 0.0,
+                "max_wait_ms": round(stats["max_wait"] * 1000, 2)
+            }
+        return {
+            "in_flight": _in_flight,
+            "max_in_flight": LLM_MAX_IN_FLIGHT,
+            "queue_timeout_seconds": LLM_QUEUE_TIMEOUT,
+            "classes": classes
+        }
@@ -167,6 +167,50 @@ async function apiCall(endpoint, options = {}) {
     }
 }
 
+// Server-Sent Events helper for POST endpoints (EventSource only supports GET)
+async function streamSSE(endpoint, body, handlers = {}) {
+    const response = await fetch(endpoint, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream'
+        },
+        body: JSON.stringify(body)
+    });
+    
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        
+        events.forEach(raw => {
+            let eventName = 'message';
+            let data = '';
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) {
+                    eventName = line.slice(7);
+                } else if (line.startsWith('data: ')) {
+                    data += line.slice(6);
+                }
+            });
+            if (data && handlers[eventName]) {
+                handlers[eventName](JSON.parse(data));
+            }
+        });
+    }
+}
+
 // File upload helper
 function createFileUploadHandler(endpoint, onSuccess, onError) {
     return function(event) {
@@ -244,5 +288,6 @@ window.HealthcareUtils = {
     validateForm,
     setLoadingState,
     apiCall,
+    streamSSE,
     createFileUploadHandler
 }; 
\ No newline at end of file
@@ -0,0 +1,9 @@
+"""Shared test setup: the app modules are imported from the repository root"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Read when usage_ledger is imported, so it is set first; the ledger is written at exit
+os.environ.setdefault("USAGE_LEDGER_DIR", tempfile.mkdtemp(prefix="usage-ledger-"))
@@ -0,0 +1,47 @@
+import pytest
+from starlette.testclient import TestClient
+import asgi
+
+
+def response_data(content):
+    return {
+        'content': content,
+        'token_usage': {'input_tokens': 10, 'output_tokens': 5, 'total_tokens': 15},
+        'cost_data': {'request_cost': 0.0},
+        'commercial_costs': {},
+        'cumulative_cost': 0.0,
+        'cached': False
+    }
+
+
+@pytest.fixture
+def client():
+    return TestClient(asgi.app)
+
+
+def test_chat_returns_rendered_markdown(client, monkeypatch):
+    async def achat(message, session_id=None):
+        return response_data(f"**{message}**")
+
+    monkeypatch.setattr(asgi, "achat", achat)
+    response = client.post('/api/chat', json={'message': 'hello'})
+    assert response.status_code == 200
+    assert response.json()['response'] == "**hello**"
+    assert "<strong>hello</strong>" in response.json()['response_html']
+
+
+def test_chat_without_a_message_is_rejected(client):
+    assert client.post('/api/chat', json={'message': ''}).status_code == 400
+    assert client.post('/api/chat', content=b'hello', headers={'content-type': 'text/plain'}).status_code == 400
+
+
+def test_medical_chat_for_a_missing_record_is_404(client):
+    response = client.post('/api/medical-chat', json={'message': 'What is my glucose?', 'document_id': 'missing'})
+    assert response.status_code == 404
+    assert "not found" in response.json()['error']
+
+
+def test_upload_larger_than_the_limit_is_413(client, monkeypatch):
+    monkeypatch.setitem(asgi.flask_app.config, 'MAX_CONTENT_LENGTH', 1000)
+    response = client.post('/api/transcribe-audio', files={'audio': ('meeting.wav', b'\0' * 5000, 'audio/wav')})
+    assert response.status_code == 413
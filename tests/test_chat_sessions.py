@@ -0,0 +1,77 @@
+import time
+import pytest
+import chat_sessions
+from chat_sessions import (open_session, build_history, record_turn, session_fields, session_events,
+                           get_session_info, delete_session, NEW_SESSION)
+
+
+@pytest.fixture
+def session_id():
+    session_id = open_session(NEW_SESSION)
+    yield session_id
+    delete_session(session_id)
+
+
+def test_requests_without_a_session_are_stateless():
+    sessions = chat_sessions.get_session_stats()["sessions"]
+    assert open_session(None) is None
+    assert open_session("") is None
+    record_turn(None, "hello", "hi")
+    assert build_history(None) == ""
+    assert session_fields(None, None) == {}
+    assert chat_sessions.get_session_stats()["sessions"] == sessions
+
+
+def test_known_session_continues(session_id):
+    assert session_fields(NEW_SESSION, session_id) == {"session_id": session_id, "session_restarted": False}
+    assert open_session(session_id) == session_id
+    assert session_fields(session_id, session_id)["session_restarted"] is False
+
+    record_turn(session_id, "My glucose is 180", "That is high")
+    assert "User: My glucose is 180\nAssistant: That is high" in build_history(session_id)
+    assert get_session_info(session_id)["turns"] == 1
+
+
+def test_unknown_or_expired_session_is_replaced_and_flagged(session_id, monkeypatch):
+    replacement = open_session("no-such-session")
+    try:
+        assert replacement not in (None, "no-such-session")
+        assert session_fields("no-such-session", replacement)["session_restarted"] is True
+    finally:
+        delete_session(replacement)
+
+    now = time.time()
+    monkeypatch.setattr(chat_sessions.time, "time", lambda: now + chat_sessions.CHAT_SESSION_TTL + 1)
+    replacement = open_session(session_id)
+    try:
+        assert replacement != session_id
+        assert session_fields(session_id, replacement)["session_restarted"] is True
+        assert get_session_info(session_id) is None
+    finally:
+        delete_session(replacement)
+
+
+def test_done_event_carries_the_session_fields(session_id):
+    events = [{"type": "delta", "content": "Hi"}, {"type": "done", "content": "Hi there"}]
+    relayed = list(session_events(session_id, "hello", iter(events), "expired-id"))
+    assert "session_id" not in relayed[0]
+    assert relayed[1]["session_id"] == session_id
+    assert relayed[1]["session_restarted"] is True
+    assert get_session_info(session_id)["turns"] == 1
+
+
+def test_old_turns_are_folded_into_the_summary(session_id, monkeypatch):
+    monkeypatch.setattr(chat_sessions, "CHAT_HISTORY_TOKENS", 60)
+    monkeypatch.setattr(chat_sessions, "generate_response", lambda system_prompt, user_input, priority:
+                        {"content": "Summary of earlier turns", "token_usage": {"output_tokens": 5}})
+    for n in range(6):
+        record_turn(session_id, f"Question {n} about my blood pressure readings", f"Answer {n} about the readings")
+
+    deadline = time.monotonic() + 2
+    while get_session_info(session_id)["folded_turns"] == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    history = build_history(session_id)
+    assert history.startswith("Summary of the earlier conversation:\nSummary of earlier turns")
+    assert "Question 5" in history
+    assert "Question 0" not in history
@@ -0,0 +1,69 @@
+import time
+import pytest
+import document_store
+import retrieval
+from document_store import put_document, get_document, delete_document, get_document_info, get_store_stats
+from retrieval import index_document, get_index
+
+
+@pytest.fixture(autouse=True)
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_store, "DOCUMENT_STORE_DIR", str(tmp_path))
+    yield tmp_path
+    for document_id in list(document_store._metadata):
+        delete_document(document_id)
+
+
+def record(n):
+    return f"Patient {n}\nGlucose {100 + n} mg/dL\nHemoglobin 13.{n} g/dL\n" * 20
+
+
+def test_same_text_gets_the_same_handle():
+    document_id = put_document(record(1), "a.pdf")
+    assert put_document(record(1), "b.pdf") == document_id
+    assert get_document(document_id) == record(1)
+    assert get_document_info(document_id)["filename"] == "a.pdf"
+    assert get_document("unknown") is None
+
+
+def test_least_recently_used_record_spills_to_disk_and_loads_back(monkeypatch):
+    monkeypatch.setattr(document_store, "DOCUMENT_STORE_MAX_MEMORY_BYTES", len(record(1).encode()) + 10)
+    first = put_document(record(1))
+    index_document(record(1), first)
+    second = put_document(record(2))
+
+    assert not get_document_info(first)["in_memory"]
+    # The spilled record's index goes with it and is rebuilt when next asked about
+    assert get_index(first) is None
+    assert get_document(first) == record(1)
+    assert get_document_info(first)["in_memory"]
+    assert not get_document_info(second)["in_memory"]
+
+
+def test_expired_and_deleted_records_drop_their_index(monkeypatch):
+    expiring = put_document(record(1))
+    deleted = put_document(record(2))
+    index_document(record(1), expiring)
+    index_document(record(2), deleted)
+
+    assert delete_document(deleted)
+    assert get_index(deleted) is None
+    assert not delete_document(deleted)
+
+    now = time.time()
+    monkeypatch.setattr(document_store.time, "time", lambda: now + document_store.DOCUMENT_STORE_TTL + 1)
+    assert get_store_stats()["documents"] == 0
+    assert get_index(expiring) is None
+
+
+def test_indexes_are_bounded_by_memory(monkeypatch):
+    first = index_document(record(1))
+    size = get_index(first).size
+    monkeypatch.setattr(retrieval, "RETRIEVAL_MAX_MEMORY_BYTES", int(size * 2.5))
+    ids = [first] + [index_document(record(n)) for n in (2, 3, 4)]
+    try:
+        assert [get_index(document_id) is not None for document_id in ids] == [False, False, True, True]
+        assert retrieval.get_index_stats()["memory_bytes"] <= size * 2.5
+    finally:
+        for document_id in ids:
+            retrieval.remove_index(document_id)
@@ -0,0 +1,43 @@
+from generate import count_tokens_accurate, count_tokens_batch, count_prompt_tokens, get_encoding, merge_response_data
+from chat import system_prompt as chat_system_prompt
+
+TEXTS = ["", "Hello", "Patient reports chest pain radiating to the left arm since 6 a.m.",
+         "Glucose 180 mg/dL, HbA1c 8.1%; metformin 500 mg twice daily."]
+
+
+def test_batch_counts_match_single_counts():
+    for model in ("qwen2.5", "gpt-4"):
+        assert count_tokens_batch(TEXTS, model=model) == [count_tokens_accurate(text, model=model) for text in TEXTS]
+
+
+def test_encoding_is_built_once_per_model():
+    assert get_encoding("gpt-4") is get_encoding("gpt-4")
+
+
+def test_system_prompt_count_is_memoized():
+    expected = count_tokens_accurate(chat_system_prompt, model="qwen2.5")
+    assert count_prompt_tokens(chat_system_prompt) == expected
+    assert count_prompt_tokens(chat_system_prompt) == expected
+
+
+def response(input_tokens, output_tokens, cached=False):
+    return {
+        'content': "part",
+        'token_usage': {'input_tokens': input_tokens, 'output_tokens': output_tokens,
+                        'total_tokens': input_tokens + output_tokens},
+        'cost_data': {'request_cost': 0.0},
+        'cached': cached
+    }
+
+
+def test_merged_response_sums_usage_over_the_calls():
+    merged = merge_response_data([response(100, 20), response(50, 10, cached=True)], "minutes")
+    assert merged['content'] == "minutes"
+    assert merged['token_usage'] == {'input_tokens': 150, 'output_tokens': 30, 'total_tokens': 180}
+    assert merged['model_calls'] == 2
+    assert merged['cached'] is False
+
+
+def test_merged_response_is_cached_only_if_every_call_was():
+    assert merge_response_data([response(1, 1, cached=True), response(2, 2, cached=True)], "")['cached'] is True
+    assert merge_response_data([], "")['cached'] is False
@@ -0,0 +1,106 @@
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import jobs
+from jobs import submit_job, cancel_job, raise_if_cancelled, JobQueueFull, COMPLETED, FAILED, CANCELLED, QUEUED
+
+
+def wait_finished(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while job.status not in jobs.FINISHED_STATES:
+        assert time.monotonic() < deadline, f"job still {job.status}"
+        time.sleep(0.01)
+    return job
+
+
+def run_until_released(job, release, started=None):
+    """Job function that reports progress until release is set, honouring cancellation"""
+    if started is not None:
+        started.set()
+    while not release.wait(0.01):
+        job.update(message="Waiting")
+    return "released"
+
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    # Let any job still running finish so the next test gets free workers
+    event.set()
+
+
+def test_job_result_and_failure_are_reported():
+    job = wait_finished(submit_job("test", lambda job, x: x * 2, 21))
+    assert (job.status, job.result, job.progress) == (COMPLETED, 42, 1.0)
+
+    def fail(job):
+        raise ValueError("broken")
+
+    job = wait_finished(submit_job("test", fail))
+    assert (job.status, job.error) == (FAILED, "broken")
+    assert job.to_dict()["error"] == "broken"
+
+
+def test_running_job_stops_at_its_next_update(release):
+    started = threading.Event()
+    job = submit_job("test", run_until_released, release, started)
+    assert started.wait(2)
+    cancel_job(job.id)
+    assert wait_finished(job).status == CANCELLED
+
+
+def test_cancelled_job_is_seen_by_model_calls_in_other_threads():
+    cancelled = threading.Event()
+    seen = []
+
+    def work(job):
+        cancelled.wait(2)
+        # Model calls made on the job's behalf run in worker threads with a copy of its context
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(contextvars.copy_context().run, raise_if_cancelled).result()
+        seen.append("not cancelled")
+
+    job = submit_job("test", work)
+    while job.status == QUEUED:
+        time.sleep(0.01)
+    cancel_job(job.id)
+    cancelled.set()
+    assert wait_finished(job).status == CANCELLED
+    assert seen == []
+    # Outside a job there is nothing to cancel
+    raise_if_cancelled()
+
+
+def test_queued_job_cancelled_before_it_starts_never_runs(release):
+    started = [threading.Event() for _ in range(jobs.JOB_MAX_WORKERS)]
+    blockers = [submit_job("test", run_until_released, release, event) for event in started]
+    assert all(event.wait(2) for event in started)
+
+    ran = []
+    job = submit_job("test", lambda job: ran.append(job.id))
+    assert job.status == QUEUED
+    cancel_job(job.id)
+    assert job.status == CANCELLED
+
+    release.set()
+    for blocker in blockers:
+        wait_finished(blocker)
+    time.sleep(0.05)
+    assert ran == []
+
+
+def test_jobs_being_cancelled_do_not_count_as_pending(release, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_PENDING", 1)
+    # Blocked without progress updates, so it keeps running after the cancel request
+    job = submit_job("test", lambda job: release.wait(5))
+    with pytest.raises(JobQueueFull):
+        submit_job("test", lambda job: None)
+
+    cancel_job(job.id)
+    assert job.status not in jobs.FINISHED_STATES
+    wait_finished(submit_job("test", lambda job: None))
+    release.set()
+    wait_finished(job)
@@ -0,0 +1,192 @@
+import time
+import asyncio
+import pytest
+import jobs
+import model_backends
+from model_backends import (Backend, call_model, acall_model, BackendUnavailable, CLOSED, OPEN, HALF_OPEN)
+
+
+class FakeClient:
+    """Stands in for a replica's OpenAI client; calls return its name, fail or stall as configured"""
+
+    def __init__(self, name, failures=0, delay=0.0):
+        self.name = name
+        self.failures = failures
+        self.delay = delay
+        self.calls = 0
+
+    def with_options(self, **options):
+        return self
+
+    def call(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError(f"{self.name} is down")
+        return self.name
+
+    async def acall(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.name
+
+
+@pytest.fixture
+def replicas(monkeypatch):
+    """Install fake replicas: replicas(a=FakeClient(...), ...) returns their Backends by name"""
+    monkeypatch.setattr(model_backends, "TRANSIENT_ERRORS", (ConnectionError,))
+    monkeypatch.setattr(model_backends, "STREAM_ERRORS", (ConnectionError,))
+    monkeypatch.setattr(model_backends, "MODEL_RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(model_backends, "MODEL_MAX_RETRIES", 2)
+    monkeypatch.setattr(model_backends, "MODEL_HEDGE_DELAY", 0)
+    monkeypatch.setattr(model_backends, "MODEL_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(model_backends, "MODEL_BREAKER_COOLDOWN", 0.1)
+
+    def install(**clients):
+        backends = {}
+        for name, client in clients.items():
+            backend = Backend(f"http://{name}/v1")
+            backend._client = client
+            backend._async_client = client
+            backends[name] = backend
+        monkeypatch.setattr(model_backends, "_backends", list(backends.values()))
+        return backends
+
+    return install
+
+
+def call(**options):
+    return call_model(lambda client: client.call(), **options)
+
+
+def test_breaker_opens_after_failures_and_closes_after_a_good_probe(replicas, monkeypatch):
+    monkeypatch.setattr(model_backends, "MODEL_MAX_RETRIES", 0)
+    client = FakeClient("a", failures=3)
+    backend = replicas(a=client)["a"]
+
+    for _ in range(2):
+        with pytest.raises(BackendUnavailable):
+            call()
+    assert backend.state == OPEN
+
+    # Ejected: calls are refused without reaching the replica
+    with pytest.raises(BackendUnavailable):
+        call()
+    assert client.calls == 2
+
+    # After the cooldown one probe is let through; a failed probe ejects it again
+    time.sleep(0.15)
+    assert model_backends.get_backend_health()["backends"][0]["state"] == HALF_OPEN
+    with pytest.raises(BackendUnavailable):
+        call()
+    assert backend.state == OPEN
+
+    time.sleep(0.15)
+    assert call() == "a"
+    assert backend.state == CLOSED
+    assert backend.consecutive_failures == 0
+
+
+def test_half_open_replica_allows_a_single_probe(replicas):
+    backend = replicas(a=FakeClient("a"))["a"]
+    backend.state = HALF_OPEN
+    assert model_backends._acquire() is backend
+    with pytest.raises(BackendUnavailable):
+        model_backends._acquire()
+    model_backends._report(backend, model_backends._SUCCEEDED)
+    assert backend.state == CLOSED
+
+
+def test_calls_go_to_the_replica_with_fewest_outstanding(replicas):
+    backends = replicas(a=FakeClient("a"), b=FakeClient("b"))
+    backends["a"].outstanding = 3
+    try:
+        assert [call() for _ in range(5)] == ["b"] * 5
+    finally:
+        backends["a"].outstanding = 0
+    assert backends["b"].outstanding == 0
+    assert backends["b"].requests == 5
+
+
+def test_transient_failure_is_retried_on_another_replica(replicas):
+    backends = replicas(a=FakeClient("a", failures=1), b=FakeClient("b", failures=1))
+    retries = model_backends._stats["retries"]
+
+    assert call() in ("a", "b")
+    assert model_backends._stats["retries"] == retries + 2
+    assert backends["a"].failures == 1
+    assert backends["b"].failures == 1
+
+
+def test_call_gives_up_after_the_last_retry(replicas, monkeypatch):
+    monkeypatch.setattr(model_backends, "MODEL_BREAKER_FAILURES", 10)
+    client = FakeClient("a", failures=10)
+    replicas(a=client)
+    with pytest.raises(BackendUnavailable) as error:
+        call()
+    assert error.value.status_code == 503
+    assert client.calls == model_backends.MODEL_MAX_RETRIES + 1
+
+
+def test_backoff_grows_is_capped_and_stops_at_the_deadline(monkeypatch):
+    monkeypatch.setattr(model_backends, "MODEL_RETRY_BACKOFF", 1)
+    monkeypatch.setattr(model_backends, "MODEL_RETRY_BACKOFF_MAX", 4)
+    far = time.monotonic() + 100
+    assert all(0 <= model_backends._backoff(0, far) <= 1 for _ in range(50))
+    assert all(0 <= model_backends._backoff(6, far) <= 4 for _ in range(50))
+    assert model_backends._backoff(6, time.monotonic() + 0.05) <= 0.05
+    assert model_backends._backoff(6, time.monotonic() - 1) == 0
+
+
+def test_hedged_call_returns_the_faster_replica(replicas, monkeypatch):
+    monkeypatch.setattr(model_backends, "MODEL_HEDGE_DELAY", 0.05)
+    backends = replicas(slow=FakeClient("slow", delay=0.5), fast=FakeClient("fast"))
+    # The lower average latency makes the slow replica the primary
+    backends["slow"].latency = 0.001
+    backends["fast"].latency = 0.002
+    hedge_wins = model_backends._stats["hedge_wins"]
+
+    assert call(hedge=True) == "fast"
+    assert model_backends._stats["hedge_wins"] == hedge_wins + 1
+    # The slower leg finishes in the background and then releases its replica
+    deadline = time.monotonic() + 2
+    while backends["slow"].outstanding and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert backends["slow"].outstanding == 0
+
+
+def test_async_hedge_cancels_the_slower_leg(replicas, monkeypatch):
+    monkeypatch.setattr(model_backends, "MODEL_HEDGE_DELAY", 0.05)
+    backends = replicas(slow=FakeClient("slow", delay=30), fast=FakeClient("fast"))
+    backends["slow"].latency = 0.001
+    backends["fast"].latency = 0.002
+
+    async def hedged():
+        result = await acall_model(lambda client: client.acall(), hedge=True)
+        # Let the cancelled leg unwind
+        await asyncio.sleep(0.01)
+        return result
+
+    started = time.monotonic()
+    assert asyncio.run(hedged()) == "fast"
+    assert time.monotonic() - started < 5
+    slow = backends["slow"]
+    assert slow.outstanding == 0
+    # An abandoned call says nothing about the replica's health
+    assert slow.state == CLOSED
+    assert slow.failures == 0
+
+
+def test_cancelled_job_makes_no_model_call(replicas):
+    client = FakeClient("a")
+    replicas(a=client)
+    job = jobs.Job("test")
+    job.cancel_requested = True
+    token = jobs._current_job.set(job)
+    try:
+        with pytest.raises(jobs.JobCancelled):
+            call()
+    finally:
+        jobs._current_job.reset(token)
+    assert client.calls == 0
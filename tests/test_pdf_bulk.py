@@ -0,0 +1,65 @@
+import json
+import pytest
+import pdf_bulk
+from benchmarks.run_benchmarks import make_pdf
+
+
+@pytest.fixture
+def pdf_dir(tmp_path):
+    folder = tmp_path / "records"
+    (folder / "nested").mkdir(parents=True)
+    (folder / "a.pdf").write_bytes(make_pdf(2, "a"))
+    (folder / "nested" / "b.PDF").write_bytes(make_pdf(3, "b"))
+    (folder / "broken.pdf").write_bytes(b"not a pdf")
+    (folder / "notes.txt").write_text("ignored")
+    return folder
+
+
+def run(pdf_dir, output, **options):
+    return pdf_bulk.run([str(pdf_dir)], str(output), workers=1, progress_interval=0, **options)
+
+
+def read(output):
+    return [json.loads(line) for line in output.read_text().splitlines()]
+
+
+def test_documents_and_errors_are_written(pdf_dir, tmp_path):
+    output = tmp_path / "out.jsonl"
+    counts = run(pdf_dir, output)
+    assert counts == {"documents": 2, "pages": 5, "skipped": 0, "failed": 1}
+
+    records = {record["path"].rsplit("/", 1)[-1]: record for record in read(output)}
+    assert set(records) == {"a.pdf", "b.PDF", "broken.pdf"}
+    assert records["a.pdf"]["pages"] == 2
+    assert "Record a page 2" in records["a.pdf"]["text"]
+    assert records["broken.pdf"]["type"] == "error"
+
+
+def test_resume_skips_done_documents_and_retries_failed_files(pdf_dir, tmp_path):
+    output = tmp_path / "out.jsonl"
+    run(pdf_dir, output)
+    counts = run(pdf_dir, output)
+    assert counts == {"documents": 0, "pages": 0, "skipped": 2, "failed": 1}
+    assert [record["type"] for record in read(output)].count("error") == 2
+
+    # Once the file can be read, the retry succeeds
+    (pdf_dir / "broken.pdf").write_bytes(make_pdf(1, "fixed"))
+    counts = run(pdf_dir, output)
+    assert counts == {"documents": 1, "pages": 1, "skipped": 2, "failed": 0}
+
+
+def test_half_written_document_is_extracted_again(pdf_dir, tmp_path):
+    (pdf_dir / "broken.pdf").unlink()
+    output = tmp_path / "out.jsonl"
+    run(pdf_dir, output, per_page=True)
+    lines = output.read_bytes().splitlines(keepends=True)
+    assert len(lines) == 2 + 5
+    # Interrupted after the first page line of the last document
+    last_document = max(i for i, line in enumerate(lines) if json.loads(line)["type"] == "document")
+    output.write_bytes(b"".join(lines[:last_document + 2]))
+
+    assert len(pdf_bulk.load_done_hashes(str(output))) == 1
+    assert len(output.read_bytes().splitlines()) == last_document
+    counts = run(pdf_dir, output, per_page=True)
+    assert counts["documents"] == 1 and counts["skipped"] == 1
+    assert len(read(output)) == 2 + 5
@@ -0,0 +1,94 @@
+import os
+import time
+import pytest
+import response_cache
+from response_cache import cache_key, get_cached_response, store_cached_response, get_cache_stats
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_DIR", "")
+    monkeypatch.setattr(response_cache, "_disk_writes", 0)
+    response_cache.clear_response_cache()
+    yield
+    response_cache.clear_response_cache()
+
+
+@pytest.fixture
+def disk_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def key(n):
+    return cache_key("qwen2.5", "system", f"question {n}")
+
+
+def store(n):
+    store_cached_response(key(n), f"answer {n}", 10, 20)
+
+
+def test_key_depends_on_model_prompt_and_input():
+    assert cache_key("a", "s", "u") == cache_key("a", "s", "u")
+    assert len({cache_key("a", "s", "u"), cache_key("b", "s", "u"), cache_key("a", "t", "u"),
+                cache_key("a", "s", "v")}) == 4
+
+
+def test_stored_response_is_returned_until_it_expires(monkeypatch):
+    assert get_cached_response(key(1)) is None
+    store(1)
+    entry = get_cached_response(key(1))
+    assert (entry["content"], entry["input_tokens"], entry["output_tokens"]) == ("answer 1", 10, 20)
+
+    now = time.time()
+    monkeypatch.setattr(response_cache.time, "time", lambda: now + response_cache.RESPONSE_CACHE_TTL + 1)
+    assert get_cached_response(key(1)) is None
+    stats = get_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"]) == (1, 2, 1)
+
+
+def test_least_recently_used_entries_are_evicted(monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_MAX_ENTRIES", 2)
+    store(1)
+    store(2)
+    get_cached_response(key(1))
+    store(3)
+    assert get_cached_response(key(2)) is None
+    assert get_cached_response(key(1)) is not None
+    assert get_cached_response(key(3)) is not None
+    assert get_cache_stats()["evictions"] == 1
+
+
+def test_empty_responses_are_not_cached():
+    store_cached_response(key(1), "", 10, 0)
+    assert get_cached_response(key(1)) is None
+
+
+def test_disk_store_serves_entries_missing_from_memory(disk_store):
+    store(1)
+    with response_cache._cache_lock:
+        response_cache._cache.clear()
+    assert get_cached_response(key(1))["content"] == "answer 1"
+    assert get_cache_stats()["disk_hits"] == 1
+
+
+def test_disk_store_prunes_least_recently_used_files(disk_store, monkeypatch):
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE_MAX_DISK_ENTRIES", 3)
+    for n in range(6):
+        store(n)
+        # Modification times must differ for the least recently used to be known
+        past = time.time() - 60 + n
+        os.utime(disk_store / f"{key(n)}.json", (past, past))
+
+    assert sorted(os.listdir(disk_store)) == sorted(f"{key(n)}.json" for n in (3, 4, 5))
+    assert get_cache_stats()["disk_evictions"] == 3
+
+
+def test_disk_sweep_removes_expired_files(disk_store):
+    store(1)
+    store(2)
+    past = time.time() - response_cache.RESPONSE_CACHE_TTL - 10
+    os.utime(disk_store / f"{key(1)}.json", (past, past))
+
+    response_cache._sweep_disk()
+    assert os.listdir(disk_store) == [f"{key(2)}.json"]
@@ -0,0 +1,66 @@
+import pytest
+import retrieval
+from retrieval import split_passages, index_document, retrieve_passages, remove_index, DocumentIndex
+from medical_docs import build_medical_input, DocumentNotFound
+
+LAB_TABLE = """Lab Results
+
+| Test | Result | Range |
+| Hemoglobin | 13.5 g/dL | 12-16 |
+| Glucose | 180 mg/dL | 70-99 |"""
+
+
+def filler(topic, sentences):
+    return " ".join(f"The {topic} was discussed at visit number {i}." for i in range(sentences))
+
+
+def test_passages_keep_line_breaks_and_paragraphs():
+    assert split_passages(LAB_TABLE, max_tokens=200) == [LAB_TABLE]
+    passages = split_passages(LAB_TABLE, max_tokens=12)
+    assert len(passages) > 1
+    # Rows are never merged onto one line
+    assert all(line.startswith("|") for passage in passages for line in passage.split("\n")[1:] if line)
+    assert "| Glucose | 180 mg/dL | 70-99 |" in "\n".join(passages).split("\n")
+
+
+def test_long_lines_are_split_within_the_budget():
+    text = filler("diet", 60) + "\n" + " ".join(["word"] * 400)
+    passages = split_passages(text, max_tokens=50)
+    assert len(passages) > 2
+    assert all(retrieval.count_tokens_accurate(passage, model="qwen2.5") <= 100 for passage in passages)
+
+
+def test_blank_document_has_no_passages():
+    assert split_passages(" \n\n \n") == []
+
+
+def test_search_returns_the_relevant_passages_in_document_order():
+    text = "\n\n".join([filler("weather", 60), "Metformin 500 mg twice daily for type 2 diabetes.",
+                        filler("parking", 60), "Insulin was added when glucose stayed high."])
+    index = DocumentIndex("doc", text)
+    assert index.total_tokens > 500
+    selected = index.search("glucose diabetes metformin insulin", top_k=2, token_budget=500)
+    assert len(selected) == 2
+    assert "Metformin" in selected[0] and "Insulin" in selected[1]
+    # A document within the budget is sent whole
+    assert index.search("anything", token_budget=10000) == index.passages
+
+
+def test_missing_record_raises_document_not_found():
+    remove_index("missing")
+    with pytest.raises(DocumentNotFound) as error:
+        build_medical_input("What is my glucose?", "", "missing")
+    assert error.value.status_code == 404
+    # Pasted history is used when the record is gone
+    assert "pasted notes" in build_medical_input("What is my glucose?", "pasted notes", "missing")
+
+
+def test_indexed_record_supplies_the_context():
+    document_id = index_document(LAB_TABLE)
+    try:
+        assert "Glucose | 180 mg/dL" in build_medical_input("glucose", "", document_id)
+        assert retrieve_passages(document_id, "glucose")
+    finally:
+        remove_index(document_id)
+    with pytest.raises(KeyError):
+        retrieve_passages(document_id, "glucose")
@@ -0,0 +1,141 @@
+import time
+import asyncio
+import threading
+import pytest
+import jobs
+import scheduler
+from scheduler import model_slot, amodel_slot, INTERACTIVE, BULK, QueueFull, QueueTimeout
+
+
+@pytest.fixture(autouse=True)
+def one_slot(monkeypatch):
+    monkeypatch.setattr(scheduler, "LLM_MAX_IN_FLIGHT", 1)
+
+
+def class_stats(priority):
+    return dict(scheduler.get_scheduler_stats()["classes"][scheduler.PRIORITY_NAMES[priority]])
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached in time"
+        time.sleep(0.01)
+
+
+def queued(priority):
+    with scheduler._lock:
+        return scheduler._queued[priority]
+
+
+def test_interactive_waiters_are_admitted_before_bulk():
+    admitted = []
+
+    def call(name, priority):
+        with model_slot(priority):
+            admitted.append(name)
+
+    with model_slot(INTERACTIVE):
+        bulk = threading.Thread(target=call, args=("bulk", BULK))
+        bulk.start()
+        wait_until(lambda: queued(BULK) == 1)
+        interactive = threading.Thread(target=call, args=("interactive", INTERACTIVE))
+        interactive.start()
+        wait_until(lambda: queued(INTERACTIVE) == 1)
+    bulk.join()
+    interactive.join()
+
+    assert admitted == ["interactive", "bulk"]
+
+
+def test_full_queue_is_rejected_with_429(monkeypatch):
+    monkeypatch.setitem(scheduler.QUEUE_LIMITS, INTERACTIVE, 0)
+    before = class_stats(INTERACTIVE)
+    with model_slot(INTERACTIVE):
+        with pytest.raises(QueueFull) as error:
+            with model_slot(INTERACTIVE):
+                pass
+    assert error.value.status_code == 429
+    assert class_stats(INTERACTIVE)["rejected"] == before["rejected"] + 1
+
+
+def test_wait_past_the_queue_timeout_is_rejected_with_503(monkeypatch):
+    monkeypatch.setitem(scheduler.QUEUE_TIMEOUTS, INTERACTIVE, 0.05)
+    before = class_stats(INTERACTIVE)
+    with model_slot(INTERACTIVE):
+        with pytest.raises(QueueTimeout) as error:
+            with model_slot(INTERACTIVE):
+                pass
+    assert error.value.status_code == 503
+    after = class_stats(INTERACTIVE)
+    assert after["timed_out"] == before["timed_out"] + 1
+    assert after["queued"] == 0
+
+
+def test_bulk_calls_wait_longer_than_interactive_ones(monkeypatch):
+    monkeypatch.setitem(scheduler.QUEUE_TIMEOUTS, INTERACTIVE, 0.05)
+    monkeypatch.setitem(scheduler.QUEUE_TIMEOUTS, BULK, 5)
+    admitted = []
+
+    def call():
+        with model_slot(BULK):
+            admitted.append("bulk")
+
+    with model_slot(INTERACTIVE):
+        bulk = threading.Thread(target=call)
+        bulk.start()
+        # Longer than an interactive call would be allowed to wait
+        time.sleep(0.2)
+    bulk.join()
+
+    assert admitted == ["bulk"]
+    assert scheduler.LLM_QUEUE_TIMEOUT_BULK > scheduler.LLM_QUEUE_TIMEOUT
+
+
+def test_async_waiter_cancelled_while_queued_is_not_a_timeout():
+    before = class_stats(INTERACTIVE)
+
+    async def cancel_while_queued():
+        async def call():
+            async with amodel_slot(INTERACTIVE):
+                pass
+
+        task = asyncio.ensure_future(call())
+        while queued(INTERACTIVE) == 0:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    with model_slot(INTERACTIVE):
+        asyncio.run(cancel_while_queued())
+
+    after = class_stats(INTERACTIVE)
+    assert after["cancelled"] == before["cancelled"] + 1
+    assert after["timed_out"] == before["timed_out"]
+    assert after["queued"] == 0
+
+
+def test_cancelled_job_leaves_the_queue():
+    job = jobs.Job("test")
+    errors = []
+    before = class_stats(BULK)
+
+    def call():
+        jobs._current_job.set(job)
+        try:
+            with model_slot(BULK):
+                pass
+        except jobs.JobCancelled as e:
+            errors.append(e)
+
+    with model_slot(INTERACTIVE):
+        waiter = threading.Thread(target=call)
+        waiter.start()
+        wait_until(lambda: queued(BULK) == 1)
+        job.cancel_requested = True
+        waiter.join(timeout=3)
+        assert not waiter.is_alive()
+
+    assert len(errors) == 1
+    assert class_stats(BULK)["cancelled"] == before["cancelled"] + 1
@@ -0,0 +1,106 @@
+import os
+import time
+import pytest
+import usage_ledger
+from usage_ledger import record_usage, flush_ledger, get_totals, query_usage
+
+DAY = 86400
+
+
+def restart():
+    """Forget the in-memory state, as a new process would start"""
+    if usage_ledger._ledger_file is not None:
+        usage_ledger._ledger_file.close()
+    usage_ledger._loaded = False
+    usage_ledger._buffer = []
+    usage_ledger._totals = None
+    usage_ledger._buckets = {}
+    usage_ledger._ledger_file = None
+    usage_ledger._ledger_name = None
+    usage_ledger._rollups_stale = False
+    usage_ledger._last_rollup_save = 0.0
+
+
+@pytest.fixture(autouse=True)
+def ledger(tmp_path, monkeypatch):
+    monkeypatch.setattr(usage_ledger, "USAGE_LEDGER_DIR", str(tmp_path))
+    monkeypatch.setattr(usage_ledger, "LEGACY_COST_LOG_FILE", str(tmp_path / "cost_log.json"))
+    # Tests flush explicitly instead of leaving it to the background writer
+    monkeypatch.setattr(usage_ledger, "_writer_thread", object())
+    restart()
+    yield tmp_path
+    restart()
+
+
+def record(endpoint="chat", cached=False):
+    return record_usage(endpoint, "qwen2.5", 100, 50, 0.2, cached, 0.01, {"gpt-5": 0.1})
+
+
+def test_ledger_rotates_and_keeps_at_most_max_files(ledger, monkeypatch):
+    monkeypatch.setattr(usage_ledger, "USAGE_LEDGER_MAX_BYTES", 200)
+    monkeypatch.setattr(usage_ledger, "USAGE_LEDGER_MAX_FILES", 3)
+    seen = set()
+    for _ in range(8):
+        record()
+        flush_ledger()
+        files = usage_ledger._ledger_files()
+        assert len(files) <= 3
+        # The file being appended to is never the one deleted
+        assert usage_ledger._ledger_name in files
+        seen.update(files)
+
+    assert len(seen) == 8
+    # Deleted files no longer count, but their entries stay in the totals and rollups
+    assert get_totals()["total_requests"] == 8
+    assert query_usage(DAY)["totals"]["requests"] == 8
+
+
+def test_restart_replays_only_entries_after_the_snapshot(ledger):
+    for _ in range(3):
+        record()
+    flush_ledger(save_rollups=True)
+    record()
+    record(cached=True)
+    # Written to the ledger but newer than the snapshot, which is not due yet
+    flush_ledger()
+
+    restart()
+    totals = get_totals()
+    assert totals["total_requests"] == 4
+    assert totals["total_tokens"] == 4 * 150
+    usage = query_usage(DAY)["totals"]
+    assert usage["requests"] == 5
+    assert usage["cached_requests"] == 1
+
+
+def test_restart_ignores_a_partly_written_entry(ledger):
+    record()
+    flush_ledger()
+    with open(os.path.join(ledger, usage_ledger._ledger_name), "ab") as f:
+        f.write(b'{"ts": 1, "endpoint": "chat"')
+
+    restart()
+    assert get_totals()["total_requests"] == 1
+
+
+def test_buckets_older_than_the_retention_window_are_dropped(ledger, monkeypatch):
+    old = {"ts": time.time() - 3 * DAY, "time": "", "endpoint": "chat", "cached": False, "input_tokens": 10,
+           "output_tokens": 5, "cost": 0.01, "commercial_costs": {}, "latency_ms": 100}
+    record()
+    with usage_ledger._lock:
+        usage_ledger._apply(old)
+    assert len(usage_ledger._buckets) == 2
+
+    monkeypatch.setattr(usage_ledger, "USAGE_ROLLUP_RETENTION_DAYS", 1)
+    # A new bucket prunes the buckets that fell out of the window
+    monkeypatch.setattr(usage_ledger.time, "time", lambda: old["ts"] + 3 * DAY + usage_ledger.USAGE_ROLLUP_BUCKET_SECONDS)
+    record()
+    assert len(usage_ledger._buckets) == 2
+    assert min(usage_ledger._buckets) > old["ts"]
+    assert get_totals()["total_requests"] == 3
+
+    # Entries older than the window still count towards the totals, without a bucket
+    with usage_ledger._lock:
+        usage_ledger._apply(dict(old))
+    assert len(usage_ledger._buckets) == 2
+    assert get_totals()["total_requests"] == 4
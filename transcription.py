@@ -0,0 +1,172 @@
+import os
+import re
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from audio_processing import segment_audio
+from model_backends import call_model, acall_model, MODEL_TRANSCRIPTION_TIMEOUT
+from metrics import stage
+from jobs import JobCancelled
+
+# Recordings are split at pauses into segments of at most this many seconds; 0 sends them whole
+TRANSCRIBE_SEGMENT_SECONDS = float(os.environ.get("TRANSCRIBE_SEGMENT_SECONDS", 60))
+
+# Seconds of audio repeated at the start of each segment, so words at a split are not lost
+TRANSCRIBE_SEGMENT_OVERLAP_SECONDS = float(os.environ.get("TRANSCRIBE_SEGMENT_OVERLAP_SECONDS", 1.0))
+
+# Maximum number of segments transcribed concurrently per recording
+TRANSCRIBE_MAX_WORKERS = int(os.environ.get("TRANSCRIBE_MAX_WORKERS", 4))
+
+# Further attempts for segments whose transcription failed; other segments are not redone
+TRANSCRIBE_SEGMENT_RETRIES = int(os.environ.get("TRANSCRIBE_SEGMENT_RETRIES", 2))
+
+# Longest run of words at a segment boundary checked for duplication
+MAX_OVERLAP_WORDS = 30
+
+_PUNCTUATION_PATTERN = re.compile(r"[^\w']+")
+
+def _normalize_word(word):
+    return _PUNCTUATION_PATTERN.sub("", word.lower())
+
+def merge_transcripts(texts):
+    """
+    Join consecutive segment transcripts into one
+
+    Segments overlap, so the start of each transcript may repeat the end of
+    the previous one. The longest run of words (ignoring case and
+    punctuation) that ends one transcript and starts the next is kept once.
+    """
+    words = []
+    for text in texts:
+        next_words = text.split()
+        limit = min(MAX_OVERLAP_WORDS, len(words), len(next_words))
+        tail = [_normalize_word(word) for word in words[len(words) - limit:]]
+        head = [_normalize_word(word) for word in next_words[:limit]]
+        overlap = next((k for k in range(limit, 0, -1) if tail[limit - k:] == head[:k]), 0)
+        # Keep the later segment's copy, which heard the words with their following context
+        del words[len(words) - overlap:]
+        words.extend(next_words)
+    return " ".join(words)
+
+def _transcript_text(transcript):
+    return transcript.text if hasattr(transcript, 'text') else str(transcript)
+
+def _transcribe_segment(segment):
+    with stage("transcription_segment"):
+        return _transcript_text(call_model(lambda client: client.audio.transcriptions.create(
+            model="whisper",
+            file=(segment["filename"], segment["audio"])
+        ), timeout=MODEL_TRANSCRIPTION_TIMEOUT))
+
+def _build_result(segments, texts, audio_info):
+    return {
+        'transcript': merge_transcripts(texts),
+        'segments': [{'start': segment['start'], 'end': segment['end'], 'text': text}
+                     for segment, text in zip(segments, texts)],
+        'audio': audio_info
+    }
+
+def _segment_failure(failed, segments, errors):
+    return Exception(f"Speech recognition failed for {len(failed)} of {len(segments)} segments: {errors[failed[0]]}")
+
+def transcribe_audio(audio_bytes, filename, on_progress=None):
+    """
+    Transcribe a recording with Whisper, split into segments transcribed concurrently
+
+    Segments that fail are retried up to TRANSCRIBE_SEGMENT_RETRIES times
+    without redoing the others.
+
+    Args:
+        audio_bytes: Recording
+        filename: Recording filename
+        on_progress: Optional callback(completed, total) called as segments finish
+
+    Returns:
+        dict: 'transcript' (merged text), 'segments' (start and end in seconds
+              of the recording and text of each segment) and 'audio'
+              (durations and sizes before and after preprocessing)
+    """
+    with stage("audio_preprocess"):
+        segments, audio_info = segment_audio(audio_bytes, filename, TRANSCRIBE_SEGMENT_SECONDS,
+                                             TRANSCRIBE_SEGMENT_OVERLAP_SECONDS)
+
+    texts = [None] * len(segments)
+    errors = {}
+    pending = list(range(len(segments)))
+    completed = 0
+    workers = max(1, min(TRANSCRIBE_MAX_WORKERS, len(segments)))
+    with stage("transcription"), ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcribe-segment") as executor:
+        for attempt in range(TRANSCRIBE_SEGMENT_RETRIES + 1):
+            # Run each segment in a copy of the caller's context so its metrics are labelled with the endpoint
+            futures = {executor.submit(contextvars.copy_context().run, _transcribe_segment, segments[i]): i for i in pending}
+            pending = []
+            try:
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        texts[i] = future.result()
+                    except JobCancelled:
+                        # The job this recording belongs to was cancelled, so there is nothing to retry
+                        raise
+                    except Exception as e:
+                        errors[i] = e
+                        pending.append(i)
+                        continue
+                    completed += 1
+                    if on_progress is not None:
+                        on_progress(completed, len(segments))
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+            if not pending:
+                break
+            pending.sort()
+            if attempt < TRANSCRIBE_SEGMENT_RETRIES:
+                print(f"Error transcribing {len(pending)} audio segments, retrying: {errors[pending[0]]}")
+
+    if pending:
+        raise _segment_failure(pending, segments, errors)
+    return _build_result(segments, texts, audio_info)
+
+async def atranscribe_audio(audio_bytes, filename):
+    """Asyncio variant of transcribe_audio, bounded by TRANSCRIBE_MAX_WORKERS"""
+    # Preprocessing is CPU-bound, so it runs off the event loop
+    with stage("audio_preprocess"):
+        segments, audio_info = await asyncio.to_thread(segment_audio, audio_bytes, filename, TRANSCRIBE_SEGMENT_SECONDS,
+                                                       TRANSCRIBE_SEGMENT_OVERLAP_SECONDS)
+
+    semaphore = asyncio.Semaphore(max(1, TRANSCRIBE_MAX_WORKERS))
+
+    async def transcribe(segment):
+        async with semaphore:
+            with stage("transcription_segment"):
+                return _transcript_text(await acall_model(lambda client: client.audio.transcriptions.create(
+                    model="whisper",
+                    file=(segment["filename"], segment["audio"])
+                ), timeout=MODEL_TRANSCRIPTION_TIMEOUT))
+
+    texts = [None] * len(segments)
+    errors = {}
+    pending = list(range(len(segments)))
+    with stage("transcription"):
+        for attempt in range(TRANSCRIBE_SEGMENT_RETRIES + 1):
+            results = await asyncio.gather(*(transcribe(segments[i]) for i in pending), return_exceptions=True)
+            failed = []
+            for i, result in zip(pending, results):
+                if isinstance(result, Exception):
+                    errors[i] = result
+                    failed.append(i)
+                elif isinstance(result, BaseException):
+                    raise result
+                else:
+                    texts[i] = result
+            pending = failed
+            if not pending:
+                break
+            if attempt < TRANSCRIBE_SEGMENT_RETRIES:
+                print(f"Error transcribing {len(pending)} audio segments, retrying: {errors[pending[0]]}")
+
+    if pending:
+        raise _segment_failure(pending, segments, errors)
+    return _build_result(segments, texts, audio_info)
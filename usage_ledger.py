@@ -0,0 +1,475 @@
+import os
+import json
+import copy
+import time
+import uuid
+import atexit
+import tempfile
+import threading
+from datetime import datetime
+
+from metrics import LATENCY_BUCKETS
+
+# Directory holding the append-only ledger files and the rollup snapshot
+USAGE_LEDGER_DIR = os.environ.get("USAGE_LEDGER_DIR", "usage_ledger")
+
+# A new ledger file is started once the current one reaches this size
+USAGE_LEDGER_MAX_BYTES = int(os.environ.get("USAGE_LEDGER_MAX_BYTES", 16 * 1024 * 1024))
+
+# Ledger files kept on disk; older ones are deleted (their rollups are kept)
+USAGE_LEDGER_MAX_FILES = int(os.environ.get("USAGE_LEDGER_MAX_FILES", 20))
+
+# Seconds between background writes of buffered entries
+USAGE_LEDGER_FLUSH_INTERVAL = float(os.environ.get("USAGE_LEDGER_FLUSH_INTERVAL", 1.0))
+
+# Buffered entries that trigger a write before the interval elapses
+USAGE_LEDGER_BATCH_SIZE = int(os.environ.get("USAGE_LEDGER_BATCH_SIZE", 256))
+
+# Seconds between saves of the rollup snapshot; entries written since are replayed on startup
+USAGE_ROLLUP_SAVE_INTERVAL = float(os.environ.get("USAGE_ROLLUP_SAVE_INTERVAL", 30.0))
+
+# Width of each rollup time bucket in seconds, and how long rollups are kept
+USAGE_ROLLUP_BUCKET_SECONDS = int(os.environ.get("USAGE_ROLLUP_BUCKET_SECONDS", 3600))
+USAGE_ROLLUP_RETENTION_DAYS = int(os.environ.get("USAGE_ROLLUP_RETENTION_DAYS", 90))
+
+# Running totals from before the ledger existed, carried over once as a baseline
+LEGACY_COST_LOG_FILE = "cost_log.json"
+
+ROLLUP_FILE = "rollups.json"
+LEDGER_PREFIX = "requests-"
+LEDGER_SUFFIX = ".jsonl"
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_loaded = False
+# Entries recorded but not yet written to the ledger
+_buffer = []
+# Totals since the last reset, in the format load_cost_log has always returned
+_totals = None
+# bucket start (epoch seconds) -> endpoint -> aggregate
+_buckets = {}
+_last_rollup_save = 0.0
+# Whether entries have been written since the rollup snapshot was last saved
+_rollups_stale = False
+_writer_thread = None
+_wake = threading.Event()
+_stop = threading.Event()
+# Open ledger file being appended to, and its name
+_ledger_file = None
+_ledger_name = None
+
+def _default_totals():
+    return {
+        "total_cost": 0.0,
+        "total_tokens": 0,
+        "total_requests": 0,
+        "last_updated": datetime.now().isoformat()
+    }
+
+def _new_aggregate():
+    return {
+        "requests": 0,
+        "cached_requests": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cost": 0.0,
+        "commercial_costs": {},
+        "latency_sum": 0.0,
+        "latency_counts": [0] * (len(LATENCY_BUCKETS) + 1)
+    }
+
+def _merge_aggregate(target, source):
+    for field in ("requests", "cached_requests", "input_tokens", "output_tokens", "cost", "latency_sum"):
+        target[field] += source[field]
+    for model, cost in source["commercial_costs"].items():
+        target["commercial_costs"][model] = target["commercial_costs"].get(model, 0.0) + cost
+    target["latency_counts"] = [a + b for a, b in zip(target["latency_counts"], source["latency_counts"])]
+
+def _retention_cutoff():
+    return time.time() - USAGE_ROLLUP_RETENTION_DAYS * 86400
+
+def _prune_buckets(cutoff):
+    """Drop rollup buckets that ended before cutoff; caller holds _lock"""
+    for bucket_start in [start for start in _buckets if start + USAGE_ROLLUP_BUCKET_SECONDS <= cutoff]:
+        del _buckets[bucket_start]
+
+def _apply(entry):
+    """Fold one ledger entry into the totals and rollups; caller holds _lock"""
+    global _totals
+    kind = entry.get("type", "request")
+    if kind == "reset":
+        _totals = _default_totals()
+        _totals["last_updated"] = entry["time"]
+        return
+    if kind == "baseline":
+        for field in ("total_cost", "total_tokens", "total_requests"):
+            _totals[field] += entry[field]
+        _totals["last_updated"] = entry["time"]
+        return
+
+    cached = entry["cached"]
+    if not cached:
+        # Cached responses did not use the model and are not added to the totals
+        _totals["total_cost"] += entry["cost"]
+        _totals["total_tokens"] += entry["input_tokens"] + entry["output_tokens"]
+        _totals["total_requests"] += 1
+        _totals["last_updated"] = entry["time"]
+
+    bucket_start = int(entry["ts"] // USAGE_ROLLUP_BUCKET_SECONDS * USAGE_ROLLUP_BUCKET_SECONDS)
+    if bucket_start not in _buckets:
+        cutoff = _retention_cutoff()
+        if bucket_start + USAGE_ROLLUP_BUCKET_SECONDS <= cutoff:
+            # Replayed entries older than the retention window count towards the totals only
+            return
+        _prune_buckets(cutoff)
+        _buckets[bucket_start] = {}
+    aggregate = _buckets[bucket_start].get(entry["endpoint"])
+    if aggregate is None:
+        aggregate = _buckets[bucket_start][entry["endpoint"]] = _new_aggregate()
+    aggregate["requests"] += 1
+    aggregate["cached_requests"] += int(cached)
+    if not cached:
+        aggregate["input_tokens"] += entry["input_tokens"]
+        aggregate["output_tokens"] += entry["output_tokens"]
+        aggregate["cost"] += entry["cost"]
+        for model, cost in entry["commercial_costs"].items():
+            aggregate["commercial_costs"][model] = aggregate["commercial_costs"].get(model, 0.0) + cost
+    latency = entry["latency_ms"] / 1000
+    aggregate["latency_sum"] += latency
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if latency <= bound:
+            aggregate["latency_counts"][i] += 1
+            break
+    else:
+        aggregate["latency_counts"][-1] += 1
+
+def _ledger_files():
+    """Ledger file names, oldest first"""
+    try:
+        names = os.listdir(USAGE_LEDGER_DIR)
+    except OSError:
+        return []
+    return sorted(name for name in names if name.startswith(LEDGER_PREFIX) and name.endswith(LEDGER_SUFFIX))
+
+def _replay(name, offset):
+    """Apply the entries in a ledger file from the given byte offset; caller holds _lock"""
+    try:
+        with open(os.path.join(USAGE_LEDGER_DIR, name), 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Partial line from a crash mid-write
+                    break
+                try:
+                    _apply(json.loads(line))
+                except (ValueError, KeyError) as e:
+                    print(f"Error replaying usage ledger entry in {name}: {e}")
+    except OSError as e:
+        print(f"Error reading usage ledger {name}: {e}")
+
+def _read_legacy_totals():
+    try:
+        if os.path.exists(LEGACY_COST_LOG_FILE):
+            with open(LEGACY_COST_LOG_FILE, 'r') as f:
+                return json.load(f)
+    except Exception as e:
+        print(f"Error loading cost log: {e}")
+    return None
+
+def _ensure_loaded():
+    """Load the rollup snapshot and replay ledger entries written after it"""
+    global _loaded, _totals, _buckets, _last_rollup_save
+    if _loaded:
+        return
+    with _lock:
+        if _loaded:
+            return
+        _totals = _default_totals()
+        position = None
+        try:
+            with open(os.path.join(USAGE_LEDGER_DIR, ROLLUP_FILE), 'r') as f:
+                snapshot = json.load(f)
+            buckets = {int(start): endpoints for start, endpoints in snapshot["buckets"].items()}
+            _totals, _buckets, position = snapshot["totals"], buckets, snapshot["position"]
+            _prune_buckets(_retention_cutoff())
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading usage rollups, rebuilding from the ledger: {e}")
+
+        files = _ledger_files()
+        if position is None:
+            for name in files:
+                _replay(name, 0)
+        else:
+            for name in files:
+                if name == position["file"]:
+                    _replay(name, position["offset"])
+                elif name > position["file"]:
+                    _replay(name, 0)
+
+        if position is None and not files:
+            legacy = _read_legacy_totals()
+            if legacy and legacy.get("total_requests"):
+                _buffer.append({
+                    "type": "baseline",
+                    "time": legacy.get("last_updated", datetime.now().isoformat()),
+                    "total_cost": legacy.get("total_cost", 0.0),
+                    "total_tokens": legacy.get("total_tokens", 0),
+                    "total_requests": legacy.get("total_requests", 0)
+                })
+                _apply(_buffer[-1])
+        _last_rollup_save = time.monotonic()
+        _loaded = True
+
+def _writer_loop():
+    while not _stop.is_set():
+        _wake.wait(USAGE_LEDGER_FLUSH_INTERVAL)
+        _wake.clear()
+        flush_ledger()
+
+def _ensure_writer_thread():
+    global _writer_thread
+    if _writer_thread is None:
+        with _lock:
+            if _writer_thread is None:
+                _writer_thread = threading.Thread(target=_writer_loop, name="usage-ledger-writer", daemon=True)
+                _writer_thread.start()
+
+def _open_ledger(rotate):
+    """Open the newest ledger file for appending, starting a new one if rotating or none exists"""
+    global _ledger_file, _ledger_name
+    if _ledger_file is not None:
+        _ledger_file.close()
+        _ledger_file = None
+    os.makedirs(USAGE_LEDGER_DIR, exist_ok=True)
+    files = _ledger_files()
+    if rotate or not files:
+        # Names sort in creation order, down to the microsecond; the suffix keeps files from two processes apart
+        _ledger_name = f"{LEDGER_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{uuid.uuid4().hex[:6]}{LEDGER_SUFFIX}"
+        files.append(_ledger_name)
+    else:
+        _ledger_name = files[-1]
+    _ledger_file = open(os.path.join(USAGE_LEDGER_DIR, _ledger_name), 'ab')
+    for name in files[:-USAGE_LEDGER_MAX_FILES]:
+        try:
+            os.remove(os.path.join(USAGE_LEDGER_DIR, name))
+        except OSError as e:
+            print(f"Error removing old usage ledger {name}: {e}")
+
+def _save_rollups(snapshot):
+    cutoff = _retention_cutoff()
+    snapshot["buckets"] = {str(start): endpoints for start, endpoints in snapshot["buckets"].items()
+                           if start + USAGE_ROLLUP_BUCKET_SECONDS > cutoff}
+    fd, tmp_path = tempfile.mkstemp(prefix=".rollups.", suffix=".tmp", dir=USAGE_LEDGER_DIR)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(USAGE_LEDGER_DIR, ROLLUP_FILE))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def flush_ledger(save_rollups=False):
+    """
+    Append buffered entries to the ledger, rotating it by size, and save the
+    rollup snapshot when it is due
+
+    Runs on the writer thread and at exit, never on the request path. The
+    snapshot records how far into the ledger it reaches, so entries written
+    after it are replayed on the next start rather than lost.
+    """
+    global _buffer, _last_rollup_save, _rollups_stale
+    if not _loaded:
+        return
+    # Serialize flushes so batches are appended in order
+    with _flush_lock:
+        try:
+            rotate = _ledger_file is not None and _ledger_file.tell() >= USAGE_LEDGER_MAX_BYTES
+            if _ledger_file is None or rotate:
+                _open_ledger(rotate)
+                save_rollups = True
+        except OSError as e:
+            print(f"Error opening usage ledger: {e}")
+            return
+
+        with _lock:
+            batch, _buffer = _buffer, []
+            _rollups_stale = _rollups_stale or bool(batch)
+            save_rollups = save_rollups or (
+                _rollups_stale and time.monotonic() - _last_rollup_save >= USAGE_ROLLUP_SAVE_INTERVAL)
+            # Copied together with the batch so the snapshot matches the ledger position
+            snapshot = {"totals": dict(_totals), "buckets": copy.deepcopy(_buckets)} if save_rollups else None
+        if not batch and snapshot is None:
+            return
+
+        try:
+            if batch:
+                _ledger_file.write(b"".join(json.dumps(entry).encode() + b"\n" for entry in batch))
+                _ledger_file.flush()
+            if snapshot is not None:
+                snapshot["position"] = {"file": _ledger_name, "offset": _ledger_file.tell()}
+                _save_rollups(snapshot)
+                _last_rollup_save = time.monotonic()
+                _rollups_stale = False
+        except (OSError, ValueError) as e:
+            print(f"Error writing usage ledger: {e}")
+
+def _close():
+    _stop.set()
+    flush_ledger(save_rollups=True)
+
+atexit.register(_close)
+
+def record_usage(endpoint, model, input_tokens, output_tokens, latency, cached, cost, commercial_costs, queue_wait=0.0):
+    """
+    Add one model response to the ledger
+
+    The entry is applied to the totals and rollups immediately and written to
+    disk in the next batch.
+
+    Args:
+        endpoint: Endpoint the response was produced for
+        model: Model that produced it
+        input_tokens: Number of input tokens
+        output_tokens: Number of output tokens
+        latency: Seconds taken to produce the response
+        cached: Whether it was served from the response cache
+        cost: Local cost of the request
+        commercial_costs: Commercial-equivalent cost per commercial model
+        queue_wait: Seconds spent waiting for a model slot
+
+    Returns:
+        dict: Snapshot of the updated totals
+    """
+    _ensure_loaded()
+    now = time.time()
+    entry = {
+        "ts": round(now, 3),
+        "time": datetime.fromtimestamp(now).isoformat(),
+        "endpoint": endpoint,
+        "model": model,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "latency_ms": round(latency * 1000, 2),
+        "queue_wait_ms": round(queue_wait * 1000, 2),
+        "cached": cached,
+        "cost": cost,
+        "commercial_costs": commercial_costs
+    }
+    with _lock:
+        _apply(entry)
+        _buffer.append(entry)
+        totals = dict(_totals)
+        if len(_buffer) >= USAGE_LEDGER_BATCH_SIZE:
+            _wake.set()
+    _ensure_writer_thread()
+    return totals
+
+def get_totals():
+    """Cumulative cost totals since the last reset, derived from the ledger"""
+    _ensure_loaded()
+    with _lock:
+        return dict(_totals)
+
+def reset_totals():
+    """Start the totals again from zero; the ledger and rollups keep their history"""
+    _ensure_loaded()
+    entry = {"type": "reset", "time": datetime.now().isoformat()}
+    with _lock:
+        _apply(entry)
+        _buffer.append(entry)
+        totals = dict(_totals)
+    _ensure_writer_thread()
+    return totals
+
+def parse_duration(value):
+    """Seconds in a duration such as '90', '30m', '24h' or '7d'"""
+    value = str(value).strip().lower()
+    unit = _DURATION_UNITS.get(value[-1:])
+    number = value[:-1] if unit else value
+    seconds = float(number) * (unit or 1)
+    if not 0 < seconds < float("inf"):
+        raise ValueError(f"Duration must be positive: {value!r}")
+    return seconds
+
+def _percentile_ms(counts, fraction):
+    """Upper bound of the latency bucket holding the given fraction of requests"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = total * fraction
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS, counts):
+        cumulative += count
+        if cumulative >= rank:
+            return bound * 1000
+    return None
+
+def _summarize(aggregate):
+    requests = aggregate["requests"]
+    return {
+        "requests": requests,
+        "cached_requests": aggregate["cached_requests"],
+        "input_tokens": aggregate["input_tokens"],
+        "output_tokens": aggregate["output_tokens"],
+        "total_tokens": aggregate["input_tokens"] + aggregate["output_tokens"],
+        "cost": round(aggregate["cost"], 6),
+        "commercial_costs": {model: round(cost, 6) for model, cost in aggregate["commercial_costs"].items()},
+        "avg_latency_ms": round(aggregate["latency_sum"] * 1000 / requests, 2) if requests else None,
+        "p50_latency_ms": _percentile_ms(aggregate["latency_counts"], 0.5),
+        "p95_latency_ms": _percentile_ms(aggregate["latency_counts"], 0.95)
+    }
+
+def query_usage(window, interval=None, endpoint=None):
+    """
+    Usage over a recent window, answered from the rollups
+
+    The window is widened to whole rollup buckets, so "24h" covers the
+    current bucket and the 24 hours before it.
+
+    Args:
+        window: Seconds to look back from now
+        interval: Seconds per entry in the time series; rounded to a whole
+                  number of rollup buckets (default one bucket)
+        endpoint: Only include this endpoint
+
+    Returns:
+        dict: Totals for the window, totals per endpoint, and a time series
+              with one entry per interval that saw traffic. Latency
+              percentiles are histogram bucket upper bounds.
+    """
+    _ensure_loaded()
+    now = time.time()
+    bucket_seconds = USAGE_ROLLUP_BUCKET_SECONDS
+    interval = max(1, round((interval or bucket_seconds) / bucket_seconds)) * bucket_seconds
+    start = int((now - window) // bucket_seconds * bucket_seconds)
+
+    total = _new_aggregate()
+    by_endpoint = {}
+    series = {}
+    with _lock:
+        for bucket_start, endpoints in _buckets.items():
+            if bucket_start < start:
+                continue
+            slot = series.setdefault(start + (bucket_start - start) // interval * interval, _new_aggregate())
+            for name, aggregate in endpoints.items():
+                if endpoint is not None and name != endpoint:
+                    continue
+                _merge_aggregate(total, aggregate)
+                _merge_aggregate(by_endpoint.setdefault(name, _new_aggregate()), aggregate)
+                _merge_aggregate(slot, aggregate)
+
+    return {
+        "start": datetime.fromtimestamp(start).isoformat(),
+        "end": datetime.fromtimestamp(now).isoformat(),
+        "interval_seconds": interval,
+        "totals": _summarize(total),
+        "by_endpoint": {name: _summarize(aggregate) for name, aggregate in sorted(by_endpoint.items())},
+        "series": [dict(start=datetime.fromtimestamp(slot_start).isoformat(), **_summarize(aggregate))
+                   for slot_start, aggregate in sorted(series.items()) if aggregate["requests"]]
+    }